@@ -0,0 +1,105 @@
+"""
+Answer Cache
+Reuses the final answer for a question that resolved to the same tool calls over the same data
+"""
+
+import os
+import re
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ttl_cache import TTLCache
+
+
+# Presentation instructions and numbers change the answer without necessarily changing the tool
+# calls ("as a table", "in German", "only the top 3"), so they are part of the key
+STYLE_WORDS = re.compile(
+    r"\b(tables?|tabular|charts?|graphs?|bullets?|bullet points|json|csv|markdown|brief(ly)?|short|concise|"
+    r"one (line|sentence|paragraph)|summar(y|ise|ize)|detail(s|ed)?|explain\w*|simple|simply|eli5|executive|"
+    r"technical|translate\w*|english|german|french|spanish|italian|portuguese|dutch|polish|japanese|chinese|"
+    r"korean|hindi|arabic|only|just|\d+(\.\d+)?)\b",
+    re.I
+)
+
+
+def question_style(question: str) -> str:
+    """The presentation instructions and numbers in a question, normalized"""
+    return " ".join(sorted({match.group(0).lower() for match in STYLE_WORDS.finditer(question or "")}))
+
+
+def canonical_arguments(arguments_json: Optional[str]) -> str:
+    """Tool-call arguments as sorted-key JSON, with strings stripped and empty values dropped"""
+    try:
+        arguments = json.loads(arguments_json or "{}")
+    except json.JSONDecodeError:
+        return arguments_json or ""
+    if not isinstance(arguments, dict):
+        return json.dumps(arguments, sort_keys=True)
+    normalized = {
+        key: value.strip() if isinstance(value, str) else value
+        for key, value in arguments.items()
+        if value not in (None, "")
+    }
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class AnswerCache:
+    def __init__(self):
+        """Initialize from ANSWER_CACHE_* environment settings"""
+        self.enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        # Expire with the cost query cache: an answer never outlives the data it was written from
+        self.cache = TTLCache(
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", os.getenv("COST_CACHE_TTL_SECONDS", "3600"))),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+            max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        )
+
+    def key(self, tool_calls: Sequence[Any], results: Sequence[Any], contents: Sequence[str],
+            question: str = "", data_version: Any = None) -> Optional[str]:
+        """
+        Key for a turn whose first completion made these tool calls with these results
+
+        The intent is the set of (tool name, canonical arguments) pairs, independent of
+        the order the model listed them in, plus the question's presentation instructions
+        (see question_style); the data version is a digest of the tool results the model
+        saw together with the caller's snapshot version. Returns None when the turn should
+        not be cached (a tool failed).
+
+        Args:
+            tool_calls: Tool calls from the first completion
+            results: Tool results, one per call
+            contents: Shaped tool results as sent to the model, one per call
+            question: The user's message
+            data_version: Version of the data behind the tools (e.g. the inventory snapshot's)
+        """
+        if not self.enabled or not tool_calls:
+            return None
+
+        pairs: List[Tuple[str, str, str]] = []
+        for tool_call, result, content in zip(tool_calls, results, contents):
+            if content is None or (isinstance(result, dict) and "error" in result):
+                return None
+            pairs.append((
+                tool_call.function.name,
+                canonical_arguments(tool_call.function.arguments),
+                hashlib.sha256(content.encode("utf-8")).hexdigest()
+            ))
+        key = [sorted(pairs), question_style(question), data_version]
+        return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """Stored answer for a key, if still fresh"""
+        if key is None:
+            return None
+        return self.cache.get(key)
+
+    def set(self, key: Optional[str], answer: Optional[str]) -> None:
+        """Store the final answer for a key"""
+        if key is None or not answer:
+            return
+        self.cache.set(key, answer, size=len(answer.encode("utf-8")))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        return {"enabled": self.enabled, **self.cache.stats()}
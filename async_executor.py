@@ -0,0 +1,54 @@
+"""
+Async Execution Layer
+Runs blocking Azure SDK calls on a bounded thread pool so they never stall the event loop
+"""
+
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared executor used for blocking Azure SDK calls"""
+    global _executor
+    if _executor is None:
+        max_workers = int(os.getenv("AZURE_EXECUTOR_MAX_WORKERS", "32"))
+        _executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="azure-sdk"
+        )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable on the shared executor and await its result
+
+    The callable runs in a copy of the caller's context, so tracing spans and the
+    throttling priority carry over to the worker thread (as with asyncio.to_thread).
+
+    Args:
+        func: Synchronous callable (typically an Azure manager method)
+        *args: Positional arguments for the callable
+        **kwargs: Keyword arguments for the callable
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def shutdown_executor() -> None:
+    """Release the executor threads (called on application shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
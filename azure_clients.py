@@ -0,0 +1,187 @@
+"""
+Shared Azure Credential and HTTP Transport
+One token cache with proactive refresh, and pooled keep-alive connections shared by every client
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from azure.core.credentials import AccessToken
+
+# HTTP stacks and the credential chain are imported on first use to keep startup fast
+if TYPE_CHECKING:
+    import httpx
+    from azure.core.pipeline.transport import RequestsTransport
+
+
+logger = logging.getLogger(__name__)
+
+MANAGEMENT_SCOPE = "https://management.azure.com/.default"
+
+
+class CachedTokenCredential:
+    def __init__(self, credential: Any, refresh_margin_seconds: float):
+        """
+        Wrap a token credential with a shared token cache
+
+        Tokens are reused until they are within the refresh margin of expiry; inside
+        the margin the cached token is still returned while a background refresh
+        fetches its successor, so callers never wait on a token that is merely old.
+
+        Args:
+            credential: Underlying azure-identity credential
+            refresh_margin_seconds: How long before expiry a token is refreshed
+        """
+        self.credential = credential
+        self.refresh_margin = refresh_margin_seconds
+        self._tokens: Dict[Tuple[str, ...], AccessToken] = {}
+        self._refreshing: Dict[Tuple[str, ...], threading.Thread] = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        """Return a cached token for the scopes, fetching or refreshing it as needed"""
+        # Claims challenges and tenant overrides bypass the cache
+        if kwargs.get("claims") or kwargs.get("tenant_id"):
+            return self.credential.get_token(*scopes, **kwargs)
+
+        key = tuple(sorted(scopes))
+        now = time.time()
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is not None and token.expires_on - now > 60:
+                self.hits += 1
+                if token.expires_on - now <= self.refresh_margin and key not in self._refreshing:
+                    thread = threading.Thread(target=self._refresh, args=(key,), name="token-refresh", daemon=True)
+                    self._refreshing[key] = thread
+                    thread.start()
+                return token
+
+        return self._refresh(key)
+
+    def prefetch(self, *scopes: str) -> None:
+        """Fetch a token ahead of the first request that needs it"""
+        self.get_token(*scopes)
+
+    def close(self) -> None:
+        """Close the underlying credential"""
+        close = getattr(self.credential, "close", None)
+        if close:
+            close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Token fetches, cache hits and seconds until each cached token expires"""
+        now = time.time()
+        with self._lock:
+            return {
+                "fetches": self.fetches,
+                "hits": self.hits,
+                "tokens": {" ".join(key): int(token.expires_on - now) for key, token in self._tokens.items()}
+            }
+
+    def _refresh(self, key: Tuple[str, ...]) -> AccessToken:
+        try:
+            started = time.perf_counter()
+            token = self.credential.get_token(*key)
+            logger.debug("Fetched token for %s in %.0f ms", " ".join(key), (time.perf_counter() - started) * 1000)
+            with self._lock:
+                self._tokens[key] = token
+                self.fetches += 1
+            return token
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+
+_credential: Optional[CachedTokenCredential] = None
+_transport: Optional["RequestsTransport"] = None
+_openai_http_client: Optional["httpx.AsyncClient"] = None
+_lock = threading.Lock()
+
+
+def get_credential() -> CachedTokenCredential:
+    """Return the process-wide credential shared by the Azure and Azure OpenAI clients"""
+    global _credential
+    with _lock:
+        if _credential is None:
+            from azure.identity import DefaultAzureCredential
+            _credential = CachedTokenCredential(
+                DefaultAzureCredential(),
+                refresh_margin_seconds=float(os.getenv("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+            )
+        return _credential
+
+
+def get_transport() -> "RequestsTransport":
+    """Return the pooled keep-alive transport shared by the Azure management clients"""
+    global _transport
+    with _lock:
+        if _transport is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from azure.core.pipeline.transport import RequestsTransport
+            pool_size = int(os.getenv("AZURE_HTTP_POOL_SIZE", "32"))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # The session outlives any one client, so clients must not close it
+            _transport = RequestsTransport(session=session, session_owner=False)
+        return _transport
+
+
+def get_openai_http_client() -> "httpx.AsyncClient":
+    """Return the pooled keep-alive HTTP client for Azure OpenAI"""
+    global _openai_http_client
+    with _lock:
+        if _openai_http_client is None:
+            import httpx
+            pool_size = int(os.getenv("OPENAI_HTTP_POOL_SIZE", "32"))
+            _openai_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=httpx.Timeout(float(os.getenv("OPENAI_HTTP_TIMEOUT_SECONDS", "120")), connect=10.0)
+            )
+        return _openai_http_client
+
+
+def install(credential: Optional[Any] = None, transport: Optional["RequestsTransport"] = None,
+            openai_http_client: Optional["httpx.AsyncClient"] = None) -> None:
+    """
+    Replace the shared credential, transport or OpenAI HTTP client
+
+    Must run before the clients are first built (e.g. by the offline replay harness).
+
+    Args:
+        credential: Token credential to wrap with the shared token cache
+        transport: Transport for the Azure management clients
+        openai_http_client: HTTP client for Azure OpenAI
+    """
+    global _credential, _transport, _openai_http_client
+    with _lock:
+        if credential is not None:
+            _credential = CachedTokenCredential(
+                credential,
+                refresh_margin_seconds=float(os.getenv("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+            )
+        if transport is not None:
+            _transport = transport
+        if openai_http_client is not None:
+            _openai_http_client = openai_http_client
+
+
+async def close_clients() -> None:
+    """Release pooled connections and the credential (called on application shutdown)"""
+    global _credential, _transport, _openai_http_client
+    with _lock:
+        credential, transport, http_client = _credential, _transport, _openai_http_client
+        _credential = _transport = _openai_http_client = None
+    if http_client is not None:
+        await http_client.aclose()
+    if transport is not None:
+        transport.session.close()
+    if credential is not None:
+        credential.close()
@@ -4,29 +4,136 @@ Handles all cost-related queries using Azure Cost Management API
 """
 
 import os
+import time
+import heapq
+import logging
+import hashlib
+import itertools
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from azure.identity import DefaultAzureCredential, ClientSecretCredential
-from azure.mgmt.costmanagement import CostManagementClient
-from azure.mgmt.costmanagement.models import QueryDefinition, QueryTimePeriod, TimeframeType, QueryDataset, QueryAggregation, QueryGrouping
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 import json
 
+from azure_clients import get_credential, get_transport
+from ttl_cache import TTLCache
+import cost_analytics
+from cost_cube import CostCube, normalize_resource_id
+from throttle import COST_MANAGEMENT, background_priority, get_scheduler
+from tool_registry import tool
+
+if TYPE_CHECKING:
+    import numpy as np
+    from azure.mgmt.costmanagement.models import QueryDefinition, QueryFilter
+
+
+logger = logging.getLogger(__name__)
+
+# Cache marker for a scope whose cube is larger than COST_CACHE_MAX_BYTES
+CUBE_TOO_LARGE = object()
+
+# Cache marker for a scope whose cube could not be fetched (kept for COST_CUBE_RETRY_SECONDS)
+CUBE_UNAVAILABLE = object()
+
+# Argument schemas shared by the cost tools
+SCOPE_PARAMETER = {
+    "type": "string",
+    "description": "Azure scope. Leave empty for subscription level."
+}
+DAYS_PARAMETER = {
+    "type": "integer",
+    "description": "Number of days to look back. Default is 30.",
+    "default": 30
+}
+GROUP_BY_PARAMETER = {
+    "type": "string",
+    "enum": ["total", "service", "resource_group"],
+    "description": "Analyze the overall total, each service, or each resource group. Default is total.",
+    "default": "total"
+}
+TOP_PARAMETER = {
+    "type": "integer",
+    "description": "Number of series (services or resource groups) to return. Default is 10.",
+    "default": 10
+}
+
+# Cost series the analytics tools can be computed over, mapped to their Cost Management grouping
+ANALYTICS_GROUPINGS = {"total": None, "service": "ServiceName", "resource_group": "ResourceGroupName"}
+
+# Cost Management queries can queue behind the per-scope rate limit
+COST_TOOL_TIMEOUT_SECONDS = float(os.getenv("COST_TOOL_TIMEOUT_SECONDS", "180"))
+
 
 class AzureCostManager:
     def __init__(self):
         """Initialize Azure Cost Management client"""
         self.subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
         
-        # Use Managed Identity if in production, otherwise use credentials
-        use_managed_identity = os.getenv("USE_MANAGED_IDENTITY", "false").lower() == "true"
+        # The SDK client (and its credential) is built on first use to keep startup fast
+        self._client = None
+        self._client_lock = threading.Lock()
         
-        if use_managed_identity:
-            self.credential = DefaultAzureCredential()
-        else:
-            self.credential = DefaultAzureCredential()
+        # Cost data only refreshes a few times a day, so identical queries are served locally
+        self.cache = TTLCache(
+            ttl_seconds=float(os.getenv("COST_CACHE_TTL_SECONDS", "3600")),
+            max_entries=int(os.getenv("COST_CACHE_MAX_ENTRIES", "256")),
+            max_bytes=int(os.getenv("COST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        )
         
-        self.client = CostManagementClient(self.credential)
+        # One daily ResourceId x ServiceName fetch serves every breakdown inside this window
+        self.cube_enabled = os.getenv("COST_CUBE_ENABLED", "true").lower() == "true"
+        self.cube_days = max(int(os.getenv("COST_CUBE_DAYS", "93")), 31)
+        # The first cost question waits for the build, so it must finish well inside the tool timeout
+        self.cube_build_seconds = float(os.getenv("COST_CUBE_BUILD_SECONDS", "60"))
+        self.cube_retry_seconds = float(os.getenv("COST_CUBE_RETRY_SECONDS", "300"))
+        self._cube_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+        self._cube_locks_lock = threading.Lock()
         
+        # Upper bound on next_link pages followed for a single query
+        self.max_query_pages = int(os.getenv("COST_QUERY_MAX_PAGES", "1000"))
+        
+        # Resource IDs per ResourceId IN-list filter
+        self.resource_filter_batch_size = int(os.getenv("COST_RESOURCE_FILTER_BATCH_SIZE", "200"))
+        
+        # Cost analytics: forecast history, anomaly baseline and sensitivity
+        self.forecast_history_days = int(os.getenv("COST_FORECAST_HISTORY_DAYS", "56"))
+        self.anomaly_baseline_days = int(os.getenv("COST_ANOMALY_BASELINE_DAYS", "28"))
+        self.anomaly_threshold = float(os.getenv("COST_ANOMALY_THRESHOLD", "3.5"))
+        self.anomaly_min_delta = float(os.getenv("COST_ANOMALY_MIN_DELTA", "1.0"))
+        
+    @property
+    def client(self):
+        """Cost Management client, built on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from azure.mgmt.costmanagement import CostManagementClient
+                    # One credential (and token cache) and one pooled transport shared with the other clients;
+                    # throttled (429/5xx) responses are retried by the throttle scheduler, not the SDK
+                    self._client = CostManagementClient(get_credential(), transport=get_transport(), retry_status=0)
+        return self._client
+    
+    def warm_up(self, days: int = 30) -> None:
+        """
+        Build the client and prefetch the default subscription's cost cube
+        
+        Runs at background priority, so it yields to interactive queries.
+        """
+        self.client
+        with background_priority():
+            start_date, end_date = self._time_window(days)
+            self._get_cube(f"/subscriptions/{self.subscription_id}", start_date, end_date)
+    
+    @tool(
+        description="Get the total Azure costs for the current month. Use this when user asks about current month costs, this month's spending, or monthly costs.",
+        parameters={
+            "scope": {
+                "type": "string",
+                "description": "Azure scope in format '/subscriptions/{id}' or '/subscriptions/{id}/resourceGroups/{name}'. Leave empty for subscription level."
+            }
+        },
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
     def get_current_month_costs(self, scope: Optional[str] = None) -> Dict[str, Any]:
         """
         Get current month's costs
@@ -39,31 +146,22 @@ class AzureCostManager:
                 scope = f"/subscriptions/{self.subscription_id}"
             
             # Define query for current month
-            now = datetime.utcnow()
-            start_date = now.replace(day=1)
-            end_date = now
-            
-            query = QueryDefinition(
-                type="Usage",
-                timeframe=TimeframeType.CUSTOM,
-                time_period=QueryTimePeriod(
-                    from_property=start_date,
-                    to=end_date
-                ),
-                dataset=QueryDataset(
-                    granularity="Daily",
-                    aggregation={
-                        "totalCost": QueryAggregation(name="Cost", function="Sum")
-                    }
-                )
-            )
+            start_date, end_date = self._month_to_date_window()
             
-            result = self.client.query.usage(scope=scope, parameters=query)
-            return self._format_cost_result(result)
+            cube = self._get_cube(scope, start_date, end_date)
+            if cube is not None:
+                rows = cube.daily_totals(start_date.date(), end_date.date())
+                return self._format_cost_result(rows)
+            return self._query_usage(scope, start_date, end_date, "Daily", self._format_cost_result)
             
         except Exception as e:
             return {"error": str(e)}
     
+    @tool(
+        description="Get Azure costs grouped by service (like Storage, Compute, Networking). Use this when user asks which service costs the most, cost breakdown by service, or service-level costs.",
+        parameters={"scope": SCOPE_PARAMETER, "days": DAYS_PARAMETER},
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
     def get_costs_by_service(self, scope: Optional[str] = None, days: int = 30) -> Dict[str, Any]:
         """
         Get costs grouped by Azure service
@@ -76,33 +174,23 @@ class AzureCostManager:
             if not scope:
                 scope = f"/subscriptions/{self.subscription_id}"
             
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=days)
-            
-            query = QueryDefinition(
-                type="Usage",
-                timeframe=TimeframeType.CUSTOM,
-                time_period=QueryTimePeriod(
-                    from_property=start_date,
-                    to=end_date
-                ),
-                dataset=QueryDataset(
-                    granularity="None",
-                    aggregation={
-                        "totalCost": QueryAggregation(name="Cost", function="Sum")
-                    },
-                    grouping=[
-                        QueryGrouping(type="Dimension", name="ServiceName")
-                    ]
-                )
-            )
+            start_date, end_date = self._time_window(days)
             
-            result = self.client.query.usage(scope=scope, parameters=query)
-            return self._format_service_cost_result(result)
+            cube = self._get_cube(scope, start_date, end_date)
+            if cube is not None:
+                rows = cube.by_service(start_date.date(), end_date.date())
+                return self._format_service_cost_result(rows)
+            return self._query_usage(scope, start_date, end_date, "None", self._format_service_cost_result,
+                                     grouping="ServiceName")
             
         except Exception as e:
             return {"error": str(e)}
     
+    @tool(
+        description="Get daily cost trends over time. Use this when user asks about spending trends, daily costs, or cost patterns over time.",
+        parameters={"scope": SCOPE_PARAMETER, "days": DAYS_PARAMETER},
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
     def get_daily_costs(self, scope: Optional[str] = None, days: int = 30) -> Dict[str, Any]:
         """
         Get daily cost trends
@@ -115,30 +203,22 @@ class AzureCostManager:
             if not scope:
                 scope = f"/subscriptions/{self.subscription_id}"
             
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=days)
-            
-            query = QueryDefinition(
-                type="Usage",
-                timeframe=TimeframeType.CUSTOM,
-                time_period=QueryTimePeriod(
-                    from_property=start_date,
-                    to=end_date
-                ),
-                dataset=QueryDataset(
-                    granularity="Daily",
-                    aggregation={
-                        "totalCost": QueryAggregation(name="Cost", function="Sum")
-                    }
-                )
-            )
+            start_date, end_date = self._time_window(days)
             
-            result = self.client.query.usage(scope=scope, parameters=query)
-            return self._format_daily_cost_result(result)
+            cube = self._get_cube(scope, start_date, end_date)
+            if cube is not None:
+                rows = cube.daily_totals(start_date.date(), end_date.date())
+                return self._format_daily_cost_result(rows)
+            return self._query_usage(scope, start_date, end_date, "Daily", self._format_daily_cost_result)
             
         except Exception as e:
             return {"error": str(e)}
     
+    @tool(
+        description="Get costs grouped by resource group. Use this when user asks about costs per resource group or which resource group costs the most.",
+        parameters={"scope": SCOPE_PARAMETER, "days": DAYS_PARAMETER},
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
     def get_costs_by_resource_group(self, scope: Optional[str] = None, days: int = 30) -> Dict[str, Any]:
         """
         Get costs grouped by resource group
@@ -151,33 +231,31 @@ class AzureCostManager:
             if not scope:
                 scope = f"/subscriptions/{self.subscription_id}"
             
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=days)
-            
-            query = QueryDefinition(
-                type="Usage",
-                timeframe=TimeframeType.CUSTOM,
-                time_period=QueryTimePeriod(
-                    from_property=start_date,
-                    to=end_date
-                ),
-                dataset=QueryDataset(
-                    granularity="None",
-                    aggregation={
-                        "totalCost": QueryAggregation(name="Cost", function="Sum")
-                    },
-                    grouping=[
-                        QueryGrouping(type="Dimension", name="ResourceGroupName")
-                    ]
-                )
-            )
+            start_date, end_date = self._time_window(days)
             
-            result = self.client.query.usage(scope=scope, parameters=query)
-            return self._format_resource_group_cost_result(result)
+            cube = self._get_cube(scope, start_date, end_date)
+            if cube is not None:
+                rows = cube.by_resource_group(start_date.date(), end_date.date())
+                return self._format_resource_group_cost_result(rows)
+            return self._query_usage(scope, start_date, end_date, "None", self._format_resource_group_cost_result,
+                                     grouping="ResourceGroupName")
             
         except Exception as e:
             return {"error": str(e)}
     
+    @tool(
+        description="Get costs for individual resources. Shows the most expensive resources. Use this when user asks about specific resource costs or which resources cost the most.",
+        parameters={
+            "scope": SCOPE_PARAMETER,
+            "days": DAYS_PARAMETER,
+            "top": {
+                "type": "integer",
+                "description": "Number of top expensive resources to return. Default is 10.",
+                "default": 10
+            }
+        },
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
     def get_resource_costs(self, scope: Optional[str] = None, days: int = 30, top: int = 10) -> Dict[str, Any]:
         """
         Get costs for individual resources (top N most expensive)
@@ -191,48 +269,469 @@ class AzureCostManager:
             if not scope:
                 scope = f"/subscriptions/{self.subscription_id}"
             
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=days)
-            
-            query = QueryDefinition(
-                type="Usage",
-                timeframe=TimeframeType.CUSTOM,
-                time_period=QueryTimePeriod(
-                    from_property=start_date,
-                    to=end_date
-                ),
-                dataset=QueryDataset(
-                    granularity="None",
-                    aggregation={
-                        "totalCost": QueryAggregation(name="Cost", function="Sum")
-                    },
-                    grouping=[
-                        QueryGrouping(type="Dimension", name="ResourceId")
-                    ]
-                )
+            start_date, end_date = self._time_window(days)
+            
+            cube = self._get_cube(scope, start_date, end_date)
+            if cube is not None:
+                rows = cube.by_resource(start_date.date(), end_date.date())
+                return self._format_resource_cost_result(rows, top)
+            return self._query_usage(scope, start_date, end_date, "None",
+                                     lambda rows: self._format_resource_cost_result(rows, top),
+                                     grouping="ResourceId", variant=f"top={top}")
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
+    @tool(
+        description="Get cost trend statistics: totals, 7-day rolling average, day-over-day and week-over-week changes, overall or per service or resource group. Use this when user asks how costs are trending, whether spending is going up or down, or for daily/weekly changes.",
+        parameters={"scope": SCOPE_PARAMETER, "days": DAYS_PARAMETER, "group_by": GROUP_BY_PARAMETER, "top": TOP_PARAMETER},
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
+    def get_cost_trends(self, scope: Optional[str] = None, days: int = 30, group_by: str = "total",
+                        top: int = 10) -> Dict[str, Any]:
+        """
+        Get rolling means and day-over-day / week-over-week changes of daily costs
+        
+        Args:
+            scope: Azure scope
+            days: Number of complete days to analyze
+            group_by: "total", "service" or "resource_group"
+            top: Number of most expensive series to return
+        """
+        try:
+            if not scope:
+                scope = f"/subscriptions/{self.subscription_id}"
+            
+            start_date, end_date = self._complete_days_window(days)
+            labels, matrix = self._daily_series(scope, group_by, start_date, end_date)
+            result = cost_analytics.trend_summary(labels, matrix, start_date.date(), top=max(top, 1))
+            return {"currency": "USD", "group_by": group_by, **result}
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
+    @tool(
+        description="Forecast costs to the end of the current month from month-to-date actuals, the recent daily run rate and weekday seasonality, with a low-high range, overall or per service or resource group. Use this when user asks what this month will cost, for a month-end projection, or whether spending is on track.",
+        parameters={"scope": SCOPE_PARAMETER, "group_by": GROUP_BY_PARAMETER, "top": TOP_PARAMETER},
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
+    def forecast_month_end(self, scope: Optional[str] = None, group_by: str = "total", top: int = 10) -> Dict[str, Any]:
+        """
+        Forecast the current month's total cost
+        
+        Actuals run through yesterday, the last complete day; today onwards is forecast.
+        
+        Args:
+            scope: Azure scope
+            group_by: "total", "service" or "resource_group"
+            top: Number of series with the highest projection to return
+        """
+        try:
+            if not scope:
+                scope = f"/subscriptions/{self.subscription_id}"
+            
+            # Enough history for the weekday profile, and always the whole month so far
+            days_into_month = datetime.utcnow().day - 1
+            start_date, end_date = self._complete_days_window(max(self.forecast_history_days, days_into_month))
+            labels, matrix = self._daily_series(scope, group_by, start_date, end_date)
+            result = cost_analytics.forecast_month_end(labels, matrix, start_date.date(), top=max(top, 1))
+            return {"currency": "USD", "group_by": group_by, **result}
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
+    @tool(
+        description="Detect cost anomalies: days where spending spiked or dropped compared with the trailing baseline (robust z-score on median absolute deviation, weekday-adjusted), overall or per service or resource group. Use this when user asks about unusual spending, cost spikes, sudden drops, or anomalies.",
+        parameters={
+            "scope": SCOPE_PARAMETER,
+            "days": {
+                "type": "integer",
+                "description": "Number of recent days to check for anomalies. Default is 14.",
+                "default": 14
+            },
+            "group_by": {
+                **GROUP_BY_PARAMETER,
+                "description": "Check the overall total, each service, or each resource group. Default is service.",
+                "default": "service"
+            },
+            "top": {
+                "type": "integer",
+                "description": "Maximum number of anomalies to return, largest first. Default is 20.",
+                "default": 20
+            }
+        },
+        timeout=COST_TOOL_TIMEOUT_SECONDS
+    )
+    def detect_cost_anomalies(self, scope: Optional[str] = None, days: int = 14, group_by: str = "service",
+                              top: int = 20) -> Dict[str, Any]:
+        """
+        Find days whose cost departs from the trailing COST_ANOMALY_BASELINE_DAYS baseline
+        
+        Args:
+            scope: Azure scope
+            days: Number of recent complete days to check
+            group_by: "total", "service" or "resource_group"
+            top: Maximum number of anomalies to return
+        """
+        try:
+            if not scope:
+                scope = f"/subscriptions/{self.subscription_id}"
+            
+            days = max(days, 1)
+            start_date, end_date = self._complete_days_window(days + self.anomaly_baseline_days)
+            labels, matrix = self._daily_series(scope, group_by, start_date, end_date)
+            result = cost_analytics.detect_anomalies(
+                labels, matrix, start_date.date(),
+                baseline_days=self.anomaly_baseline_days,
+                threshold=self.anomaly_threshold,
+                min_delta=self.anomaly_min_delta,
+                check_days=days,
+                top=max(top, 1)
             )
+            return {"currency": "USD", "group_by": group_by, **result}
             
-            result = self.client.query.usage(scope=scope, parameters=query)
-            return self._format_resource_cost_result(result, top)
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def get_costs_for_resource_ids(self, resource_ids: List[str], days: int = 30) -> Dict[str, Any]:
+        """
+        Get costs for a specific set of resources
+        
+        Answers from an already-cached cost cube when one covers the window; otherwise
+        runs ResourceId-filtered queries per subscription, batched by IN-list size, so
+        only the requested rows come back.
+        
+        Args:
+            resource_ids: ARM resource IDs (any case)
+            days: Number of days to look back
+            
+        Returns:
+            Dictionary with costs keyed by normalized (lower-case) resource ID
+        """
+        try:
+            start_date, end_date = self._time_window(days)
+            
+            by_scope: Dict[str, List[str]] = {}
+            for resource_id in {normalize_resource_id(rid) for rid in resource_ids if rid}:
+                parts = resource_id.split("/")
+                subscription = parts[2] if len(parts) > 2 and parts[1] == "subscriptions" else self.subscription_id
+                by_scope.setdefault(f"/subscriptions/{subscription}", []).append(resource_id)
+            
+            costs: Dict[str, float] = {}
+            for scope, scope_ids in by_scope.items():
+                cube = self._get_cube(scope, start_date, end_date, fetch=False)
+                if cube is not None:
+                    costs.update(cube.costs_for(scope_ids, start_date.date(), end_date.date()))
+                    continue
+                
+                scope_ids.sort()
+                size = self.resource_filter_batch_size
+                for i in range(0, len(scope_ids), size):
+                    batch_costs = self._query_usage(
+                        scope, start_date, end_date, "None", self._sum_by_resource_id,
+                        grouping="ResourceId", resource_ids=scope_ids[i:i + size]
+                    )
+                    for resource_id, cost in batch_costs.items():
+                        costs[resource_id] = costs.get(resource_id, 0.0) + cost
+            
+            return {
+                "total_cost": round(sum(costs.values()), 2),
+                "currency": "USD",
+                "period_days": days,
+                "costs": costs
+            }
             
         except Exception as e:
             return {"error": str(e)}
     
-    def _format_cost_result(self, result) -> Dict[str, Any]:
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the query result cache"""
+        return self.cache.stats()
+    
+    def _time_window(self, days: int) -> Tuple[datetime, datetime]:
+        """
+        Day-aligned look-back window ending today (UTC)
+        
+        Aligning to whole days keeps the window identical across requests made
+        on the same day, so they share one cache entry.
+        """
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_date = today - timedelta(days=days)
+        end_date = today + timedelta(days=1) - timedelta(seconds=1)
+        return start_date, end_date
+    
+    def _month_to_date_window(self) -> Tuple[datetime, datetime]:
+        """Day-aligned window from the first of the current month to the end of today (UTC)"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_date = today.replace(day=1)
+        end_date = today + timedelta(days=1) - timedelta(seconds=1)
+        return start_date, end_date
+    
+    def _complete_days_window(self, days: int) -> Tuple[datetime, datetime]:
+        """
+        Window of the last `days` complete days, ending yesterday (UTC)
+        
+        Today's costs are still being reported, so analytics leave today out.
+        """
+        start_date, end_date = self._time_window(days)
+        return start_date, end_date - timedelta(days=1)
+    
+    def _daily_series(self, scope: str, group_by: str, start_date: datetime,
+                      end_date: datetime) -> Tuple[List[str], "np.ndarray"]:
+        """
+        Dense daily cost matrix (series x days) for the window, from the cost cube when it covers it
+        
+        Args:
+            scope: Azure scope
+            group_by: "total", "service" or "resource_group"
+            start_date: First day of the window
+            end_date: Last day of the window
+        """
+        if group_by not in ANALYTICS_GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(ANALYTICS_GROUPINGS)}, got {group_by!r}")
+        
+        cube = self._get_cube(scope, start_date, end_date)
+        if cube is not None:
+            return cube.daily_series(group_by, start_date.date(), end_date.date())
+        grouping = ANALYTICS_GROUPINGS[group_by]
+        return self._query_usage(
+            scope, start_date, end_date, "Daily",
+            lambda rows: cost_analytics.series_from_rows(rows, start_date.date(), end_date.date(), grouped=grouping is not None),
+            grouping=grouping, variant="series"
+        )
+    
+    def _get_cube(self, scope: str, start_date: datetime, end_date: datetime, fetch: bool = True) -> Optional[CostCube]:
+        """
+        Get the cached cost cube for a scope if it covers the requested window
+        
+        The cube is one daily query grouped by ResourceId and ServiceName over the
+        last COST_CUBE_DAYS days; every breakdown inside that window is a local roll-up.
+        Returns None when the cube is disabled, the window falls outside it, the cube
+        is too large for the cache, or it could not be fetched within
+        COST_CUBE_BUILD_SECONDS (callers then run grouped queries instead).
+        
+        Args:
+            scope: Azure scope
+            start_date: Start of the requested window
+            end_date: End of the requested window
+            fetch: Query the API when the cube is not cached yet
+        """
+        if not self.cube_enabled:
+            return None
+        
+        cube_start, cube_end = self._time_window(self.cube_days)
+        if start_date < cube_start or end_date > cube_end:
+            return None
+        
+        cache_key = (
+            scope.rstrip("/").lower(),
+            "cube",
+            cube_start.date().isoformat(),
+            cube_end.date().isoformat()
+        )
+        cube = self.cache.get(cache_key)
+        if cube is None and fetch:
+            # One build per scope and window: concurrent cost tools wait for it instead of each
+            # fetching the whole cube (single-flight only merges identical tool calls)
+            with self._cube_lock(cache_key):
+                cube = self.cache.get(cache_key)
+                if cube is None:
+                    try:
+                        cube = self._build_cube(scope, cube_start, cube_end)
+                    except Exception as e:
+                        logger.warning(
+                            "Cost cube for %s could not be built (%s); answering with grouped queries "
+                            "for %.0fs before retrying", scope, e, self.cube_retry_seconds
+                        )
+                        self.cache.set(cache_key, CUBE_UNAVAILABLE, size=0, ttl_seconds=self.cube_retry_seconds)
+                        return None
+                    if cube.nbytes > self.cache.max_bytes:
+                        logger.warning(
+                            "Cost cube for %s (%.0f MiB) exceeds COST_CACHE_MAX_BYTES (%.0f MiB); "
+                            "answering with grouped queries until it expires",
+                            scope, cube.nbytes / 2**20, self.cache.max_bytes / 2**20
+                        )
+                        # The marker stops the next callers from refetching a cube that cannot be kept
+                        self.cache.set(cache_key, CUBE_TOO_LARGE, size=0)
+                        return cube
+                    self.cache.set(cache_key, cube, size=cube.nbytes)
+        return None if cube is CUBE_TOO_LARGE or cube is CUBE_UNAVAILABLE else cube
+    
+    def _cube_lock(self, cache_key: Tuple[str, ...]) -> threading.Lock:
+        with self._cube_locks_lock:
+            lock = self._cube_locks.get(cache_key)
+            if lock is None:
+                # Windows move once a day; drop the locks of earlier windows nobody holds
+                stale = [key for key, held in self._cube_locks.items() if key[2:] != cache_key[2:] and not held.locked()]
+                for key in stale:
+                    del self._cube_locks[key]
+                lock = self._cube_locks[cache_key] = threading.Lock()
+            return lock
+    
+    def _build_cube(self, scope: str, cube_start: datetime, cube_end: datetime) -> CostCube:
+        """Fetch the daily ResourceId x ServiceName rows for the cube window and encode them"""
+        query = self._build_query(cube_start, cube_end, "Daily", ["ResourceId", "ServiceName"])
+        pages = self._iter_query_pages(scope, query, deadline=time.monotonic() + self.cube_build_seconds)
+        columns, first_rows = next(pages, ([], []))
+        rows = itertools.chain(first_rows, (row for _, page_rows in pages for row in page_rows))
+        return CostCube.from_rows(scope, cube_start.date(), cube_end.date(), columns, rows)
+    
+    def _build_query(self, start_date: datetime, end_date: datetime, granularity: str,
+                     groupings: Optional[List[str]] = None, query_filter: Optional["QueryFilter"] = None) -> "QueryDefinition":
+        """Build a summed-cost usage query for the window"""
+        from azure.mgmt.costmanagement.models import (
+            QueryDefinition, QueryTimePeriod, TimeframeType, QueryDataset, QueryAggregation, QueryGrouping
+        )
+        
+        return QueryDefinition(
+            type="Usage",
+            timeframe=TimeframeType.CUSTOM,
+            time_period=QueryTimePeriod(
+                from_property=start_date,
+                to=end_date
+            ),
+            dataset=QueryDataset(
+                granularity=granularity,
+                aggregation={
+                    "totalCost": QueryAggregation(name="Cost", function="Sum")
+                },
+                grouping=[QueryGrouping(type="Dimension", name=name) for name in groupings] if groupings else None,
+                filter=query_filter
+            )
+        )
+    
+    def _iter_query_pages(self, scope: str, query: "QueryDefinition",
+                          deadline: Optional[float] = None) -> Iterator[Tuple[List[str], List[List[Any]]]]:
+        """
+        Yield (columns, rows) for every page of a usage query, following next_link
+        
+        Args:
+            scope: Azure scope
+            query: Query definition (re-sent with the page's $skiptoken)
+            deadline: time.monotonic() after which no further page is requested
+        
+        Raises:
+            RuntimeError: The query has more than COST_QUERY_MAX_PAGES pages
+            TimeoutError: Pages remain at the deadline
+        """
+        params: Dict[str, str] = {}
+        for _ in range(self.max_query_pages):
+            if params and deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Cost query for {scope} still had pages left at its time budget")
+            result = get_scheduler().call(
+                COST_MANAGEMENT, scope, self.client.query.usage,
+                scope=scope, parameters=query, params=params
+            )
+            if result is None:
+                return
+            columns = [column.name for column in (result.columns or [])]
+            yield columns, result.rows or []
+            
+            skip_token = self._skip_token(result.next_link)
+            if not skip_token:
+                return
+            params = {"$skiptoken": skip_token}
+        
+        # Still more pages: totals from what was read would be silently low
+        raise RuntimeError(
+            f"Cost query for {scope} returned more than COST_QUERY_MAX_PAGES ({self.max_query_pages}) pages; "
+            f"results would be incomplete. Narrow the scope or window, or raise the limit."
+        )
+    
+    def _skip_token(self, next_link: Optional[str]) -> Optional[str]:
+        """Extract the $skiptoken from a Cost Management next_link"""
+        if not next_link:
+            return None
+        query_params = parse_qs(urlparse(next_link).query)
+        values = query_params.get("$skiptoken") or query_params.get("skiptoken")
+        return values[0] if values else None
+    
+    def _query_usage(self, scope: str, start_date: datetime, end_date: datetime,
+                     granularity: str, summarize: Callable[[Iterable[List[Any]]], Any],
+                     grouping: Optional[str] = None, resource_ids: Optional[List[str]] = None,
+                     variant: str = "") -> Any:
+        """
+        Run a Cost Management usage query and reduce its rows, serving repeats from the result cache
+        
+        Pages are streamed into `summarize` as they arrive, so memory is bounded by what
+        it keeps; its result, not the rows, is cached. Error results are not cached.
+        Errors raised while fetching pages propagate to the caller even if `summarize`
+        catches them.
+        
+        Args:
+            scope: Azure scope
+            start_date: Start of the (day-aligned) window
+            end_date: End of the (day-aligned) window
+            granularity: "Daily" or "None"
+            summarize: Reduces the row stream to the cached result (e.g. a _format_* method)
+            grouping: Optional dimension to group by
+            resource_ids: Optional ResourceId filter (an IN-list)
+            variant: Distinguishes reductions sharing a name (e.g. lambdas, top N)
+        """
+        cache_key = (
+            scope.rstrip("/").lower(),
+            granularity,
+            grouping or "",
+            start_date.date().isoformat(),
+            end_date.date().isoformat(),
+            getattr(summarize, "__name__", repr(summarize)),
+            variant
+        )
+        query_filter = None
+        if resource_ids:
+            from azure.mgmt.costmanagement.models import QueryFilter, QueryComparisonExpression
+            query_filter = QueryFilter(
+                dimensions=QueryComparisonExpression(name="ResourceId", operator="In", values=resource_ids)
+            )
+            # Key on a digest of the IN-list rather than the (long) list itself
+            cache_key += (hashlib.sha1("\n".join(sorted(resource_ids)).encode("utf-8")).hexdigest(),)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        query = self._build_query(start_date, end_date, granularity, [grouping] if grouping else None, query_filter)
+        # The _format_* reducers turn any exception into a formatting error; an API failure raised
+        # while paging (throttling, truncation, transport) is re-raised so the tool reports it as such
+        failures: List[Exception] = []
+        
+        def stream_rows() -> Iterator[List[Any]]:
+            try:
+                for _, page_rows in self._iter_query_pages(scope, query):
+                    yield from page_rows
+            except Exception as e:
+                failures.append(e)
+                raise
+        
+        result = summarize(stream_rows())
+        if failures:
+            raise failures[0]
+        if not (isinstance(result, dict) and "error" in result):
+            self.cache.set(cache_key, result)
+        return result
+    
+    def _sum_by_resource_id(self, rows) -> Dict[str, float]:
+        """Cost per normalized resource ID from ResourceId-grouped rows"""
+        costs: Dict[str, float] = {}
+        for row in rows:
+            if len(row) > 1:
+                resource_id = normalize_resource_id(str(row[1]))
+                costs[resource_id] = costs.get(resource_id, 0.0) + float(row[0] or 0.0)
+        return costs
+    
+    def _format_cost_result(self, rows) -> Dict[str, Any]:
         """Format cost query result"""
         try:
             total_cost = 0.0
             daily_costs = []
             
-            if hasattr(result, 'rows') and result.rows:
-                for row in result.rows:
-                    cost = float(row[0]) if row and len(row) > 0 else 0.0
-                    total_cost += cost
-                    if len(row) > 1:
-                        daily_costs.append({
-                            "date": str(row[1]),
-                            "cost": cost
-                        })
+            for row in rows or []:
+                cost = float(row[0]) if row and len(row) > 0 else 0.0
+                total_cost += cost
+                if len(row) > 1:
+                    daily_costs.append({
+                        "date": str(row[1]),
+                        "cost": cost
+                    })
             
             return {
                 "total_cost": round(total_cost, 2),
@@ -242,21 +741,20 @@ class AzureCostManager:
         except Exception as e:
             return {"error": f"Failed to format result: {str(e)}"}
     
-    def _format_service_cost_result(self, result) -> Dict[str, Any]:
+    def _format_service_cost_result(self, rows) -> Dict[str, Any]:
         """Format service cost result"""
         try:
             services = []
             total_cost = 0.0
             
-            if hasattr(result, 'rows') and result.rows:
-                for row in result.rows:
-                    cost = float(row[0]) if row and len(row) > 0 else 0.0
-                    service_name = str(row[1]) if len(row) > 1 else "Unknown"
-                    total_cost += cost
-                    services.append({
-                        "service": service_name,
-                        "cost": round(cost, 2)
-                    })
+            for row in rows or []:
+                cost = float(row[0]) if row and len(row) > 0 else 0.0
+                service_name = str(row[1]) if len(row) > 1 else "Unknown"
+                total_cost += cost
+                services.append({
+                    "service": service_name,
+                    "cost": round(cost, 2)
+                })
             
             # Sort by cost descending
             services.sort(key=lambda x: x["cost"], reverse=True)
@@ -269,21 +767,20 @@ class AzureCostManager:
         except Exception as e:
             return {"error": f"Failed to format result: {str(e)}"}
     
-    def _format_daily_cost_result(self, result) -> Dict[str, Any]:
+    def _format_daily_cost_result(self, rows) -> Dict[str, Any]:
         """Format daily cost result"""
         try:
             daily_costs = []
             total_cost = 0.0
             
-            if hasattr(result, 'rows') and result.rows:
-                for row in result.rows:
-                    cost = float(row[0]) if row and len(row) > 0 else 0.0
-                    date = str(row[1]) if len(row) > 1 else ""
-                    total_cost += cost
-                    daily_costs.append({
-                        "date": date,
-                        "cost": round(cost, 2)
-                    })
+            for row in rows or []:
+                cost = float(row[0]) if row and len(row) > 0 else 0.0
+                date = str(row[1]) if len(row) > 1 else ""
+                total_cost += cost
+                daily_costs.append({
+                    "date": date,
+                    "cost": round(cost, 2)
+                })
             
             return {
                 "total_cost": round(total_cost, 2),
@@ -293,21 +790,20 @@ class AzureCostManager:
         except Exception as e:
             return {"error": f"Failed to format result: {str(e)}"}
     
-    def _format_resource_group_cost_result(self, result) -> Dict[str, Any]:
+    def _format_resource_group_cost_result(self, rows) -> Dict[str, Any]:
         """Format resource group cost result"""
         try:
             resource_groups = []
             total_cost = 0.0
             
-            if hasattr(result, 'rows') and result.rows:
-                for row in result.rows:
-                    cost = float(row[0]) if row and len(row) > 0 else 0.0
-                    rg_name = str(row[1]) if len(row) > 1 else "Unknown"
-                    total_cost += cost
-                    resource_groups.append({
-                        "resource_group": rg_name,
-                        "cost": round(cost, 2)
-                    })
+            for row in rows or []:
+                cost = float(row[0]) if row and len(row) > 0 else 0.0
+                rg_name = str(row[1]) if len(row) > 1 else "Unknown"
+                total_cost += cost
+                resource_groups.append({
+                    "resource_group": rg_name,
+                    "cost": round(cost, 2)
+                })
             
             # Sort by cost descending
             resource_groups.sort(key=lambda x: x["cost"], reverse=True)
@@ -320,30 +816,38 @@ class AzureCostManager:
         except Exception as e:
             return {"error": f"Failed to format result: {str(e)}"}
     
-    def _format_resource_cost_result(self, result, top: int) -> Dict[str, Any]:
+    def _format_resource_cost_result(self, rows, top: int) -> Dict[str, Any]:
         """Format resource cost result"""
         try:
-            resources = []
+            # Bounded min-heap of (cost, -position, resource_id): memory stays O(top)
+            # however many resources the scope bills for
+            heap = []
             total_cost = 0.0
             
-            if hasattr(result, 'rows') and result.rows:
-                for row in result.rows:
-                    cost = float(row[0]) if row and len(row) > 0 else 0.0
-                    resource_id = str(row[1]) if len(row) > 1 else "Unknown"
-                    total_cost += cost
-                    
-                    # Extract resource name from ID
-                    resource_name = resource_id.split('/')[-1] if '/' in resource_id else resource_id
-                    
-                    resources.append({
-                        "resource_name": resource_name,
-                        "resource_id": resource_id,
-                        "cost": round(cost, 2)
-                    })
-            
-            # Sort by cost descending and take top N
-            resources.sort(key=lambda x: x["cost"], reverse=True)
-            top_resources = resources[:top]
+            for position, row in enumerate(rows or []):
+                cost = float(row[0]) if row and len(row) > 0 else 0.0
+                total_cost += cost
+                if top <= 0:
+                    continue
+                
+                entry = (cost, -position, row[1] if len(row) > 1 else "Unknown")
+                if len(heap) < top:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            
+            top_resources = []
+            for cost, _, resource_id in sorted(heap, reverse=True):
+                resource_id = str(resource_id)
+                
+                # Extract resource name from ID
+                resource_name = resource_id.split('/')[-1] if '/' in resource_id else resource_id
+                
+                top_resources.append({
+                    "resource_name": resource_name,
+                    "resource_id": resource_id,
+                    "cost": round(cost, 2)
+                })
             
             return {
                 "total_cost": round(total_cost, 2),
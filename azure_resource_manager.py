@@ -4,93 +4,313 @@ Handles resource queries using Azure Resource Graph API
 """
 
 import os
-from typing import Dict, Any, List, Optional
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resourcegraph import ResourceGraphClient
-from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
-from azure.mgmt.resource import SubscriptionClient
+import re
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 import json
 
+from async_executor import run_blocking
+from azure_clients import get_credential, get_transport
+from ttl_cache import TTLCache
+from inventory_snapshot import InventorySnapshot
+from throttle import RESOURCE_GRAPH, background_priority, get_scheduler
+from tool_registry import tool
+
+
+logger = logging.getLogger(__name__)
+
 
 class AzureResourceManager:
     def __init__(self):
         """Initialize Azure Resource Graph client"""
         self.subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
         
-        use_managed_identity = os.getenv("USE_MANAGED_IDENTITY", "false").lower() == "true"
+        # SDK clients (and their credential) are built on first use to keep startup fast
+        self._rg_client = None
+        self._sub_client = None
+        self._client_lock = threading.Lock()
         
-        if use_managed_identity:
-            self.credential = DefaultAzureCredential()
-        else:
-            self.credential = DefaultAzureCredential()
+        # Query every accessible subscription unless restricted to AZURE_SUBSCRIPTION_ID
+        self.query_all_subscriptions = os.getenv("RESOURCE_GRAPH_ALL_SUBSCRIPTIONS", "true").lower() == "true"
+        self.subscription_batch_size = int(os.getenv("RESOURCE_GRAPH_SUBSCRIPTION_BATCH_SIZE", "1000"))
+        self.page_size = int(os.getenv("RESOURCE_GRAPH_PAGE_SIZE", "1000"))
+        self._fanout_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RESOURCE_GRAPH_MAX_CONCURRENCY", "4")),
+            thread_name_prefix="resource-graph"
+        )
+        self._subscription_cache = TTLCache(
+            ttl_seconds=float(os.getenv("SUBSCRIPTION_CACHE_TTL_SECONDS", "3600")),
+            max_entries=1
+        )
         
-        self.rg_client = ResourceGraphClient(self.credential)
-        self.sub_client = SubscriptionClient(self.credential)
+        # Governance checks: tags every resource should carry, and the row cap for finding lists
+        self.required_tags = [
+            tag.strip() for tag in os.getenv("REQUIRED_TAGS", "Environment,CostCenter,Owner").split(",") if tag.strip()
+        ]
+        self.max_finding_rows = int(os.getenv("GOVERNANCE_MAX_ROWS", "1000"))
+        
+        # Indexed local copy of the Resources table; helpers fall back to live queries until it loads
+        self.use_inventory_snapshot = os.getenv("INVENTORY_SNAPSHOT_ENABLED", "true").lower() == "true"
+        self.inventory = InventorySnapshot(self.query_resources)
+    
+    @property
+    def rg_client(self):
+        """Resource Graph client, built on first use"""
+        if self._rg_client is None:
+            with self._client_lock:
+                if self._rg_client is None:
+                    from azure.mgmt.resourcegraph import ResourceGraphClient
+                    # One credential (and token cache) and one pooled transport shared with the other clients;
+                    # throttled (429/5xx) responses are retried by the throttle scheduler, not the SDK
+                    self._rg_client = ResourceGraphClient(get_credential(), transport=get_transport(), retry_status=0)
+        return self._rg_client
+    
+    @property
+    def sub_client(self):
+        """Subscription client, built on first use"""
+        if self._sub_client is None:
+            with self._client_lock:
+                if self._sub_client is None:
+                    from azure.mgmt.resource import SubscriptionClient
+                    self._sub_client = SubscriptionClient(get_credential(), transport=get_transport())
+        return self._sub_client
+    
+    def warm_up(self) -> None:
+        """
+        Build the clients and prefetch the subscription list
+        
+        Runs at background priority, so it yields to interactive queries.
+        """
+        self.rg_client
+        with background_priority():
+            self._default_subscriptions()
     
     async def get_subscriptions(self) -> List[Dict[str, Any]]:
         """Get all accessible subscriptions"""
         try:
-            subscriptions = []
-            for sub in self.sub_client.subscriptions.list():
-                subscriptions.append({
-                    "id": sub.subscription_id,
-                    "name": sub.display_name,
-                    "state": sub.state
-                })
-            return subscriptions
+            # Listing pages through ARM synchronously, so keep it off the event loop
+            return await run_blocking(self.list_subscriptions)
         except Exception as e:
             return [{"error": str(e)}]
     
+    def list_subscriptions(self) -> List[Dict[str, Any]]:
+        """Get all accessible subscriptions (blocking)"""
+        subscriptions = []
+        for sub in self.sub_client.subscriptions.list():
+            subscriptions.append({
+                "id": sub.subscription_id,
+                "name": sub.display_name,
+                "state": sub.state
+            })
+        return subscriptions
+    
     def query_resources(self, query: str, subscriptions: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Execute a Resource Graph query
         
+        Follows skip tokens to completion and fans out over subscription batches
+        (Resource Graph accepts a limited number of subscriptions per request),
+        running batches concurrently. Aggregations (summarize/limit) are evaluated
+        per batch: callers merge summarized rows with _sum_by and order or limit
+        after the merge.
+        
         Args:
             query: KQL query string
-            subscriptions: List of subscription IDs to query
+            subscriptions: List of subscription IDs to query (defaults to all accessible subscriptions)
         """
         try:
             if not subscriptions:
-                subscriptions = [self.subscription_id]
+                subscriptions = self._default_subscriptions()
             
-            request = QueryRequest(
-                subscriptions=subscriptions,
-                query=query,
-                options=QueryRequestOptions(top=1000)
-            )
+            size = self.subscription_batch_size
+            batches = [subscriptions[i:i + size] for i in range(0, len(subscriptions), size)]
             
-            response = self.rg_client.resources(request)
+            if len(batches) == 1:
+                results = [self._query_batch(query, batches[0])]
+            else:
+                # Carry the caller's context (call priority) into the fan-out threads
+                context = contextvars.copy_context()
+                results = list(self._fanout_pool.map(
+                    lambda batch: context.copy().run(self._query_batch, query, batch), batches
+                ))
+            
+            data = []
+            total_records = 0
+            for batch_data, batch_total in results:
+                data.extend(batch_data)
+                total_records += batch_total
             
             return {
-                "count": response.count,
-                "total_records": response.total_records,
-                "data": response.data
+                "count": len(data),
+                "total_records": total_records,
+                "data": data
             }
         except Exception as e:
             return {"error": str(e)}
     
+    def _query_batch(self, query: str, subscriptions: List[str]) -> Tuple[List[Any], int]:
+        """
+        Run a query against one subscription batch, following skip tokens
+        
+        Returns:
+            Tuple of (rows, total_records)
+        """
+        data = []
+        total_records = 0
+        skip_token = None
+        from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+        
+        while True:
+            request = QueryRequest(
+                subscriptions=subscriptions,
+                query=query,
+                options=QueryRequestOptions(top=self.page_size, skip_token=skip_token)
+            )
+            
+            # Resource Graph quotas are per user, so every query shares one bucket
+            response = get_scheduler().call(RESOURCE_GRAPH, "tenant", self.rg_client.resources, request)
+            if response.data:
+                data.extend(response.data)
+            total_records = response.total_records or total_records
+            
+            skip_token = response.skip_token
+            if not skip_token:
+                # Resource Graph only pages queries that project id; anything else stops at one page
+                if total_records > len(data):
+                    logger.warning(
+                        "Resource Graph returned %d of %d rows without a skip token (does the query project id?)",
+                        len(data), total_records
+                    )
+                return data, total_records
+    
+    def _default_subscriptions(self) -> List[str]:
+        """Subscriptions queried when none are given: every enabled subscription, or the configured one"""
+        if not self.query_all_subscriptions:
+            return [self.subscription_id]
+        
+        subscription_ids = self._subscription_cache.get("subscription_ids")
+        if subscription_ids is None:
+            try:
+                subscription_ids = [
+                    sub["id"] for sub in self.list_subscriptions()
+                    if str(sub.get("state", "")).lower().endswith("enabled")
+                ]
+            except Exception:
+                subscription_ids = []
+            if not subscription_ids:
+                return [self.subscription_id]
+            self._subscription_cache.set("subscription_ids", subscription_ids)
+        return subscription_ids
+    
+    def _snapshot(self) -> Optional[InventorySnapshot]:
+        """The local inventory snapshot, if enabled and loaded"""
+        if self.use_inventory_snapshot and self.inventory.ready:
+            return self.inventory
+        return None
+    
+    def _snapshot_result(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Wrap snapshot (or merged) rows in the same shape query_resources returns"""
+        return {
+            "count": len(data),
+            "total_records": len(data),
+            "data": data
+        }
+    
+    def _props(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return row.get("properties") or {}
+    
+    def _id_segment(self, resource_id: Optional[str], index: int) -> Optional[str]:
+        parts = (resource_id or "").split("/")
+        return parts[index] if len(parts) > index else None
+    
+    def _required_tag_columns(self) -> List[Tuple[str, str]]:
+        """(KQL column, lower-case tag literal) per required tag"""
+        return [
+            (f"has_{re.sub(r'[^0-9A-Za-z_]', '_', tag)}", tag.lower().replace("'", "\\'"))
+            for tag in self.required_tags
+        ]
+    
+    def _counts_by_type(self, result: Dict[str, Any], limit: Optional[int] = None) -> Dict[str, Any]:
+        """Merge per-batch `summarize count() by type` rows, then order (and limit) the totals"""
+        if "error" in result:
+            return result
+        rows = sorted(self._sum_by(result.get("data", []), "type"), key=lambda row: row.get("count_") or 0, reverse=True)
+        return self._snapshot_result(rows[:limit] if limit else rows)
+    
+    def _sum_by(self, rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+        """
+        Combine partial aggregates (one row per key per subscription batch) by summing numeric columns
+        
+        Distinct counts summed across batches are upper bounds; with a single batch
+        (up to RESOURCE_GRAPH_SUBSCRIPTION_BATCH_SIZE subscriptions) rows pass through unchanged.
+        """
+        merged: Dict[Any, Dict[str, Any]] = {}
+        for row in rows:
+            target = merged.get(row.get(key))
+            if target is None:
+                merged[row.get(key)] = dict(row)
+                continue
+            for column, value in row.items():
+                if column != key and isinstance(value, (int, float)):
+                    target[column] = (target.get(column) or 0) + value
+        return list(merged.values())
+    
+    @tool(description="Get all storage accounts that have private endpoints configured. Use this when user asks about storage accounts with private endpoints or private networking.")
     def get_storage_accounts_with_private_endpoints(self) -> Dict[str, Any]:
         """Get storage accounts with private endpoints"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "hasPrivateEndpoint": True
+                }
+                for row in snapshot.resources_of_type("microsoft.storage/storageaccounts")
+                if self._props(row).get("privateEndpointConnections")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.storage/storageaccounts'
         | project name, resourceGroup, location, 
-                  hasPrivateEndpoint = isnotnull(properties.privateEndpointConnections) and array_length(properties.privateEndpointConnections) > 0
+                  hasPrivateEndpoint = isnotnull(properties.privateEndpointConnections) and array_length(properties.privateEndpointConnections) > 0,
+                  id
         | where hasPrivateEndpoint == true
         """
         return self.query_resources(query)
     
+    @tool(description="Get all virtual networks in the subscription. Use this when user asks about VNets, virtual networks, or network infrastructure.")
     def get_all_vnets(self) -> Dict[str, Any]:
         """Get all virtual networks"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "addressSpace": (self._props(row).get("addressSpace") or {}).get("addressPrefixes"),
+                    "subnets": len(self._props(row).get("subnets") or [])
+                }
+                for row in snapshot.resources_of_type("microsoft.network/virtualnetworks")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.network/virtualnetworks'
         | project name, resourceGroup, location, 
                   addressSpace = properties.addressSpace.addressPrefixes,
-                  subnets = array_length(properties.subnets)
+                  subnets = array_length(properties.subnets),
+                  id
         """
         return self.query_resources(query)
     
+    @tool(description="Get virtual machines that don't have backup configured. Use this when user asks about VMs without backup, unprotected VMs, or backup compliance.")
     def get_vms_without_backup(self) -> Dict[str, Any]:
         """Get VMs that don't have backup configured"""
         query = """
@@ -104,10 +324,20 @@ class AzureResourceManager:
             | project vaultId = id, protectedItems
         ) on $left.resourceGroup == $right.resourceGroup
         | where isnull(protectedItems) or protectedItems == 0
-        | project vmName, resourceGroup, location
+        | project vmName, resourceGroup, location, id = vmId
         """
         return self.query_resources(query)
     
+    @tool(
+        description="Get all resources of a specific type. Use this when user asks about specific resource types like VMs, storage accounts, databases, etc.",
+        parameters={
+            "resource_type": {
+                "type": "string",
+                "description": "Azure resource type in format 'microsoft.compute/virtualmachines' or 'microsoft.storage/storageaccounts'"
+            }
+        },
+        required=["resource_type"]
+    )
     def get_resources_by_type(self, resource_type: str) -> Dict[str, Any]:
         """
         Get resources by type
@@ -115,6 +345,19 @@ class AzureResourceManager:
         Args:
             resource_type: Azure resource type (e.g., 'microsoft.compute/virtualmachines')
         """
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "type": row.get("type"),
+                    "id": row.get("id")
+                }
+                for row in snapshot.resources_of_type(resource_type)[:100]
+            ])
+        
         query = f"""
         Resources
         | where type =~ '{resource_type}'
@@ -123,6 +366,20 @@ class AzureResourceManager:
         """
         return self.query_resources(query)
     
+    @tool(
+        description="Get all resources filtered by a specific tag name and value. Use this when user asks to filter resources by tags, find resources with specific tags, or list resources with Environment/Owner/CostCenter tags. Returns resource name, type, resource group, location, tags, and resource ID.",
+        parameters={
+            "tag_name": {
+                "type": "string",
+                "description": "Tag name to filter by (e.g., 'Environment', 'CostCenter', 'Owner')"
+            },
+            "tag_value": {
+                "type": "string",
+                "description": "Tag value to filter by (e.g., 'Sandbox', 'Production', 'Development'). If not provided, returns all resources with the tag regardless of value."
+            }
+        },
+        required=["tag_name"]
+    )
     def get_resources_by_tag(self, tag_name: str, tag_value: Optional[str] = None) -> Dict[str, Any]:
         """
         Get resources by tag
@@ -131,18 +388,32 @@ class AzureResourceManager:
             tag_name: Tag name to filter by
             tag_value: Optional tag value to filter by
         """
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "id": row.get("id"),
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "type": row.get("type"),
+                    "tags": row.get("tags")
+                }
+                for row in snapshot.resources_with_tag(tag_name, tag_value)[:100]
+            ])
+        
         if tag_value:
             query = f"""
             Resources
             | where tags['{tag_name}'] == '{tag_value}'
-            | project name, resourceGroup, location, type, tags
+            | project id, name, resourceGroup, location, type, tags
             | limit 100
             """
         else:
             query = f"""
             Resources
             | where isnotnull(tags['{tag_name}'])
-            | project name, resourceGroup, location, type, tags
+            | project id, name, resourceGroup, location, type, tags
             | limit 100
             """
         return self.query_resources(query)
@@ -154,33 +425,54 @@ class AzureResourceManager:
         Args:
             location: Azure region (e.g., 'eastus', 'westeurope')
         """
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result(snapshot.count_by_type(location=location))
+        
         query = f"""
         Resources
         | where location =~ '{location}'
         | summarize count() by type
-        | order by count_ desc
         """
-        return self.query_resources(query)
+        return self._counts_by_type(self.query_resources(query))
     
+    @tool(description="Get count of all resources grouped by type. Use this for inventory overview or when user asks how many resources of each type exist.")
     def get_resource_count_by_type(self) -> Dict[str, Any]:
         """Get count of resources grouped by type"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result(snapshot.count_by_type()[:50])
+        
         query = """
         Resources
         | summarize count() by type
-        | order by count_ desc
-        | limit 50
         """
-        return self.query_resources(query)
+        return self._counts_by_type(self.query_resources(query), limit=50)
     
     def get_public_ip_addresses(self) -> Dict[str, Any]:
         """Get all public IP addresses"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "ipAddress": self._props(row).get("ipAddress"),
+                    "allocationMethod": self._props(row).get("publicIPAllocationMethod"),
+                    "sku": (row.get("sku") or {}).get("name")
+                }
+                for row in snapshot.resources_of_type("microsoft.network/publicipaddresses")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.network/publicipaddresses'
         | project name, resourceGroup, location,
                   ipAddress = properties.ipAddress,
                   allocationMethod = properties.publicIPAllocationMethod,
-                  sku = sku.name
+                  sku = sku.name,
+                  id
         """
         return self.query_resources(query)
     
@@ -203,6 +495,16 @@ class AzureResourceManager:
         """
         return self.query_resources(query)
     
+    @tool(
+        description="Search for resources by name. Use this when user asks to find or search for a specific resource by name.",
+        parameters={
+            "search_term": {
+                "type": "string",
+                "description": "Term to search for in resource names"
+            }
+        },
+        required=["search_term"]
+    )
     def search_resources(self, search_term: str) -> Dict[str, Any]:
         """
         Search for resources by name
@@ -210,6 +512,18 @@ class AzureResourceManager:
         Args:
             search_term: Term to search for in resource names
         """
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "type": row.get("type"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location")
+                }
+                for row in snapshot.search(search_term)[:50]
+            ])
+        
         query = f"""
         Resources
         | where name contains '{search_term}'
@@ -218,8 +532,24 @@ class AzureResourceManager:
         """
         return self.query_resources(query)
     
+    @tool(description="Get all App Services (web apps). Use this when user asks about App Services, web apps, or hosting.")
     def get_app_services(self) -> Dict[str, Any]:
         """Get all App Services"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "kind": row.get("kind"),
+                    "state": self._props(row).get("state"),
+                    "defaultHostName": self._props(row).get("defaultHostName"),
+                    "sku": self._props(row).get("sku")
+                }
+                for row in snapshot.resources_of_type("microsoft.web/sites")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.web/sites'
@@ -227,30 +557,311 @@ class AzureResourceManager:
                   kind = kind,
                   state = properties.state,
                   defaultHostName = properties.defaultHostName,
-                  sku = properties.sku
+                  sku = properties.sku,
+                  id
         """
         return self.query_resources(query)
     
+    @tool(description="Get all SQL databases. Use this when user asks about SQL databases or database inventory.")
     def get_sql_databases(self) -> Dict[str, Any]:
         """Get all SQL databases"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "serverName": self._id_segment(row.get("id"), 8),
+                    "sku": (row.get("sku") or {}).get("name"),
+                    "maxSizeBytes": self._props(row).get("maxSizeBytes")
+                }
+                for row in snapshot.resources_of_type("microsoft.sql/servers/databases")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.sql/servers/databases'
         | project name, resourceGroup, location,
                   serverName = split(id, '/')[8],
                   sku = sku.name,
-                  maxSizeBytes = properties.maxSizeBytes
+                  maxSizeBytes = properties.maxSizeBytes,
+                  id
         """
         return self.query_resources(query)
     
+    @tool(description="Get all Key Vaults. Use this when user asks about Key Vaults or secrets management.")
     def get_key_vaults(self) -> Dict[str, Any]:
         """Get all Key Vaults"""
+        snapshot = self._snapshot()
+        if snapshot:
+            return self._snapshot_result([
+                {
+                    "name": row.get("name"),
+                    "resourceGroup": row.get("resourceGroup"),
+                    "location": row.get("location"),
+                    "sku": (self._props(row).get("sku") or {}).get("name"),
+                    "enabledForDeployment": self._props(row).get("enabledForDeployment"),
+                    "enableRbacAuthorization": self._props(row).get("enableRbacAuthorization")
+                }
+                for row in snapshot.resources_of_type("microsoft.keyvault/vaults")
+            ])
+        
         query = """
         Resources
         | where type == 'microsoft.keyvault/vaults'
         | project name, resourceGroup, location,
                   sku = properties.sku.name,
                   enabledForDeployment = properties.enabledForDeployment,
-                  enableRbacAuthorization = properties.enableRbacAuthorization
+                  enableRbacAuthorization = properties.enableRbacAuthorization,
+                  id
+        """
+        return self.query_resources(query)
+
+    @tool(description="Get all virtual machines with detailed information including VM size, OS type, power state, and tags. Use when user asks about VMs, virtual machine inventory, or VM estate management.")
+    def get_all_vms(self) -> Dict[str, Any]:
+        """Get all virtual machines with size, OS, power state and tags"""
+        query = """
+        Resources
+        | where type =~ 'microsoft.compute/virtualmachines'
+        | project name, resourceGroup, location, subscriptionId,
+                  vmSize = tostring(properties.hardwareProfile.vmSize),
+                  osType = tostring(properties.storageProfile.osDisk.osType),
+                  powerState = replace_string(tostring(properties.extended.instanceView.powerState.code), 'PowerState/', ''),
+                  tags, id
+        | order by name asc
         """
         return self.query_resources(query)
+    
+    @tool(description="Get all storage accounts with security settings including public access, HTTPS, and private endpoints. Use when user asks about storage accounts or storage security.")
+    def get_storage_accounts(self) -> Dict[str, Any]:
+        """Get all storage accounts with their security settings"""
+        query = """
+        Resources
+        | where type =~ 'microsoft.storage/storageaccounts'
+        | project name, resourceGroup, location, kind,
+                  sku = tostring(sku.name),
+                  allowBlobPublicAccess = tobool(properties.allowBlobPublicAccess),
+                  httpsOnly = tobool(properties.supportsHttpsTrafficOnly),
+                  minimumTlsVersion = tostring(properties.minimumTlsVersion),
+                  publicNetworkAccess = tostring(properties.publicNetworkAccess),
+                  privateEndpoints = coalesce(array_length(properties.privateEndpointConnections), 0),
+                  id
+        | order by name asc
+        """
+        return self.query_resources(query)
+    
+    @tool(description="Get all database resources including SQL, Cosmos DB, PostgreSQL, and MySQL. Use when user asks about database inventory.")
+    def get_all_databases(self) -> Dict[str, Any]:
+        """Get all database resources (SQL, SQL Managed Instance, Cosmos DB, PostgreSQL, MySQL, MariaDB)"""
+        query = """
+        Resources
+        | where type in~ ('microsoft.sql/servers/databases', 'microsoft.sql/managedinstances',
+                          'microsoft.documentdb/databaseaccounts',
+                          'microsoft.dbforpostgresql/servers', 'microsoft.dbforpostgresql/flexibleservers',
+                          'microsoft.dbformysql/servers', 'microsoft.dbformysql/flexibleservers',
+                          'microsoft.dbformariadb/servers')
+        | where not(type =~ 'microsoft.sql/servers/databases' and name =~ 'master')
+        | project name, resourceGroup, location,
+                  engine = case(type =~ 'microsoft.sql/servers/databases', 'Azure SQL Database',
+                                type =~ 'microsoft.sql/managedinstances', 'SQL Managed Instance',
+                                type =~ 'microsoft.documentdb/databaseaccounts', 'Cosmos DB',
+                                type contains 'postgresql', 'PostgreSQL',
+                                type contains 'mysql', 'MySQL',
+                                'MariaDB'),
+                  sku = tostring(sku.name),
+                  server = iff(type =~ 'microsoft.sql/servers/databases', tostring(split(id, '/')[8]), ''),
+                  type, id
+        | order by engine asc, name asc
+        """
+        return self.query_resources(query)
+    
+    @tool(description="Get PaaS resources (storage, SQL, Key Vault, Cosmos DB) that don't have private endpoints configured. Use for security assessment and private endpoint compliance checks.")
+    def get_paas_without_private_endpoints(self) -> Dict[str, Any]:
+        """Get storage accounts, SQL servers, Key Vaults and Cosmos DB accounts without a private endpoint"""
+        query = f"""
+        Resources
+        | where type in~ ('microsoft.storage/storageaccounts', 'microsoft.sql/servers',
+                          'microsoft.keyvault/vaults', 'microsoft.documentdb/databaseaccounts')
+        | where coalesce(array_length(properties.privateEndpointConnections), 0) == 0
+        | project name, type, resourceGroup, location,
+                  publicNetworkAccess = tostring(properties.publicNetworkAccess), id
+        | order by type asc, name asc
+        | limit {self.max_finding_rows}
+        """
+        return self.query_resources(query)
+    
+    @tool(description="Get resources exposed to the public internet (storage with public blob access, SQL servers, public IPs, VMs). Use for security posture assessment.")
+    def get_resources_with_public_access(self) -> Dict[str, Any]:
+        """
+        Get resources reachable from the internet, one row per finding
+        
+        PaaS data services with public network access, assigned public IPs (with the
+        NIC or load balancer they front) and NSG rules allowing inbound traffic from any
+        source, in one union query.
+        """
+        query = f"""
+        Resources
+        | where type in~ ('microsoft.storage/storageaccounts', 'microsoft.sql/servers',
+                          'microsoft.keyvault/vaults', 'microsoft.documentdb/databaseaccounts')
+        | extend exposure = case(
+              type =~ 'microsoft.storage/storageaccounts' and tobool(properties.allowBlobPublicAccess) == true,
+                  'Anonymous blob access allowed',
+              tostring(properties.publicNetworkAccess) =~ 'Disabled', '',
+              type =~ 'microsoft.storage/storageaccounts' and tostring(properties.networkAcls.defaultAction) =~ 'Deny', '',
+              type =~ 'microsoft.keyvault/vaults' and tostring(properties.networkAcls.defaultAction) =~ 'Deny', '',
+              'Public network access enabled')
+        | where isnotempty(exposure)
+        | project name, type, resourceGroup, location, exposure, detail = '', id
+        | union (
+            Resources
+            | where type =~ 'microsoft.network/publicipaddresses' and isnotempty(properties.ipAddress)
+            | project name, type, resourceGroup, location,
+                      exposure = strcat('Public IP ', tostring(properties.ipAddress)),
+                      detail = iff(isempty(properties.ipConfiguration.id), 'not attached',
+                                   tostring(split(tostring(properties.ipConfiguration.id), '/')[8])),
+                      id
+        ), (
+            Resources
+            | where type =~ 'microsoft.network/networksecuritygroups'
+            | mv-expand rule = properties.securityRules
+            | where tostring(rule.properties.direction) =~ 'Inbound' and tostring(rule.properties.access) =~ 'Allow'
+                and tostring(rule.properties.sourceAddressPrefix) in ('*', 'Internet', '0.0.0.0/0', 'Any')
+            | project name, type, resourceGroup, location,
+                      exposure = 'NSG allows inbound from any source',
+                      detail = strcat(tostring(rule.name), ' port ', tostring(rule.properties.destinationPortRange)),
+                      id
+        )
+        | order by type asc, name asc
+        | limit {self.max_finding_rows}
+        """
+        return self.query_resources(query)
+    
+    @tool(description="Get resources missing required tags (Environment, CostCenter, Owner). Use for tag compliance audits and governance checks.")
+    def get_resources_without_tags(self) -> Dict[str, Any]:
+        """Get resources missing one or more REQUIRED_TAGS (tag names compared case-insensitively)"""
+        required = ", ".join(f"'{literal}'" for _, literal in self._required_tag_columns())
+        query = f"""
+        Resources
+        | extend tagKeys = split(tolower(strcat_array(bag_keys(tags), ',')), ',')
+        | extend missingTags = set_difference(dynamic([{required}]), tagKeys)
+        | where array_length(missingTags) > 0
+        | project name, type, resourceGroup, location, missingTags, id
+        | order by type asc, name asc
+        | limit {self.max_finding_rows}
+        """
+        result = self.query_resources(query)
+        if "error" not in result:
+            result["required_tags"] = self.required_tags
+        return result
+    
+    @tool(description="Get potentially unused resources including orphaned disks, unattached public IPs, and deallocated VMs. Use for cost optimization and resource cleanup.")
+    def get_unused_resources(self) -> Dict[str, Any]:
+        """Get unattached disks and NICs, unassociated public IPs, deallocated VMs and empty App Service plans"""
+        query = f"""
+        Resources
+        | where type in~ ('microsoft.compute/disks', 'microsoft.network/publicipaddresses',
+                          'microsoft.compute/virtualmachines', 'microsoft.network/networkinterfaces',
+                          'microsoft.web/serverfarms')
+        | extend reason = case(
+              type =~ 'microsoft.compute/disks' and (tostring(properties.diskState) =~ 'Unattached' or isempty(managedBy)),
+                  'Unattached managed disk',
+              type =~ 'microsoft.network/publicipaddresses' and isempty(properties.ipConfiguration) and isempty(properties.natGateway),
+                  'Public IP not associated',
+              type =~ 'microsoft.compute/virtualmachines' and tostring(properties.extended.instanceView.powerState.code) =~ 'PowerState/deallocated',
+                  'VM deallocated (disks still billed)',
+              type =~ 'microsoft.network/networkinterfaces' and isempty(properties.virtualMachine) and isempty(properties.privateEndpoint),
+                  'Network interface not attached',
+              type =~ 'microsoft.web/serverfarms' and toint(properties.numberOfSites) == 0,
+                  'App Service plan without apps',
+              '')
+        | where isnotempty(reason)
+        | project name, type, resourceGroup, location, reason,
+                  sku = tostring(sku.name), diskSizeGB = toint(properties.diskSizeGB), id
+        | order by reason asc, name asc
+        | limit {self.max_finding_rows}
+        """
+        return self.query_resources(query)
+    
+    @tool(description="Get tag compliance statistics showing percentage of resources with required tags. Use when user asks about overall tag compliance or governance posture.")
+    def get_tag_compliance_summary(self) -> Dict[str, Any]:
+        """
+        Tag compliance counts for REQUIRED_TAGS, aggregated in Resource Graph per resource type
+        
+        Returns overall and per-tag percentages plus the least compliant resource types;
+        the response size depends on the number of types, not resources.
+        """
+        columns = self._required_tag_columns()
+        flags = ", ".join(f"{column} = set_has_element(tagKeys, '{literal}')" for column, literal in columns)
+        counts = ", ".join(f"{column} = countif({column})" for column, _ in columns)
+        all_tags = " and ".join(column for column, _ in columns) or "true"
+        query = f"""
+        Resources
+        | extend tagKeys = split(tolower(strcat_array(bag_keys(tags), ',')), ',')
+        | extend {flags}
+        | summarize total = count(), compliant = countif({all_tags}),
+                    untagged = countif(array_length(bag_keys(tags)) == 0 or isnull(tags)), {counts}
+                    by type
+        """
+        result = self.query_resources(query)
+        if "error" in result:
+            return result
+        
+        by_type = self._sum_by(result.get("data", []), "type")
+        total = sum(row.get("total") or 0 for row in by_type)
+        
+        def percent(count: int, of: int) -> float:
+            return round(100.0 * count / of, 1) if of else 0.0
+        
+        compliant = sum(row.get("compliant") or 0 for row in by_type)
+        by_tag = {}
+        for tag, (column, _) in zip(self.required_tags, columns):
+            tagged = sum(row.get(column) or 0 for row in by_type)
+            by_tag[tag] = {"resources_with_tag": tagged, "percent": percent(tagged, total)}
+        
+        types = sorted(
+            (
+                {
+                    "type": row.get("type"),
+                    "resources": row.get("total") or 0,
+                    "non_compliant": (row.get("total") or 0) - (row.get("compliant") or 0),
+                    "compliance_percent": percent(row.get("compliant") or 0, row.get("total") or 0)
+                }
+                for row in by_type
+            ),
+            key=lambda row: row["non_compliant"],
+            reverse=True
+        )
+        return {
+            "required_tags": self.required_tags,
+            "total_resources": total,
+            "fully_compliant": compliant,
+            "compliance_percent": percent(compliant, total),
+            "untagged_resources": sum(row.get("untagged") or 0 for row in by_type),
+            "by_tag": by_tag,
+            "least_compliant_types": types[:20]
+        }
+    
+    @tool(description="Get resource distribution across Azure regions. Use when user asks about geographic distribution, multi-region deployment, or regional resource counts.")
+    def get_multi_region_distribution(self) -> Dict[str, Any]:
+        """Resource, type, resource group and subscription counts per region, aggregated in Resource Graph"""
+        query = """
+        Resources
+        | summarize resources = count(), resourceTypes = dcount(type),
+                    resourceGroups = dcount(strcat(subscriptionId, '/', resourceGroup)),
+                    subscriptions = dcount(subscriptionId)
+                    by location
+        """
+        result = self.query_resources(query)
+        if "error" in result:
+            return result
+        
+        regions = sorted(self._sum_by(result.get("data", []), "location"), key=lambda row: row.get("resources") or 0, reverse=True)
+        total = sum(row.get("resources") or 0 for row in regions)
+        for row in regions:
+            row["percent"] = round(100.0 * (row.get("resources") or 0) / total, 1) if total else 0.0
+        return {
+            "total_resources": total,
+            "region_count": len(regions),
+            "regions": regions
+        }
@@ -0,0 +1,121 @@
+"""
+Cost Analytics Benchmarks
+Times the trend, forecast and anomaly computations in cost_analytics over synthetic daily series
+(weekly seasonality, noise and injected spikes), from hundreds to tens of thousands of series
+
+Usage:
+    python benchmarks/bench_analytics.py --series 100,1000,10000 --output analytics.json
+    python benchmarks/bench_analytics.py --days 93 --baseline analytics.json
+"""
+
+import sys
+import time
+import argparse
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from common import compare_to_baseline, environment_info, summarize, write_results
+
+import cost_analytics
+
+
+def synthetic_series(count: int, days: int, first_day: date, rng: np.random.Generator) -> np.ndarray:
+    """Daily costs with a per-series level, weekday pattern, 5% noise and one spike in every 50th series"""
+    level = rng.lognormal(3, 1.5, (count, 1))
+    weekday = (first_day.weekday() + np.arange(days)) % 7
+    weekend = np.where(weekday >= 5, rng.uniform(0.4, 1.0, (count, 1)), 1.0)
+    matrix = level * weekend * (1 + 0.05 * rng.standard_normal((count, days)))
+    spiked = np.arange(0, count, 50)
+    matrix[spiked, rng.integers(days - 14, days, len(spiked))] *= 3
+    return np.maximum(matrix, 0.0)
+
+
+def computations(check_days: int) -> Dict[str, Callable[[List[str], np.ndarray, date], Dict[str, Any]]]:
+    return {
+        "trends": lambda labels, matrix, first_day: cost_analytics.trend_summary(labels, matrix, first_day, top=10),
+        "forecast": lambda labels, matrix, first_day: cost_analytics.forecast_month_end(labels, matrix, first_day, top=10),
+        "anomalies": lambda labels, matrix, first_day: cost_analytics.detect_anomalies(
+            labels, matrix, first_day, check_days=check_days, top=20
+        ),
+    }
+
+
+def measure(func: Callable[[], Any], repeats: int) -> Dict[str, Any]:
+    """Wall time over `repeats` runs, then one traced run for peak allocation"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_ms": {**summarize(timings), "min": round(min(timings), 2)},
+        "peak_kib": round(peak / 1024, 1),
+        "result": result
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cost analytics benchmarks")
+    parser.add_argument("--series", default="100,1000,5000,20000", help="Comma-separated series counts")
+    parser.add_argument("--days", type=int, default=93, help="Days per series (the cost cube default)")
+    parser.add_argument("--check-days", type=int, default=30, help="Days checked for anomalies")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per computation and size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="Results file (- for stdout)")
+    parser.add_argument("--baseline", help="Earlier results file to compare min time against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed min-time increase vs baseline")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.series.split(",") if count.strip()]
+    first_day = date.today() - timedelta(days=args.days)
+    suite = computations(args.check_days)
+
+    results = []
+    for count in counts:
+        labels = [f"series-{i}" for i in range(count)]
+        matrix = synthetic_series(count, args.days, first_day, np.random.default_rng(args.seed))
+        for name, func in suite.items():
+            measured = measure(lambda: func(labels, matrix, first_day), args.repeats)
+            output = measured.pop("result")
+            row = {"computation": name, "series": count, "days": args.days, **measured}
+            if name == "anomalies":
+                row["anomaly_count"] = output["anomaly_count"]
+            results.append(row)
+            print(
+                f"{name:>10} series={count:<7} min={row['time_ms']['min']:>9.2f}ms "
+                f"peak={row['peak_kib']:>10.1f}KiB"
+                + (f" anomalies={row['anomaly_count']} (injected {len(range(0, count, 50))})" if name == "anomalies" else ""),
+                file=sys.stderr
+            )
+
+    write_results(args.output, {
+        "benchmark": "cost_analytics",
+        "environment": environment_info(),
+        "settings": {"series": counts, "days": args.days, "check_days": args.check_days,
+                     "repeats": args.repeats, "seed": args.seed},
+        "results": results
+    })
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results, args.baseline, ("computation", "series", "days"), ("time_ms", "min"), args.max_regression
+        )
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+End-to-End Chat Benchmark
+Drives /api/chat and OpenAIAgent.process_message against the offline replay stand-ins and reports
+latency percentiles, throughput and per-stage timing as JSON
+
+Usage:
+    python benchmarks/bench_chat.py --concurrency 1,4,16 --requests 40 --output results.json
+    python benchmarks/bench_chat.py --baseline results.json --max-regression 0.2   # exit 1 on regression
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Tuple
+
+from common import (
+    compare_to_baseline, environment_info, load_demo_prompts, summarize, write_results
+)
+
+
+STAGES = ("model_call_1", "tool_execution", "model_call_2", "serialization")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end chat pipeline benchmark (offline)")
+    parser.add_argument("--mode", choices=("agent", "api", "both"), default="both",
+                        help="Drive OpenAIAgent.process_message, POST /api/chat, or both")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=0,
+                        help="Requests per level (default: every prompt once, at least 2x concurrency)")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests before each mode")
+    parser.add_argument("--demo-only", action="store_true", help="Use only prompts marked [DEMO]")
+    parser.add_argument("--cold", action="store_true", help="Clear the cost cache before every level")
+    parser.add_argument("--output", default="-", help="Results file (- for stdout)")
+    parser.add_argument("--baseline", help="Earlier results file to compare p95 latency against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 increase vs baseline")
+    parser.add_argument("--azure-latency-ms", type=float, help="Replay Azure API latency")
+    parser.add_argument("--openai-latency-ms", type=float, help="Replay model latency")
+    parser.add_argument("--throttle-rate", type=float, help="Replay share of Azure calls answered with 429")
+    parser.add_argument("--resources", type=int, help="Replay inventory size")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> Dict[str, str]:
+    """Point the app at the replay stand-ins before it is imported"""
+    settings = {
+        "OFFLINE_REPLAY": "true",
+        "WARMUP_ENABLED": "false",
+        "REPLAY_AZURE_LATENCY_MS": args.azure_latency_ms,
+        "REPLAY_OPENAI_LATENCY_MS": args.openai_latency_ms,
+        "REPLAY_THROTTLE_RATE": args.throttle_rate,
+        "REPLAY_RESOURCES": args.resources,
+    }
+    for name, value in settings.items():
+        if value is not None:
+            os.environ[name] = str(value)
+    return {name: value for name, value in os.environ.items() if name.startswith(("REPLAY_", "OFFLINE_"))}
+
+
+async def run_level(send, prompts: List[Tuple[str, str]], concurrency: int, requests: int) -> Dict[str, Any]:
+    """Closed-loop run: `concurrency` workers send `requests` prompts in total"""
+    from stage_timer import collect_stages
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(prompts[i % len(prompts)])
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors: List[str] = []
+
+    async def worker():
+        while not queue.empty():
+            prompt_id, prompt = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                with collect_stages() as timings:
+                    ok = await send(prompt)
+                if not ok:
+                    errors.append(prompt_id)
+            except Exception as e:
+                errors.append(f"{prompt_id}: {e}")
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            for name, value in timings.items():
+                stages.setdefault(name, []).append(value)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(stages[name]) for name in ordered}
+    }
+
+
+async def main() -> int:
+    args = parse_args()
+    replay_settings = configure_environment(args)
+
+    import httpx
+    import main as app_main
+
+    prompts = load_demo_prompts(demo_only=args.demo_only)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    async def send_agent(prompt: str) -> bool:
+        response, _ = await app_main.ai_agent.process_message(prompt, [])
+        return not response.startswith("I encountered an error")
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url="http://bench", timeout=None)
+
+    async def send_api(prompt: str) -> bool:
+        response = await client.post("/api/chat", json={"message": prompt})
+        return response.status_code == 200 and not response.json()["response"].startswith("I encountered an error")
+
+    modes = {"agent": send_agent, "api": send_api}
+    selected = list(modes) if args.mode == "both" else [args.mode]
+
+    await app_main.startup()
+    results = []
+    try:
+        for mode in selected:
+            send = modes[mode]
+            for prompt_id, prompt in prompts[:args.warmup]:
+                await send(prompt)
+            for concurrency in levels:
+                if args.cold:
+                    app_main.cost_manager.cache.invalidate()
+                requests = args.requests or max(len(prompts), 2 * concurrency)
+                row = {"mode": mode, **await run_level(send, prompts, concurrency, requests)}
+                results.append(row)
+                latency = row["latency_ms"]
+                print(
+                    f"{mode:>5} c={concurrency:<3} n={requests:<4} rps={row['rps']:<7} "
+                    f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms errors={row['errors']}",
+                    file=sys.stderr
+                )
+    finally:
+        await client.aclose()
+        await app_main.shutdown()
+
+    write_results(args.output, {
+        "benchmark": "chat_pipeline",
+        "environment": environment_info(),
+        "settings": {"prompts": len(prompts), "warmup": args.warmup, "cold": args.cold, **replay_settings},
+        "replay_requests": app_main.replay_backend.stats(),
+        "results": results
+    })
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results, args.baseline, ("mode", "concurrency"), ("latency_ms", "p95"), args.max_regression
+        )
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
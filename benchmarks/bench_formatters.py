@@ -0,0 +1,257 @@
+"""
+Cost Formatter Micro-Benchmarks
+Times AzureCostManager._format_* on synthetic query results from 1k to 1M rows, with peak memory,
+against vectorized (NumPy) and sort/heap-based alternatives
+
+Usage:
+    python benchmarks/bench_formatters.py --sizes 1000,10000,100000,1000000 --output formatters.json
+    python benchmarks/bench_formatters.py --formatters resource --top 10 --baseline formatters.json
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from common import compare_to_baseline, environment_info, summarize, write_results
+
+os.environ.setdefault("AZURE_SUBSCRIPTION_ID", "00000000-0000-0000-0000-000000000001")
+
+from azure_cost_manager import AzureCostManager
+from cost_cube import format_usage_date
+
+
+# Synthetic rows in the shape the Cost Management query API returns: [cost, <grouping>, currency]
+
+def daily_rows(n: int, rng: np.random.Generator) -> List[List[Any]]:
+    first = date(2020, 1, 1).toordinal()
+    costs = rng.lognormal(5, 1.5, n).tolist()
+    return [[cost, format_usage_date(first + i), "USD"] for i, cost in enumerate(costs)]
+
+
+def labelled_rows(prefix: str) -> Callable[[int, np.random.Generator], List[List[Any]]]:
+    def build(n: int, rng: np.random.Generator) -> List[List[Any]]:
+        costs = rng.lognormal(3, 2.0, n).tolist()
+        return [[cost, f"{prefix}-{i}", "USD"] for i, cost in enumerate(costs)]
+    return build
+
+
+def resource_rows(n: int, rng: np.random.Generator) -> List[List[Any]]:
+    costs = rng.lognormal(3, 2.0, n).tolist()
+    return [
+        [cost, f"/subscriptions/00000000-0000-0000-0000-000000000001/resourceGroups/rg-{i % 500}"
+               f"/providers/Microsoft.Compute/virtualMachines/vm-{i}", "USD"]
+        for i, cost in enumerate(costs)
+    ]
+
+
+# Alternatives returning the same result shape as the formatter they stand in for
+
+def _columns(rows, default_label: str):
+    rows = rows or []
+    costs = np.fromiter((float(row[0]) if row else 0.0 for row in rows), dtype=np.float64, count=len(rows))
+    labels = [str(row[1]) if len(row) > 1 else default_label for row in rows]
+    return costs, labels
+
+
+def vectorized_series(key: str, round_costs: bool):
+    def format_rows(rows) -> Dict[str, Any]:
+        costs, dates = _columns(rows, "")
+        values = (np.round(costs, 2) if round_costs else costs).tolist()
+        return {
+            "total_cost": round(float(costs.sum()), 2),
+            "currency": "USD",
+            key: [{"date": d, "cost": cost} for d, cost in zip(dates, values)]
+        }
+    return format_rows
+
+
+def vectorized_grouped(key: str, label: str):
+    def format_rows(rows) -> Dict[str, Any]:
+        costs, labels = _columns(rows, "Unknown")
+        rounded = np.round(costs, 2)
+        # Stable descending sort on the rounded cost, like list.sort(reverse=True)
+        order = np.argsort(-rounded, kind="stable").tolist()
+        values = rounded.tolist()
+        return {
+            "total_cost": round(float(costs.sum()), 2),
+            "currency": "USD",
+            key: [{label: labels[i], "cost": values[i]} for i in order]
+        }
+    return format_rows
+
+
+def _resource_entry(resource_id: str, cost: float) -> Dict[str, Any]:
+    return {
+        "resource_name": resource_id.split('/')[-1] if '/' in resource_id else resource_id,
+        "resource_id": resource_id,
+        "cost": round(cost, 2)
+    }
+
+
+def full_sort_resources(rows, top: int) -> Dict[str, Any]:
+    """Build every entry, sort the whole list and slice"""
+    entries = []
+    total_cost = 0.0
+    for position, row in enumerate(rows or []):
+        cost = float(row[0]) if row and len(row) > 0 else 0.0
+        total_cost += cost
+        entries.append((cost, position, str(row[1]) if len(row) > 1 else "Unknown"))
+    entries.sort(key=lambda entry: (-entry[0], entry[1]))
+    top_resources = [_resource_entry(resource_id, cost) for cost, _, resource_id in entries[:max(top, 0)]]
+    return {"total_cost": round(total_cost, 2), "currency": "USD", "top_resources": top_resources,
+            "count": len(top_resources)}
+
+
+def argpartition_resources(rows, top: int) -> Dict[str, Any]:
+    """Select the top N with np.argpartition, then order only those"""
+    costs, resource_ids = _columns(rows, "Unknown")
+    top = min(max(top, 0), len(costs))
+    if top:
+        candidates = np.argpartition(-costs, top - 1)[:top]
+        # Highest cost first; earlier rows win ties
+        chosen = candidates[np.lexsort((candidates, -costs[candidates]))].tolist()
+    else:
+        chosen = []
+    top_resources = [_resource_entry(resource_ids[i], float(costs[i])) for i in chosen]
+    return {"total_cost": round(float(costs.sum()), 2), "currency": "USD", "top_resources": top_resources,
+            "count": len(top_resources)}
+
+
+def formatters(manager: AzureCostManager, top: int) -> Dict[str, Dict[str, Any]]:
+    """Formatter name -> row generator and {variant: callable}; "current" is the shipped code"""
+    return {
+        "cost": {
+            "rows": daily_rows,
+            "variants": {
+                "current": manager._format_cost_result,
+                "vectorized": vectorized_series("daily_breakdown", round_costs=False),
+            }
+        },
+        "daily": {
+            "rows": daily_rows,
+            "variants": {
+                "current": manager._format_daily_cost_result,
+                "vectorized": vectorized_series("daily_costs", round_costs=True),
+            }
+        },
+        "service": {
+            "rows": labelled_rows("Service"),
+            "variants": {
+                "current": manager._format_service_cost_result,
+                "vectorized": vectorized_grouped("services", "service"),
+            }
+        },
+        "resource_group": {
+            "rows": labelled_rows("rg"),
+            "variants": {
+                "current": manager._format_resource_group_cost_result,
+                "vectorized": vectorized_grouped("resource_groups", "resource_group"),
+            }
+        },
+        "resource": {
+            "rows": resource_rows,
+            "variants": {
+                "current": lambda rows: manager._format_resource_cost_result(rows, top),
+                "full_sort": lambda rows: full_sort_resources(rows, top),
+                "argpartition": lambda rows: argpartition_resources(rows, top),
+            }
+        },
+    }
+
+
+def same_result(expected: Dict[str, Any], actual: Dict[str, Any]) -> bool:
+    """Equal results, allowing for summation-order differences in the total"""
+    if set(expected) != set(actual) or "error" in actual:
+        return False
+    return all(
+        abs(expected[key] - actual[key]) <= 0.011 if key == "total_cost" else expected[key] == actual[key]
+        for key in expected
+    )
+
+
+def measure(func: Callable[[Any], Any], rows: List[List[Any]], repeats: int) -> Dict[str, Any]:
+    """Wall time over `repeats` runs, then one traced run for peak allocation"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(rows)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        func(rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_ms": {**summarize(timings), "min": round(min(timings), 2)},
+        "peak_kib": round(peak / 1024, 1),
+        "ns_per_row": round(min(timings) * 1e6 / max(len(rows), 1), 1)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cost result formatter micro-benchmarks")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated row counts")
+    parser.add_argument("--formatters", default="", help="Comma-separated subset (cost, daily, service, resource_group, resource)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per variant and size")
+    parser.add_argument("--top", type=int, default=10, help="top for the resource formatter")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="Results file (- for stdout)")
+    parser.add_argument("--baseline", help="Earlier results file to compare min time against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed min-time increase vs baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    suite = formatters(AzureCostManager(), args.top)
+    selected = [name.strip() for name in args.formatters.split(",") if name.strip()] or list(suite)
+
+    results = []
+    for name in selected:
+        spec = suite[name]
+        for size in sizes:
+            rows = spec["rows"](size, np.random.default_rng(args.seed))
+            expected = spec["variants"]["current"](rows)
+            for variant, func in spec["variants"].items():
+                row = {
+                    "formatter": name,
+                    "variant": variant,
+                    "rows": size,
+                    "matches_current": variant == "current" or same_result(expected, func(rows)),
+                    **measure(func, rows, args.repeats)
+                }
+                results.append(row)
+                print(
+                    f"{name:>14} {variant:>12} rows={size:<8} min={row['time_ms']['min']:>9.2f}ms "
+                    f"{row['ns_per_row']:>7.1f}ns/row peak={row['peak_kib']:>10.1f}KiB"
+                    f"{'' if row['matches_current'] else '  MISMATCH'}",
+                    file=sys.stderr
+                )
+            del rows, expected
+
+    write_results(args.output, {
+        "benchmark": "cost_formatters",
+        "environment": environment_info(),
+        "settings": {"sizes": sizes, "repeats": args.repeats, "top": args.top, "seed": args.seed},
+        "results": results
+    })
+
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results, args.baseline, ("formatter", "variant", "rows"), ("time_ms", "min"), args.max_regression
+        )
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
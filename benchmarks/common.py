@@ -0,0 +1,126 @@
+"""
+Benchmark Helpers
+Prompt loading, percentile summaries and machine-readable result files shared by the benchmark scripts
+"""
+
+import os
+import re
+import math
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_PROMPTS_PATH = os.path.join(ROOT, "DEMO_PROMPTS_CONSOLIDATED.md")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_demo_prompts(path: str = DEMO_PROMPTS_PATH, demo_only: bool = False) -> List[Tuple[str, str]]:
+    """
+    Read (prompt_id, prompt) pairs from the demo prompt guide
+
+    Each "### <Category>-<n>: <title>" heading followed by a fenced block is a prompt.
+
+    Args:
+        path: Markdown file to read
+        demo_only: Keep only prompts marked [DEMO]
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    prompts = []
+    pattern = re.compile(r"^### ([\w-]+-\d+):([^\n]*)\n(.*?)^```\n(.*?)\n^```", re.MULTILINE | re.DOTALL)
+    for match in pattern.finditer(text):
+        prompt_id, heading, _, prompt = match.groups()
+        if demo_only and "[DEMO]" not in heading:
+            continue
+        prompts.append((prompt_id, " ".join(prompt.split())))
+    return prompts
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no values)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/mean/max of a list of milliseconds, rounded to 0.01"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(max(values), 2)
+    }
+
+
+def environment_info() -> Dict[str, Any]:
+    """Where and on what code a benchmark ran"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def write_results(path: Optional[str], payload: Dict[str, Any]) -> None:
+    """Write results as JSON to a file, or to stdout when path is "-" """
+    text = json.dumps(payload, indent=2, default=str)
+    if path == "-":
+        print(text)
+    elif path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline_path: str, key_fields: Sequence[str],
+                        metric: Tuple[str, str], max_regression: float) -> List[str]:
+    """
+    Regressions of one metric against a previous results file
+
+    Args:
+        results: Current result rows
+        baseline_path: Results file from an earlier run
+        key_fields: Fields identifying comparable rows (e.g. mode, concurrency)
+        metric: (section, statistic) to compare, e.g. ("latency_ms", "p95")
+        max_regression: Allowed relative increase (0.2 = 20%)
+
+    Returns:
+        One message per regressed row (empty when within bounds)
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {
+            tuple(row.get(field) for field in key_fields): row
+            for row in json.load(f).get("results", [])
+        }
+
+    section, statistic = metric
+    regressions = []
+    for row in results:
+        key = tuple(row.get(field) for field in key_fields)
+        before = (baseline.get(key) or {}).get(section, {}).get(statistic)
+        after = row.get(section, {}).get(statistic)
+        if before and after and after > before * (1 + max_regression):
+            label = ", ".join(f"{field}={value}" for field, value in zip(key_fields, key))
+            regressions.append(f"{label}: {section}.{statistic} {before:.2f} -> {after:.2f} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
@@ -0,0 +1,338 @@
+"""
+Cost Analytics
+Vectorized trend, forecast and anomaly statistics over daily cost series (one row per series, one column per day)
+"""
+
+import calendar
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cost_cube import parse_usage_date
+
+
+# Scales the median absolute deviation to a standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+# Same for the mean absolute deviation, used when more than half the baseline days are identical
+MEAN_AD_SCALE = 1.2533
+
+# z value of the two-sided 90% range reported with forecasts
+FORECAST_Z = 1.645
+
+# Weekday profiles need at least this many days; a weekday averaging below this share of a normal
+# day (e.g. no weekend usage) makes the profile unusable for de-seasonalizing
+MIN_SEASONAL_DAYS = 14
+MIN_WEEKDAY_FACTOR = 0.1
+# Profiles whose weekdays all lie within this share of the mean are treated as noise
+MIN_SEASONAL_AMPLITUDE = 0.1
+
+
+def series_from_rows(rows: Iterable[Sequence[Any]], start_date: date, end_date: date,
+                     grouped: bool) -> Tuple[List[str], np.ndarray]:
+    """
+    Dense daily cost matrix from Cost Management Daily rows ([cost, UsageDate, <grouping>, ...])
+
+    Args:
+        rows: Query rows
+        start_date: First day (column 0)
+        end_date: Last day
+        grouped: Rows carry a grouping column; otherwise they form the single "Total" series
+    """
+    codes: Dict[str, int] = {}
+    series: List[int] = []
+    offsets: List[int] = []
+    costs: List[float] = []
+    base = start_date.toordinal()
+    span = end_date.toordinal() - base + 1
+    for row in rows or []:
+        offset = parse_usage_date(row[1]).toordinal() - base
+        if not 0 <= offset < span:
+            continue
+        label = (str(row[2]) if len(row) > 2 and row[2] else "Unknown") if grouped else "Total"
+        series.append(codes.setdefault(label, len(codes)))
+        offsets.append(offset)
+        costs.append(float(row[0] or 0.0))
+
+    flat = np.asarray(series, dtype=np.int64) * span + np.asarray(offsets, dtype=np.int64)
+    matrix = np.bincount(flat, weights=np.asarray(costs, dtype=np.float64), minlength=len(codes) * span)
+    return list(codes), matrix.reshape(len(codes), span)
+
+
+def rolling_mean(matrix: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` days per series (over fewer days at the start of the series)"""
+    cumulative = np.cumsum(matrix, axis=1)
+    lagged = np.zeros_like(cumulative)
+    lagged[:, window:] = cumulative[:, :-window]
+    counts = np.minimum(np.arange(1, matrix.shape[1] + 1), window)
+    return (cumulative - lagged) / counts
+
+
+def percent_change(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Relative change in percent; NaN where the previous value is zero"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(previous != 0, (current - previous) / np.abs(previous) * 100.0, np.nan)
+
+
+def weekday_factors(matrix: np.ndarray, first_day: date) -> np.ndarray:
+    """
+    Weekly seasonality per series: median cost on each weekday relative to the mean of those medians
+
+    Returns a (series x 7) array indexed by date.weekday(). Series with fewer than
+    MIN_SEASONAL_DAYS days, no cost, a weekday below MIN_WEEKDAY_FACTOR or no weekday
+    MIN_SEASONAL_AMPLITUDE away from the mean get a flat profile of ones.
+
+    Args:
+        matrix: Daily costs (series x days)
+        first_day: Date of column 0
+    """
+    factors = np.ones((matrix.shape[0], 7))
+    days = matrix.shape[1]
+    if days < MIN_SEASONAL_DAYS or not matrix.size:
+        return factors
+
+    # Whole weeks only, so every weekday is weighted equally
+    weeks = days // 7
+    recent = matrix[:, days - weeks * 7:]
+    start_weekday = (first_day + timedelta(days=days - weeks * 7)).weekday()
+    # Medians, so one anomalous day does not skew its weekday
+    by_weekday = np.median(recent.reshape(matrix.shape[0], weeks, 7), axis=1)
+    by_weekday = np.roll(by_weekday, start_weekday, axis=1)
+    overall = by_weekday.mean(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        measured = by_weekday / overall
+    usable = (
+        (overall[:, 0] > 0)
+        & (measured.min(axis=1) >= MIN_WEEKDAY_FACTOR)
+        & (np.abs(measured - 1.0).max(axis=1) >= MIN_SEASONAL_AMPLITUDE)
+    )
+    factors[usable] = measured[usable]
+    return factors
+
+
+def _weekday_columns(first_day: date, days: int) -> np.ndarray:
+    return (first_day.weekday() + np.arange(days)) % 7
+
+
+def trend_summary(labels: Sequence[str], matrix: np.ndarray, first_day: date, window: int = 7,
+                  top: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Totals, rolling mean and day-over-day / week-over-week changes per series
+
+    Args:
+        labels: Series names, one per row
+        matrix: Daily costs (series x days)
+        first_day: Date of column 0
+        window: Rolling mean window in days
+        top: Only the `top` most expensive series (all when None)
+    """
+    days = matrix.shape[1]
+    totals = matrix.sum(axis=1)
+    order = np.argsort(-totals, kind="stable")[:top]
+
+    rolling = rolling_mean(matrix, window)
+    last = matrix[:, -1] if days else np.zeros(len(labels))
+    previous = matrix[:, -2] if days > 1 else np.zeros(len(labels))
+    this_week = matrix[:, -7:].sum(axis=1)
+    last_week = matrix[:, -14:-7].sum(axis=1) if days >= 14 else np.full(len(labels), np.nan)
+    dod = percent_change(last, previous)
+    wow = percent_change(this_week, last_week)
+    rolling_then = rolling[:, -8] if days >= 8 else np.full(len(labels), np.nan)
+
+    series = []
+    for i in order.tolist():
+        series.append({
+            "name": labels[i],
+            "total_cost": round(float(totals[i]), 2),
+            "daily_average": round(float(totals[i]) / days, 2) if days else 0.0,
+            "rolling_mean": round(float(rolling[i, -1]), 2) if days else 0.0,
+            "rolling_mean_week_ago": _rounded(rolling_then[i]),
+            "last_day_cost": round(float(last[i]), 2),
+            "day_over_day_change": round(float(last[i] - previous[i]), 2),
+            "day_over_day_percent": _rounded(dod[i], 1),
+            "last_7_days_cost": round(float(this_week[i]), 2),
+            "previous_7_days_cost": _rounded(last_week[i]),
+            "week_over_week_percent": _rounded(wow[i], 1)
+        })
+    return {
+        "first_day": first_day.isoformat(),
+        "last_day": (first_day + timedelta(days=days - 1)).isoformat() if days else None,
+        "days": days,
+        "rolling_window_days": window,
+        "series_count": len(labels),
+        "series": series
+    }
+
+
+def forecast_month_end(labels: Sequence[str], matrix: np.ndarray, first_day: date, level_days: int = 7,
+                       top: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Project each series to the end of the month following its last day of actuals
+
+    The remaining days are forecast as the series' recent level (the mean of the last
+    `level_days` days with weekly seasonality removed) times that weekday's seasonal
+    factor. The range is FORECAST_Z standard deviations of the de-seasonalized daily
+    costs, scaled by the square root of the days remaining.
+
+    Args:
+        labels: Series names, one per row
+        matrix: Daily costs (series x days) up to the last complete day
+        first_day: Date of column 0
+        level_days: Days the recent level is averaged over
+        top: Only the `top` series with the highest projection (all when None)
+    """
+    days = matrix.shape[1]
+    last_day = first_day + timedelta(days=days - 1)
+    # The month being forecast is the one the first missing day falls in
+    month_start = (last_day + timedelta(days=1)).replace(day=1)
+    month_end = month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
+    remaining = (month_end - last_day).days
+    elapsed = max(0, (last_day - max(month_start, first_day)).days + 1)
+
+    factors = weekday_factors(matrix, first_day)
+    rows = np.arange(matrix.shape[0])[:, None]
+    seasonal = factors[rows, _weekday_columns(first_day, days)[None, :]]
+    deseasonalized = matrix / seasonal
+
+    level = deseasonalized[:, -level_days:].mean(axis=1) if days else np.zeros(len(labels))
+    future = factors[rows, _weekday_columns(last_day + timedelta(days=1), remaining)[None, :]] * level[:, None]
+    forecast = future.sum(axis=1)
+    month_to_date = matrix[:, days - elapsed:].sum(axis=1) if elapsed else np.zeros(len(labels))
+    spread = deseasonalized.std(axis=1, ddof=1) if days > 1 else np.zeros(len(labels))
+    margin = FORECAST_Z * spread * np.sqrt(remaining)
+    projected = month_to_date + forecast
+
+    order = np.argsort(-projected, kind="stable")[:top]
+    series = [
+        {
+            "name": labels[i],
+            "month_to_date": round(float(month_to_date[i]), 2),
+            "forecast_remaining": round(float(forecast[i]), 2),
+            "projected_month_total": round(float(projected[i]), 2),
+            "projected_low": round(float(month_to_date[i] + max(forecast[i] - margin[i], 0.0)), 2),
+            "projected_high": round(float(projected[i] + margin[i]), 2),
+            "daily_run_rate": round(float(level[i]), 2),
+            "weekly_seasonality": bool(np.any(factors[i] != 1.0))
+        }
+        for i in order.tolist()
+    ]
+    return {
+        "month": month_start.strftime("%Y-%m"),
+        "actuals_through": last_day.isoformat(),
+        "days_elapsed": elapsed,
+        "days_remaining": remaining,
+        "month_to_date": round(float(month_to_date.sum()), 2),
+        "projected_month_total": round(float(projected.sum()), 2),
+        "series_count": len(labels),
+        "series": series
+    }
+
+
+def detect_anomalies(labels: Sequence[str], matrix: np.ndarray, first_day: date, baseline_days: int = 28,
+                     threshold: float = 3.5, min_delta: float = 1.0, check_days: Optional[int] = None,
+                     top: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Flag days whose cost departs from the trailing baseline of their series
+
+    Each day is compared with the `baseline_days` before it, after removing weekly
+    seasonality: the robust score is the distance from the baseline median in MAD
+    units (scaled to standard deviations), the classic z-score the distance from the
+    baseline mean in standard deviations. A day is flagged when both scores reach
+    `threshold` (the robust score alone when the baseline is constant) and it differs
+    from the expected cost by at least `min_delta`. Requiring both keeps the false
+    positive rate of the small-sample MAD down.
+
+    Args:
+        labels: Series names, one per row
+        matrix: Daily costs (series x days), including the baseline before the checked days
+        first_day: Date of column 0
+        baseline_days: Trailing days each day is compared with
+        threshold: Score at which a day is flagged
+        min_delta: Smallest absolute cost difference worth flagging
+        check_days: Only check the last `check_days` days (all days with a full baseline when None)
+        top: Only the `top` anomalies with the largest cost difference (all when None)
+    """
+    days = matrix.shape[1]
+    checked = days - baseline_days
+    if check_days is not None:
+        checked = min(checked, check_days)
+    if checked <= 0 or not matrix.size:
+        return {"anomalies": [], "checked_days": 0, "series_count": len(labels)}
+
+    factors = weekday_factors(matrix, first_day)
+    rows = np.arange(matrix.shape[0])[:, None]
+    seasonal = factors[rows, _weekday_columns(first_day, days)[None, :]]
+    adjusted = matrix / seasonal
+
+    # windows[s, t] holds the baseline for checked day t (the baseline_days before it)
+    first_checked = days - checked
+    history = adjusted[:, first_checked - baseline_days:days - 1]
+    windows = sliding_window_view(history, baseline_days, axis=1)
+    values = adjusted[:, first_checked:]
+    median = _window_median(windows)
+    mad = _window_median(np.abs(windows - median[..., None])) * MAD_SCALE
+    flat = mad == 0
+    if flat.any():
+        # More than half the baseline is one value: fall back to the mean absolute deviation
+        constant = windows[flat]
+        mad[flat] = np.abs(constant - constant.mean(axis=1, keepdims=True)).mean(axis=1) * MEAN_AD_SCALE
+    # Flat baselines have no spread; a one-cent floor keeps their scores finite
+    scale = np.maximum(mad, 0.01)
+    robust = (values - median) / scale
+
+    # Window means and standard deviations from running sums, without materializing the windows
+    sums = np.zeros((history.shape[0], history.shape[1] + 1))
+    squares = np.zeros_like(sums)
+    np.cumsum(history, axis=1, out=sums[:, 1:])
+    np.cumsum(history * history, axis=1, out=squares[:, 1:])
+    total = sums[:, baseline_days:] - sums[:, :-baseline_days]
+    mean = total / baseline_days
+    variance = (squares[:, baseline_days:] - squares[:, :-baseline_days] - total * mean) / (baseline_days - 1)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        classic = np.where(std > 1e-9 * np.maximum(np.abs(mean), 1.0), (values - mean) / std, np.nan)
+
+    day_seasonal = seasonal[:, first_checked:]
+    expected = median * day_seasonal
+    delta = matrix[:, first_checked:] - expected
+    agree = np.isnan(classic) | (np.abs(classic) >= threshold)
+    flagged_series, flagged_days = np.nonzero((np.abs(robust) >= threshold) & agree & (np.abs(delta) >= min_delta))
+    order = np.argsort(-np.abs(delta[flagged_series, flagged_days]), kind="stable")[:top]
+
+    anomalies = []
+    for k in order.tolist():
+        i, t = int(flagged_series[k]), int(flagged_days[k])
+        anomalies.append({
+            "name": labels[i],
+            "date": (first_day + timedelta(days=first_checked + t)).isoformat(),
+            "cost": round(float(matrix[i, first_checked + t]), 2),
+            "expected_cost": round(float(expected[i, t]), 2),
+            "difference": round(float(delta[i, t]), 2),
+            "direction": "spike" if delta[i, t] > 0 else "drop",
+            "robust_score": round(float(robust[i, t]), 1),
+            "z_score": _rounded(classic[i, t], 1)
+        })
+    return {
+        "checked_from": (first_day + timedelta(days=first_checked)).isoformat(),
+        "checked_to": (first_day + timedelta(days=days - 1)).isoformat(),
+        "checked_days": checked,
+        "baseline_days": baseline_days,
+        "threshold": threshold,
+        "series_count": len(labels),
+        "anomaly_count": len(flagged_series),
+        "anomalies": anomalies
+    }
+
+
+def _window_median(windows: np.ndarray) -> np.ndarray:
+    """Median over the last axis; sorting short windows is several times faster than np.median here"""
+    ordered = np.sort(windows, axis=-1)
+    size = ordered.shape[-1]
+    if size % 2:
+        return ordered[..., size // 2]
+    return (ordered[..., size // 2 - 1] + ordered[..., size // 2]) / 2
+
+
+def _rounded(value: float, digits: int = 2) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
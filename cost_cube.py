@@ -0,0 +1,227 @@
+"""
+Cost Cube
+In-memory columnar store of daily costs by resource and service, answering cost breakdowns by local roll-up
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+COST_COLUMNS = ("cost", "pretaxcost", "costusd", "totalcost")
+DATE_COLUMNS = ("usagedate",)
+RESOURCE_COLUMNS = ("resourceid",)
+SERVICE_COLUMNS = ("servicename",)
+
+
+def parse_usage_date(value: Any) -> date:
+    """Parse a Cost Management UsageDate (20240115 or '2024-01-15T00:00:00') into a date"""
+    if isinstance(value, (int, float)):
+        number = int(value)
+        return date(number // 10000, (number // 100) % 100, number % 100)
+    text = str(value)
+    if text.isdigit() and len(text) == 8:
+        return date(int(text[:4]), int(text[4:6]), int(text[6:8]))
+    return datetime.fromisoformat(text[:10]).date()
+
+
+def format_usage_date(ordinal: int) -> int:
+    """Format a date ordinal back into the API's YYYYMMDD integer form"""
+    d = date.fromordinal(int(ordinal))
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def normalize_resource_id(resource_id: str) -> str:
+    """Normalize an ARM resource ID for joins: lower-case, no trailing slash"""
+    return resource_id.strip().rstrip("/").lower()
+
+
+def resource_group_from_id(resource_id: str) -> str:
+    """Extract the (lower-case) resource group name from an ARM resource ID"""
+    parts = resource_id.lower().split("/")
+    try:
+        return parts[parts.index("resourcegroups") + 1]
+    except (ValueError, IndexError):
+        return ""
+
+
+def _column_index(names: Sequence[str], candidates: Sequence[str], default: int) -> int:
+    for i, name in enumerate(names):
+        if name.lower() in candidates:
+            return i
+    return default
+
+
+class CostCube:
+    def __init__(self, scope: str, start_date: date, end_date: date,
+                 day: np.ndarray, resource_idx: np.ndarray, service_idx: np.ndarray, cost: np.ndarray,
+                 resource_ids: List[str], services: List[str]):
+        """
+        Initialize a cost cube from already-encoded columns
+
+        Args:
+            scope: Azure scope the cube was fetched for
+            start_date: First day covered by the cube
+            end_date: Last day covered by the cube
+            day: Date ordinal per row
+            resource_idx: Index into resource_ids per row
+            service_idx: Index into services per row
+            cost: Cost per row
+            resource_ids: Distinct resource IDs
+            services: Distinct service names
+        """
+        self.scope = scope
+        self.start_date = start_date
+        self.end_date = end_date
+        self.day = day
+        self.resource_idx = resource_idx
+        self.service_idx = service_idx
+        self.cost = cost
+        self.resource_ids = resource_ids
+        self.services = services
+        self._codes: Optional[Dict[str, int]] = None
+
+        # Resource groups are derived from the resource ID rather than queried, since
+        # Cost Management allows at most two grouping dimensions per query
+        rg_codes: Dict[str, int] = {}
+        rg_of_resource = np.empty(len(resource_ids), dtype=np.int32)
+        for i, resource_id in enumerate(resource_ids):
+            rg_of_resource[i] = rg_codes.setdefault(resource_group_from_id(resource_id), len(rg_codes))
+        self.resource_groups = list(rg_codes)
+        self.rg_idx = rg_of_resource[resource_idx] if len(resource_idx) else np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def from_rows(cls, scope: str, start_date: date, end_date: date,
+                  columns: Optional[Sequence[str]], rows: Iterable[Sequence[Any]]) -> "CostCube":
+        """
+        Build a cube from Cost Management rows grouped by ResourceId and ServiceName
+
+        Args:
+            scope: Azure scope the rows were fetched for
+            start_date: First day covered
+            end_date: Last day covered
+            columns: Column names of the result (positional defaults are used if missing)
+            rows: Iterable of result rows; consumed once
+        """
+        names = list(columns or [])
+        cost_i = _column_index(names, COST_COLUMNS, 0)
+        date_i = _column_index(names, DATE_COLUMNS, 1)
+        resource_i = _column_index(names, RESOURCE_COLUMNS, 2)
+        service_i = _column_index(names, SERVICE_COLUMNS, 3)
+
+        resource_codes: Dict[str, int] = {}
+        service_codes: Dict[str, int] = {}
+        days: List[int] = []
+        resources: List[int] = []
+        services: List[int] = []
+        costs: List[float] = []
+
+        for row in rows:
+            days.append(parse_usage_date(row[date_i]).toordinal())
+            resources.append(resource_codes.setdefault(normalize_resource_id(str(row[resource_i] or "")), len(resource_codes)))
+            services.append(service_codes.setdefault(str(row[service_i] or "Unknown"), len(service_codes)))
+            costs.append(float(row[cost_i] or 0.0))
+
+        return cls(
+            scope=scope,
+            start_date=start_date,
+            end_date=end_date,
+            day=np.asarray(days, dtype=np.int32),
+            resource_idx=np.asarray(resources, dtype=np.int32),
+            service_idx=np.asarray(services, dtype=np.int32),
+            cost=np.asarray(costs, dtype=np.float64),
+            resource_ids=list(resource_codes),
+            services=list(service_codes)
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the cube's columns and label tables"""
+        arrays = self.day.nbytes + self.resource_idx.nbytes + self.service_idx.nbytes + self.cost.nbytes + self.rg_idx.nbytes
+        labels = sum(len(s) + 49 for s in self.resource_ids) + sum(len(s) + 49 for s in self.services)
+        return arrays + labels
+
+    def covers(self, start_date: date, end_date: date) -> bool:
+        """Whether the requested window lies within the cube"""
+        return self.start_date <= start_date and end_date <= self.end_date
+
+    def total(self, start_date: date, end_date: date) -> float:
+        """Total cost in the window"""
+        return float(self.cost[self._mask(start_date, end_date)].sum())
+
+    def daily_totals(self, start_date: date, end_date: date) -> List[Tuple[float, int]]:
+        """
+        Cost per day in the window as (cost, YYYYMMDD) rows, oldest first
+
+        Days with no usage rows are omitted, matching the API's behaviour.
+        """
+        mask = self._mask(start_date, end_date)
+        offsets = self.day[mask] - self.start_date.toordinal()
+        span = self.end_date.toordinal() - self.start_date.toordinal() + 1
+        sums = np.bincount(offsets, weights=self.cost[mask], minlength=span)
+        present = np.bincount(offsets, minlength=span) > 0
+        base = self.start_date.toordinal()
+        return [(float(sums[i]), format_usage_date(base + i)) for i in np.flatnonzero(present)]
+
+    def by_service(self, start_date: date, end_date: date) -> List[Tuple[float, str]]:
+        """Cost per service in the window as (cost, service) rows"""
+        return self._rollup(self.service_idx, self.services, start_date, end_date)
+
+    def by_resource_group(self, start_date: date, end_date: date) -> List[Tuple[float, str]]:
+        """Cost per resource group in the window as (cost, resource group) rows"""
+        return self._rollup(self.rg_idx, self.resource_groups, start_date, end_date)
+
+    def by_resource(self, start_date: date, end_date: date) -> List[Tuple[float, str]]:
+        """Cost per resource in the window as (cost, resource ID) rows"""
+        return self._rollup(self.resource_idx, self.resource_ids, start_date, end_date)
+
+    def costs_for(self, resource_ids: Iterable[str], start_date: date, end_date: date) -> Dict[str, float]:
+        """Cost in the window for each of the given (normalized) resource IDs that has usage"""
+        mask = self._mask(start_date, end_date)
+        sums = np.bincount(self.resource_idx[mask], weights=self.cost[mask], minlength=len(self.resource_ids))
+        codes = self._resource_codes()
+        return {rid: float(sums[codes[rid]]) for rid in resource_ids if rid in codes}
+
+    def daily_series(self, dimension: str, start_date: date, end_date: date) -> Tuple[List[str], np.ndarray]:
+        """
+        Dense daily cost matrix for a dimension: one row per series with usage in the window, one column per day
+
+        Days without usage rows are zero.
+
+        Args:
+            dimension: "total", "service", "resource_group" or "resource"
+            start_date: First day (column 0)
+            end_date: Last day
+        """
+        if dimension == "total":
+            codes, labels = np.zeros(len(self.day), dtype=np.int32), ["Total"]
+        elif dimension == "service":
+            codes, labels = self.service_idx, self.services
+        elif dimension == "resource_group":
+            codes, labels = self.rg_idx, self.resource_groups
+        elif dimension == "resource":
+            codes, labels = self.resource_idx, self.resource_ids
+        else:
+            raise ValueError(f"Unknown cost dimension: {dimension}")
+
+        mask = self._mask(start_date, end_date)
+        span = end_date.toordinal() - start_date.toordinal() + 1
+        flat = codes[mask].astype(np.int64) * span + (self.day[mask] - start_date.toordinal())
+        matrix = np.bincount(flat, weights=self.cost[mask], minlength=len(labels) * span).reshape(len(labels), span)
+        present = np.flatnonzero(np.bincount(codes[mask], minlength=len(labels)) > 0)
+        return [labels[i] for i in present], matrix[present]
+
+    def _resource_codes(self) -> Dict[str, int]:
+        if self._codes is None:
+            self._codes = {rid: i for i, rid in enumerate(self.resource_ids)}
+        return self._codes
+
+    def _mask(self, start_date: date, end_date: date) -> np.ndarray:
+        return (self.day >= start_date.toordinal()) & (self.day <= end_date.toordinal())
+
+    def _rollup(self, codes: np.ndarray, labels: List[str], start_date: date, end_date: date) -> List[Tuple[float, str]]:
+        mask = self._mask(start_date, end_date)
+        sums = np.bincount(codes[mask], weights=self.cost[mask], minlength=len(labels))
+        present = np.bincount(codes[mask], minlength=len(labels)) > 0
+        return [(float(sums[i]), labels[i]) for i in np.flatnonzero(present)]
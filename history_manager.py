@@ -0,0 +1,186 @@
+"""
+Conversation History Manager
+Keeps the conversation within a token budget, folding older turns into a digest of one headline line per turn
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of earlier conversation:"
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    def __init__(self, model: str = "gpt-4", cache_size: int = 10000):
+        """
+        Initialize the counter
+
+        Args:
+            model: Model name used to pick the tiktoken encoding
+            cache_size: Number of per-text counts to remember
+        """
+        self.model = model
+        self._encoding_loaded = False
+        self._encoding_value: Any = None
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def _encoding(self) -> Any:
+        """tiktoken encoding, loaded on first use (None if tiktoken is not installed)"""
+        if not self._encoding_loaded:
+            with self._lock:
+                if not self._encoding_loaded:
+                    try:
+                        import tiktoken
+                        try:
+                            self._encoding_value = tiktoken.encoding_for_model(self.model)
+                        except KeyError:
+                            self._encoding_value = tiktoken.get_encoding("cl100k_base")
+                    except ImportError:  # Optional: fall back to a character-based estimate
+                        logger.warning("tiktoken is not installed; history token budget uses an approximate count")
+                        self._encoding_value = None
+                    self._encoding_loaded = True
+        return self._encoding_value
+
+    def count(self, text: Optional[str]) -> int:
+        """Number of tokens in text (cached by content hash)"""
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        tokens = len(self._encoding.encode(text)) if self._encoding else len(text) // 4 + 1
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to roughly max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        if self._encoding:
+            return self._encoding.decode(self._encoding.encode(text)[:max_tokens]) + " …"
+        return text[:max_tokens * 4] + " …"
+
+
+class HistoryManager:
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        """Initialize the manager from HISTORY_* environment settings"""
+        self.counter = counter or TokenCounter(os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"))
+        self.budget_tokens = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+        self.summary_tokens = int(os.getenv("HISTORY_SUMMARY_TOKENS", "600"))
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        """Tokens a history message costs in the prompt"""
+        return self.counter.count(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+
+    def compact(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Fit a history within the token budget
+
+        The newest turns are kept verbatim while they fit; older turns are folded
+        into a single leading digest message with one line per dropped turn (the
+        question and the first prose line of the answer, not a model-written
+        summary). Once anything is folded, HISTORY_SUMMARY_TOKENS of the budget is
+        reserved for the digest, so the kept turns and the digest together stay
+        within HISTORY_TOKEN_BUDGET. The newest turn is always kept, truncated if it
+        alone exceeds the space left for turns.
+
+        Args:
+            history: Conversation messages, optionally led by a digest message
+
+        Returns:
+            Compacted history (digest message first, if any)
+        """
+        summary = ""
+        if history and history[0].get("role") == "system" and str(history[0].get("content", "")).startswith(SUMMARY_PREFIX):
+            summary = history[0]["content"][len(SUMMARY_PREFIX):].strip()
+            history = history[1:]
+
+        turns = self._split_turns(history)
+        costs = [sum(self.message_tokens(m) for m in turn) for turn in turns]
+        # One threshold for fitting and truncating turns: the whole budget while nothing is folded,
+        # less the digest's allowance once something is
+        budget = self.budget_tokens
+        if summary or sum(costs) > budget:
+            digest_tokens = self.summary_tokens + self.counter.count(SUMMARY_PREFIX + "\n") + MESSAGE_OVERHEAD_TOKENS
+            budget = max(self.budget_tokens - digest_tokens, 1)
+
+        kept: List[List[Dict[str, str]]] = []
+        used = 0
+        for turn, cost in zip(reversed(turns), reversed(costs)):
+            if used + cost > budget and kept:
+                break
+            kept.insert(0, turn)
+            used += cost
+
+        dropped = turns[:len(turns) - len(kept)]
+        if dropped:
+            summary = self._fold(summary, dropped)
+
+        if kept and used > budget:
+            # Each message also pays the chat-format overhead, and truncation appends an ellipsis
+            share = max(budget // len(kept[0]) - MESSAGE_OVERHEAD_TOKENS - 1, 1)
+            kept[0] = [self._truncate_message(m, share) for m in kept[0]]
+
+        compacted = [m for turn in kept for m in turn]
+        if summary:
+            compacted.insert(0, {"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"})
+        return compacted
+
+    def _split_turns(self, history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """Group messages into turns, each starting at a user message"""
+        turns: List[List[Dict[str, str]]] = []
+        for message in history:
+            if message.get("role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _fold(self, summary: str, turns: List[List[Dict[str, str]]]) -> str:
+        """Append one headline line per dropped turn to the digest, keeping its newest lines within HISTORY_SUMMARY_TOKENS"""
+        lines = [line for line in summary.split("\n") if line]
+        for turn in turns:
+            question = next((m.get("content") or "" for m in turn if m.get("role") == "user"), "")
+            answer = next((m.get("content") or "" for m in turn if m.get("role") == "assistant"), "")
+            lines.append(f"- User asked: {self._headline(question, 160)} | Answer: {self._headline(answer, 240)}")
+
+        while len(lines) > 1 and self.counter.count("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def _headline(self, text: str, max_chars: int) -> str:
+        """First prose line of a message (headings only as a fallback), without tables or emphasis"""
+        heading = ""
+        for line in (text or "").splitlines():
+            line = line.strip().replace("**", "")
+            if not line or line.startswith("|"):
+                continue
+            if line.startswith("#"):
+                heading = heading or line.strip("#").strip()
+                continue
+            heading = line
+            break
+        return heading if len(heading) <= max_chars else heading[:max_chars].rstrip() + "…"
+
+    def _truncate_message(self, message: Dict[str, str], max_tokens: int) -> Dict[str, str]:
+        content = message.get("content") or ""
+        return {**message, "content": self.counter.truncate(content, max_tokens)}
@@ -0,0 +1,168 @@
+"""
+Fast-Path Intent Router
+Maps common, unambiguous questions straight to a tool call so the tool-selection completion can be skipped
+"""
+
+import os
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+
+COST_WORDS = re.compile(r"\b(costs?|costing|spend(ing)?|spent|bill(ing|ed)?|charges?|expenses?|paying)\b", re.I)
+
+# Anything suggesting analysis, follow-ups or a narrower scope is left to the model
+DISQUALIFIERS = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|trends?|forecast|predict|why|recommend\w*|optimi[sz]\w*|reduce|sav(e|ings?)|"
+    r"anomal\w*|spikes?|tags?|tagged|unused|orphan\w*|idle|without|daily|per day|each day|"
+    r"those|these|them|it|that one|above|previous answer|instead|also|"
+    r"top \d+|most expensive resources?|subscriptions/)|"
+    r"\b(in|for|within|of)\s+(the\s+|my\s+)?(resource[\s-]?group|subscription)\b(?!s)",
+    re.I
+)
+
+# Rolling windows only: "last 14 days", "past 3 months", "past week". Calendar periods
+# ("last month", "in January") are not rolling windows, so they are left to the model
+PERIOD_NUMBER = re.compile(r"\b(?:last|past|previous)\s+(\d{1,3})\s+(day|week|month)s?\b", re.I)
+PERIOD_WORD = re.compile(r"\bpast\s+(week|month|quarter|year)\b", re.I)
+
+# Words that can surround a routed question without changing what it asks for; any other
+# word (a region, service, month, property filter, ...) narrows the question and stops routing
+FILLER_WORDS = frozenset("""
+    a an the my our me us i we you is are was were am be been do does did have has had
+    what which how much many show list give get tell display see view find know please
+    can could would will should want need there all total overall so far now currently
+    in on over for of to at azure s ve m re d ll
+""".split())
+
+WORD = re.compile(r"[a-z0-9]+", re.I)
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "quarter": 90, "year": 365}
+
+PUBLIC_IP_TYPE = "Microsoft.Network/publicIPAddresses"
+
+
+def period_days(message: str, default: int = 30) -> int:
+    """Look-back window named in the message ("last 14 days", "past quarter"), else the default"""
+    match = PERIOD_NUMBER.search(message)
+    if match:
+        return max(1, int(match.group(1)) * UNIT_DAYS[match.group(2).lower()])
+    match = PERIOD_WORD.search(message)
+    if match:
+        return UNIT_DAYS[match.group(1).lower()]
+    return default
+
+
+# (intent, tool, needs a cost word, takes a rolling period, patterns (any must match),
+#  the intent's own words (allowed besides FILLER_WORDS), build arguments from the message)
+Rule = Tuple[str, str, bool, bool, List[Pattern], FrozenSet[str], Callable[[str], Dict[str, Any]]]
+
+RULES: List[Rule] = [
+    (
+        "current_month_cost", "get_current_month_costs", True, False,
+        [re.compile(r"\b(this|current)\s+month\b|\bmonth[\s-]to[\s-]date\b|\bmtd\b", re.I)],
+        frozenset("this current month to date mtd".split()),
+        lambda message: {}
+    ),
+    (
+        "cost_by_service", "get_costs_by_service", True, True,
+        [re.compile(
+            r"\b(by|per|each|across)\s+(azure\s+)?services?\b|\bwhich\s+(azure\s+)?services?\b|"
+            r"\bservice[\s-]level\b|\bservices?\b.*\b(breakdown|cost the most|most expensive)\b|"
+            r"\bbreakdown\b.*\bservices?\b",
+            re.I
+        )],
+        frozenset("by per each across service services level breakdown break down most expensive".split()),
+        lambda message: {"days": period_days(message)}
+    ),
+    (
+        "cost_by_resource_group", "get_costs_by_resource_group", True, True,
+        [re.compile(
+            r"\b(by|per|each|across)\s+resource[\s-]?groups?\b|\bwhich\s+resource[\s-]?groups?\b|"
+            r"\bresource[\s-]?groups?\b.*\b(breakdown|cost the most|most expensive)\b|"
+            r"\bbreakdown\b.*\bresource[\s-]?groups?\b",
+            re.I
+        )],
+        frozenset(
+            "by per each across resource resources group groups resourcegroup resourcegroups "
+            "level breakdown break down most expensive".split()
+        ),
+        lambda message: {"days": period_days(message)}
+    ),
+    (
+        "resource_count_by_type", "get_resource_count_by_type", False, False,
+        [re.compile(
+            r"\bhow many resources\b|\b(count|number)\s+of\s+resources\b|\bresource\s+counts?\b|"
+            r"\bresources?\b.*\b(by|per|each)\s+(resource\s+)?type\b|\bresource\s+types?\b.*\b(count|how many)\b",
+            re.I
+        )],
+        frozenset("resource resources count counts number by per each type types".split()),
+        lambda message: {}
+    ),
+    (
+        "public_ips", "get_resources_by_type", False, False,
+        [re.compile(r"\bpublic\s+ip(s|\s+address(es)?)?\b", re.I)],
+        frozenset("public ip ips address addresses".split()),
+        lambda message: {"resource_type": PUBLIC_IP_TYPE}
+    ),
+    (
+        "key_vaults", "get_key_vaults", False, False,
+        [re.compile(r"\bkey\s*vaults?\b|\bkeyvaults?\b", re.I)],
+        frozenset("key vault vaults keyvault keyvaults".split()),
+        lambda message: {}
+    ),
+]
+
+
+class IntentRouter:
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        """
+        Initialize the router
+
+        Args:
+            rules: Routing rules (defaults to RULES)
+        """
+        self.enabled = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+        self.max_words = int(os.getenv("FAST_PATH_MAX_WORDS", "30"))
+        self.rules = rules if rules is not None else RULES
+
+    def route(self, message: str) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """
+        The (intent, tool name, arguments) a message unambiguously asks for, or None
+
+        A message is routed only when it is short, names exactly one known intent,
+        mentions costs exactly when the intent is a cost intent, contains nothing
+        suggesting analysis or a follow-up, and has no words beyond the intent's own,
+        cost words, a rolling period (for intents that take one) and filler. Anything
+        else (regions, services, calendar months, property filters, ...) goes to the
+        model as before.
+
+        Args:
+            message: User's input message
+        """
+        if not self.enabled or not message or len(message.split()) > self.max_words:
+            return None
+        if DISQUALIFIERS.search(message):
+            return None
+
+        mentions_cost = bool(COST_WORDS.search(message))
+        matches = [
+            (intent, tool, takes_period, vocabulary, build)
+            for intent, tool, needs_cost, takes_period, patterns, vocabulary, build in self.rules
+            if needs_cost == mentions_cost and any(pattern.search(message) for pattern in patterns)
+        ]
+        if len(matches) != 1:
+            return None
+
+        intent, tool, takes_period, vocabulary, build = matches[0]
+        if self._leftover_words(message, takes_period, vocabulary):
+            return None
+        return intent, tool, build(message)
+
+    def _leftover_words(self, message: str, takes_period: bool, vocabulary: FrozenSet[str]) -> List[str]:
+        """Words the intent does not account for; any of them may narrow the question"""
+        if takes_period:
+            message = PERIOD_WORD.sub(" ", PERIOD_NUMBER.sub(" ", message))
+        return [
+            word for word in WORD.findall(message.lower())
+            if word not in FILLER_WORDS and word not in vocabulary and not COST_WORDS.fullmatch(word)
+        ]
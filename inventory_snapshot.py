@@ -0,0 +1,273 @@
+"""
+Local Inventory Snapshot
+Background-refreshed, indexed copy of the Resource Graph Resources table for sub-millisecond inventory lookups
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from throttle import background_priority
+
+
+logger = logging.getLogger(__name__)
+
+
+# Types whose properties are kept in the snapshot; everything else stores metadata only
+DETAIL_TYPES = (
+    "microsoft.storage/storageaccounts",
+    "microsoft.network/virtualnetworks",
+    "microsoft.network/publicipaddresses",
+    "microsoft.web/sites",
+    "microsoft.sql/servers/databases",
+    "microsoft.keyvault/vaults",
+)
+
+SNAPSHOT_PROJECTION = """
+| project id, name, type, location, resourceGroup, subscriptionId, kind, tags, sku,
+          properties = iff(type in~ ({detail_types}), properties, dynamic(null))
+""".format(detail_types=", ".join(f"'{t}'" for t in DETAIL_TYPES))
+
+# id is projected so Resource Graph pages past the first 1000 changes
+CHANGES_QUERY = """
+resourcechanges
+| extend changeTime = todatetime(properties.changeAttributes.timestamp),
+         targetResourceId = tolower(tostring(properties.targetResourceId)),
+         changeType = tostring(properties.changeType)
+| where changeTime > datetime({since})
+| project id, targetResourceId, changeType, changeTime
+| order by changeTime asc
+"""
+
+
+def _lower(value: Any) -> str:
+    return str(value or "").lower()
+
+
+class InventorySnapshot:
+    def __init__(self, query_fn: Callable[[str], Dict[str, Any]]):
+        """
+        Initialize the snapshot
+
+        Args:
+            query_fn: Callable running a KQL query and returning {"data": [...]} or {"error": ...}
+                      (normally AzureResourceManager.query_resources)
+        """
+        self.query_fn = query_fn
+        self.refresh_interval = float(os.getenv("INVENTORY_REFRESH_SECONDS", "300"))
+        self.full_refresh_interval = float(os.getenv("INVENTORY_FULL_REFRESH_SECONDS", "21600"))
+        self.id_batch_size = int(os.getenv("INVENTORY_ID_BATCH_SIZE", "500"))
+        # Past this age without a successful refresh the snapshot stops answering and helpers query live
+        self.max_staleness = float(os.getenv("INVENTORY_MAX_STALENESS_SECONDS", str(2 * self.full_refresh_interval)))
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._resources: Dict[str, Dict[str, Any]] = {}
+        self._by_type: Dict[str, Set[str]] = defaultdict(set)
+        self._by_location: Dict[str, Set[str]] = defaultdict(set)
+        self._by_resource_group: Dict[str, Set[str]] = defaultdict(set)
+        self._by_tag_key: Dict[str, Set[str]] = defaultdict(set)
+        self._by_tag_value: Dict[tuple, Set[str]] = defaultdict(set)
+
+        self._loaded = False
+        self._stale_logged = False
+        self.version = 0
+        self.last_full_refresh: Optional[float] = None
+        self.last_refresh: Optional[float] = None
+        self._changes_since: Optional[datetime] = None
+
+    @property
+    def ready(self) -> bool:
+        """Loaded, and refreshed successfully within INVENTORY_MAX_STALENESS_SECONDS"""
+        if not self._loaded or self.last_refresh is None:
+            return False
+        if time.monotonic() - self.last_refresh <= self.max_staleness:
+            return True
+        if not self._stale_logged:
+            self._stale_logged = True
+            logger.warning(
+                "Inventory snapshot not refreshed for %.0f seconds; falling back to live queries",
+                time.monotonic() - self.last_refresh
+            )
+        return False
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inventory-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background refresh thread"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        with background_priority():
+            self._refresh_loop()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                due_full = (
+                    self.last_full_refresh is None
+                    or time.monotonic() - self.last_full_refresh >= self.full_refresh_interval
+                )
+                if due_full:
+                    self.refresh_full()
+                else:
+                    self.refresh_incremental()
+            except Exception:
+                logger.exception("Inventory snapshot refresh failed")
+            self._stop.wait(self.refresh_interval)
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    def refresh_full(self) -> None:
+        """Load the whole Resources table and rebuild every index"""
+        started = datetime.utcnow()
+        result = self.query_fn("Resources" + SNAPSHOT_PROJECTION)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+
+        resources = {}
+        for row in result.get("data") or []:
+            resources[_lower(row.get("id"))] = row
+
+        with self._lock:
+            self._resources = {}
+            for index in (self._by_type, self._by_location, self._by_resource_group, self._by_tag_key, self._by_tag_value):
+                index.clear()
+            for resource_id, row in resources.items():
+                self._add(resource_id, row)
+            self._changes_since = started
+            self.last_full_refresh = time.monotonic()
+            self.last_refresh = self.last_full_refresh
+            self.version += 1
+            self._loaded = True
+            self._stale_logged = False
+        logger.info("Inventory snapshot loaded %d resources", len(resources))
+
+    def refresh_incremental(self) -> None:
+        """Apply creates, updates and deletes recorded in resourcechanges since the last refresh"""
+        if self._changes_since is None:
+            self.refresh_full()
+            return
+
+        started = datetime.utcnow()
+        # Overlap the window slightly: change records can land a few minutes late
+        since = (self._changes_since - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        result = self.query_fn(CHANGES_QUERY.format(since=since))
+        if "error" in result:
+            raise RuntimeError(result["error"])
+
+        last_change: Dict[str, str] = {}
+        for change in result.get("data") or []:
+            last_change[_lower(change.get("targetResourceId"))] = str(change.get("changeType", ""))
+
+        deleted = {rid for rid, change_type in last_change.items() if change_type.lower() == "delete"}
+        changed = [rid for rid in last_change if rid and rid not in deleted]
+
+        fetched: Dict[str, Dict[str, Any]] = {}
+        for i in range(0, len(changed), self.id_batch_size):
+            batch = changed[i:i + self.id_batch_size]
+            ids = ", ".join("'" + rid.replace("'", "") + "'" for rid in batch)
+            batch_result = self.query_fn(f"Resources | where tolower(id) in ({ids})" + SNAPSHOT_PROJECTION)
+            if "error" in batch_result:
+                raise RuntimeError(batch_result["error"])
+            for row in batch_result.get("data") or []:
+                fetched[_lower(row.get("id"))] = row
+
+        with self._lock:
+            for resource_id in deleted.union(changed):
+                self._remove(resource_id)
+            for resource_id, row in fetched.items():
+                self._add(resource_id, row)
+            self._changes_since = started
+            self.last_refresh = time.monotonic()
+            self._stale_logged = False
+            if last_change:
+                self.version += 1
+        if last_change:
+            logger.info("Inventory snapshot applied %d changes (%d deleted)", len(last_change), len(deleted))
+
+    def _add(self, resource_id: str, row: Dict[str, Any]) -> None:
+        self._resources[resource_id] = row
+        self._by_type[_lower(row.get("type"))].add(resource_id)
+        self._by_location[_lower(row.get("location"))].add(resource_id)
+        self._by_resource_group[_lower(row.get("resourceGroup"))].add(resource_id)
+        for key, value in (row.get("tags") or {}).items():
+            self._by_tag_key[_lower(key)].add(resource_id)
+            self._by_tag_value[(_lower(key), _lower(value))].add(resource_id)
+
+    def _remove(self, resource_id: str) -> None:
+        row = self._resources.pop(resource_id, None)
+        if row is None:
+            return
+        self._by_type[_lower(row.get("type"))].discard(resource_id)
+        self._by_location[_lower(row.get("location"))].discard(resource_id)
+        self._by_resource_group[_lower(row.get("resourceGroup"))].discard(resource_id)
+        for key, value in (row.get("tags") or {}).items():
+            self._by_tag_key[_lower(key)].discard(resource_id)
+            self._by_tag_value[(_lower(key), _lower(value))].discard(resource_id)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot size and freshness"""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "version": self.version,
+                "resources": len(self._resources),
+                "types": sum(1 for ids in self._by_type.values() if ids),
+                "seconds_since_refresh": round(time.monotonic() - self.last_refresh, 1) if self.last_refresh else None
+            }
+
+    def resources_of_type(self, resource_type: str) -> List[Dict[str, Any]]:
+        """All resources of a type (case-insensitive)"""
+        with self._lock:
+            return self._rows(self._by_type.get(_lower(resource_type), ()))
+
+    def resources_with_tag(self, tag_name: str, tag_value: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resources carrying a tag, optionally with a specific value (case-insensitive)"""
+        with self._lock:
+            if tag_value:
+                ids = self._by_tag_value.get((_lower(tag_name), _lower(tag_value)), ())
+            else:
+                ids = self._by_tag_key.get(_lower(tag_name), ())
+            return self._rows(ids)
+
+    def count_by_type(self, location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resource counts per type, optionally within one location, largest first"""
+        with self._lock:
+            if location:
+                ids = self._by_location.get(_lower(location), ())
+                counts = Counter(_lower(self._resources[rid].get("type")) for rid in ids)
+            else:
+                counts = Counter({rtype: len(ids) for rtype, ids in self._by_type.items() if ids})
+        return [{"type": rtype, "count_": count} for rtype, count in counts.most_common()]
+
+    def search(self, term: str) -> List[Dict[str, Any]]:
+        """Resources whose name contains the term (case-insensitive)"""
+        needle = _lower(term)
+        with self._lock:
+            return [row for row in self._resources.values() if needle in _lower(row.get("name"))]
+
+    def _rows(self, ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return [self._resources[rid] for rid in sorted(ids) if rid in self._resources]
@@ -3,43 +3,201 @@ Azure Cost Intelligence Agent - Main Application
 Provides conversational AI interface for Azure cost management and resource queries
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import os
-from dotenv import load_dotenv
-import json
-from datetime import datetime, timedelta
-
-from azure_cost_manager import AzureCostManager
-from azure_resource_manager import AzureResourceManager
-from openai_agent import OpenAIAgent
-
-# Load environment variables
+from startup_report import StartupReport
+
+# Started first so the report covers every import below
+startup_report = StartupReport()
+
+with startup_report.phase("import_web"):
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+    from pydantic import BaseModel
+    from typing import List, Dict, Any, Optional
+    import os
+    from dotenv import load_dotenv
+    import json
+    import time
+    import uuid
+    import asyncio
+    import logging
+    from datetime import datetime, timedelta
+
+# Load environment variables before the app modules, some of which read settings at import
+# (e.g. TOOL_TIMEOUT_SECONDS and COST_TOOL_TIMEOUT_SECONDS)
 load_dotenv()
 
+# Azure SDK and OpenAI modules are imported lazily, when their clients are first built
+with startup_report.phase("import_app"):
+    from azure_cost_manager import AzureCostManager
+    from azure_resource_manager import AzureResourceManager
+    from openai_agent import OpenAIAgent
+    from async_executor import run_blocking, shutdown_executor
+    from azure_clients import MANAGEMENT_SCOPE, close_clients, get_credential
+    from session_store import create_session_store
+    from throttle import get_scheduler
+    import telemetry
+
+# Offline replay: local stand-ins for Azure and Azure OpenAI (load and performance testing, no network)
+if os.getenv("OFFLINE_REPLAY", "false").lower() == "true":
+    with startup_report.phase("install_replay"):
+        import offline_replay
+        replay_backend = offline_replay.install()
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Azure Cost Intelligence Agent",
     description="AI-powered Azure cost and resource management",
     version="1.0.0"
 )
 
-# Initialize managers
-cost_manager = AzureCostManager()
-resource_manager = AzureResourceManager()
-ai_agent = OpenAIAgent(cost_manager, resource_manager)
+# Initialize managers (cheap: SDK clients and credentials are built on first use)
+with startup_report.phase("init_managers"):
+    cost_manager = AzureCostManager()
+    resource_manager = AzureResourceManager()
+    ai_agent = OpenAIAgent(cost_manager, resource_manager)
+
+# Conversation history lives server-side; clients only send the new message and a session ID
+with startup_report.phase("init_sessions"):
+    session_store = create_session_store()
+
+# Background warm-up after startup: (step name, blocking callable), run in order
+WARMUP_STEPS = (
+    ("management_token", lambda: get_credential().prefetch(MANAGEMENT_SCOPE)),
+    ("openai_client", ai_agent.warm_up),
+    ("resource_graph", resource_manager.warm_up),
+    ("cost_cube", cost_manager.warm_up),
+)
+
+
+def collect_metrics():
+    """Counters kept by the caches, coalescer and throttle scheduler, read when /metrics is scraped"""
+    cache = cost_manager.get_cache_stats()
+    yield "cost_cache_hits_total", "counter", "Cost query cache hits", [({}, cache["hits"])]
+    yield "cost_cache_misses_total", "counter", "Cost query cache misses", [({}, cache["misses"])]
+    yield "cost_cache_hit_ratio", "gauge", "Cost query cache hit ratio", [({}, cache["hit_ratio"])]
+    yield "cost_cache_bytes", "gauge", "Cost query cache size", [({}, cache["bytes"])]
+    
+    answers = ai_agent.answer_cache.stats()
+    yield "answer_cache_hits_total", "counter", "Chat answers reused without the answering completion", [
+        ({}, answers["hits"])
+    ]
+    yield "answer_cache_misses_total", "counter", "Chat answers that needed the answering completion", [
+        ({}, answers["misses"])
+    ]
+    
+    coalescing = ai_agent.single_flight.stats()
+    yield "tool_calls_coalesced_total", "counter", "Tool calls served by an identical in-flight call", [
+        ({}, coalescing["coalesced"])
+    ]
+    
+    throttle = get_scheduler().stats()
+    for name, field, documentation in (
+        ("azure_api_calls_total", "calls", "Azure API calls requested"),
+        ("azure_api_throttled_total", "throttled", "Azure API calls answered with 429"),
+        ("azure_api_retries_total", "retries", "Azure API calls retried after 429 or 5xx"),
+        ("azure_api_queue_seconds_total", "waited_seconds", "Time Azure API calls waited for a rate-limit token"),
+    ):
+        yield name, "counter", documentation, [({"api": api}, counters[field]) for api, counters in throttle.items()]
+    
+    inventory = resource_manager.inventory.stats()
+    yield "inventory_snapshot_resources", "gauge", "Resources in the local inventory snapshot", [
+        ({}, inventory["resources"])
+    ]
+
+
+telemetry.registry.register_collector(collect_metrics)
 
 
 class ChatMessage(BaseModel):
     message: str
-    conversation_history: Optional[List[Dict[str, str]]] = []
+    session_id: Optional[str] = None
+    # Legacy clients may still post their transcript; it seeds a new session only
+    conversation_history: Optional[List[Dict[str, str]]] = None
 
 
 class ChatResponse(BaseModel):
     response: str
-    conversation_history: List[Dict[str, str]]
+    session_id: str
+
+
+async def load_session(request: ChatMessage):
+    """Return (session_id, conversation_history) for a chat request"""
+    session_id = request.session_id or uuid.uuid4().hex
+    # The SQLite store does file I/O, so session access stays off the event loop
+    state = await run_blocking(session_store.load, session_id)
+    if state is not None:
+        return session_id, state.get("history", [])
+    return session_id, request.conversation_history or []
+
+
+async def warm_up():
+    """Build clients, fetch tokens and prefetch shared data while the app is already serving"""
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            await run_blocking(step)
+            startup_report.record_warmup(name, started)
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            startup_report.record_warmup(name, started, e)
+    startup_report.mark_warm()
+
+
+@app.on_event("startup")
+async def startup():
+    """Start background refresh of the local inventory snapshot and the warm-up task"""
+    if resource_manager.use_inventory_snapshot:
+        resource_manager.inventory.start()
+    if os.getenv("WARMUP_ENABLED", "true").lower() == "true":
+        # Runs once the server is accepting connections; requests never wait on it
+        app.state.warmup_task = asyncio.create_task(warm_up())
+    startup_report.mark_ready()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background work and release the Azure SDK worker threads and pooled connections"""
+    resource_manager.inventory.stop()
+    shutdown_executor()
+    await close_clients()
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """In-flight gauge and latency histogram per endpoint, measured until the response body is sent"""
+    telemetry.HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+
+    def finish(status: int):
+        telemetry.HTTP_IN_FLIGHT.dec()
+        endpoint = request.scope.get("endpoint")
+        telemetry.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            endpoint=getattr(endpoint, "__name__", "other"),
+            status=status
+        )
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish(500)
+        raise
+
+    # call_next returns once headers are ready; a streamed chat is still running then
+    body = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish(response.status_code)
+
+    response.body_iterator = tracked_body()
+    return response
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -55,25 +213,76 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
+@app.get("/api/stats")
+async def get_stats():
+    """Cache, answer-cache, request-coalescing, throttling, token, session, inventory and startup statistics"""
+    return {
+        "cost_cache": cost_manager.get_cache_stats(),
+        "answer_cache": ai_agent.answer_cache.stats(),
+        "single_flight": ai_agent.single_flight.stats(),
+        "throttle": get_scheduler().stats(),
+        "credential": get_credential().stats(),
+        "startup": startup_report.report(),
+        "sessions": await run_blocking(session_store.stats),
+        "inventory": resource_manager.inventory.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage, tool, Azure call and HTTP latency, tokens, throttling and cache counters"""
+    return PlainTextResponse(telemetry.registry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatMessage):
     """
     Process chat messages and return AI responses
     """
     try:
+        session_id, history = await load_session(request)
         response, updated_history = await ai_agent.process_message(
             request.message,
-            request.conversation_history
+            history
         )
+        await run_blocking(session_store.save, session_id, {"history": updated_history})
         
         return ChatResponse(
             response=response,
-            conversation_history=updated_history
+            session_id=session_id
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatMessage):
+    """
+    Process chat messages, streaming progress and answer tokens as Server-Sent Events
+    """
+    session_id, history = await load_session(request)
+    
+    async def event_stream():
+        async for event in ai_agent.stream_message(request.message, history):
+            if event["type"] == "done":
+                await run_blocking(session_store.save, session_id, {"history": event.pop("conversation_history")})
+                event["session_id"] = session_id
+            yield f"data: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a conversation"""
+    await run_blocking(session_store.delete, session_id)
+    return {"deleted": session_id}
+
+
 @app.get("/api/subscriptions")
 async def get_subscriptions():
     """Get available Azure subscriptions"""
@@ -0,0 +1,786 @@
+"""
+Offline Replay Harness
+Local stand-ins for Cost Management, Resource Graph, subscriptions and Azure OpenAI chat completions,
+installed at the transport level so the whole app runs (and can be load-tested) with no network
+"""
+
+import os
+import io
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+import requests
+import urllib3
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import RequestsTransport
+
+import azure_clients
+
+
+# (ARM type, Cost Management service name, daily cost range in USD)
+RESOURCE_TYPES = (
+    ("Microsoft.Compute/virtualMachines", "Virtual Machines", (2.0, 40.0)),
+    ("Microsoft.Compute/disks", "Storage", (0.1, 3.0)),
+    ("Microsoft.Storage/storageAccounts", "Storage", (0.2, 8.0)),
+    ("Microsoft.Network/virtualNetworks", "Virtual Network", (0.0, 0.5)),
+    ("Microsoft.Network/publicIPAddresses", "Virtual Network", (0.1, 0.2)),
+    ("Microsoft.Network/networkInterfaces", "Virtual Network", (0.0, 0.0)),
+    ("Microsoft.Network/privateEndpoints", "Virtual Network", (0.2, 0.3)),
+    ("Microsoft.Web/serverFarms", "Azure App Service", (1.0, 20.0)),
+    ("Microsoft.Web/sites", "Azure App Service", (0.0, 2.0)),
+    ("Microsoft.Sql/servers/databases", "SQL Database", (1.0, 30.0)),
+    ("Microsoft.KeyVault/vaults", "Key Vault", (0.0, 0.3)),
+    ("Microsoft.ContainerService/managedClusters", "Azure Kubernetes Service", (5.0, 60.0)),
+)
+
+LOCATIONS = ("eastus", "westeurope", "westus2", "northeurope", "southeastasia")
+WORKLOADS = ("payments", "web", "data", "analytics", "identity", "shared")
+ENVIRONMENTS = ("prod", "dev", "test")
+
+# Cost Management grouping dimensions the stand-in understands, mapped to inventory fields
+COST_DIMENSIONS = {
+    "resourceid": "id",
+    "servicename": "service",
+    "metercategory": "service",
+    "resourcegroup": "resourceGroup",
+    "resourcegroupname": "resourceGroup",
+    "resourcetype": "type",
+    "resourcelocation": "location",
+}
+
+# Prompt keywords -> tool, used when no chat fixture matches (first three distinct matches are called)
+TOOL_KEYWORDS = (
+    (r"\btag(?:ged|s)?\b.*\bcost", "get_resources_by_tag_with_costs"),
+    (r"\bwithout tags|untagged|missing tags", "get_resources_without_tags"),
+    (r"tag compliance|tagging compliance", "get_tag_compliance_summary"),
+    (r"\btag(?:ged)?\b", "get_resources_by_tag"),
+    (r"this month|month[- ]to[- ]date|monthly|overview|month-end", "get_current_month_costs"),
+    (r"\bdaily|trend|burn rate|last \d+ days|spike", "get_daily_costs"),
+    (r"forecast|project(?:ed|ion)|end of (?:the|this) month|month-end", "forecast_month_end"),
+    (r"anomal|unusual|spikes?\b|sudden", "detect_cost_anomalies"),
+    (r"by service|\bservices?\b", "get_costs_by_service"),
+    (r"resource groups?", "get_costs_by_resource_group"),
+    (r"\btop\b|expensive|cost drivers", "get_resource_costs"),
+    (r"\bvms?\b|virtual machines?", "get_all_vms"),
+    (r"\bbackup", "get_vms_without_backup"),
+    (r"private endpoints?", "get_paas_without_private_endpoints"),
+    (r"public (?:access|ip|network)", "get_resources_with_public_access"),
+    (r"storage", "get_storage_accounts"),
+    (r"vnets?|virtual networks?", "get_all_vnets"),
+    (r"app services?|web apps?", "get_app_services"),
+    (r"databases?|\bsql\b", "get_all_databases"),
+    (r"key ?vaults?|secrets", "get_key_vaults"),
+    (r"unused|orphaned|idle", "get_unused_resources"),
+    (r"regions?|multi-region|locations?", "get_multi_region_distribution"),
+    (r"inventory|how many|count", "get_resource_count_by_type"),
+)
+
+FILLER_SENTENCE = (
+    "Costs are concentrated in a small number of services, so reviewing their sizing and "
+    "reservations is the quickest way to reduce spend."
+)
+
+
+class UnsupportedQuery(ValueError):
+    """A KQL query the replay evaluator cannot answer faithfully (answered with a 400)"""
+
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    """Split on a separator outside brackets and quotes"""
+    parts, depth, quote, start = [], 0, "", 0
+    for i, ch in enumerate(text):
+        if quote:
+            quote = "" if ch == quote else quote
+        elif ch in "'\"":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _setting(overrides: Dict[str, Any], name: str, default: str) -> str:
+    return str(overrides.get(name, os.getenv(f"REPLAY_{name.upper()}", default)))
+
+
+class ReplayConfig:
+    def __init__(self, **overrides: Any):
+        """
+        Replay settings from REPLAY_* environment variables, optionally overridden by keyword
+
+        Args:
+            **overrides: Setting values by lower-case name (e.g. azure_latency_ms=50)
+        """
+        self.azure_latency_ms = float(_setting(overrides, "azure_latency_ms", "150"))
+        self.openai_latency_ms = float(_setting(overrides, "openai_latency_ms", "400"))
+        self.openai_chunk_ms = float(_setting(overrides, "openai_chunk_ms", "2"))
+        self.jitter = float(_setting(overrides, "jitter", "0.2"))
+        self.throttle_rate = float(_setting(overrides, "throttle_rate", "0"))
+        self.openai_throttle_rate = float(_setting(overrides, "openai_throttle_rate", "0"))
+        self.retry_after_seconds = float(_setting(overrides, "retry_after_seconds", "1"))
+        self.resources = int(_setting(overrides, "resources", "2000"))
+        self.subscriptions = int(_setting(overrides, "subscriptions", "1"))
+        self.history_days = int(_setting(overrides, "history_days", "120"))
+        self.cost_page_rows = int(_setting(overrides, "cost_page_rows", "5000"))
+        self.answer_words = int(_setting(overrides, "answer_words", "150"))
+        self.seed = int(_setting(overrides, "seed", "42"))
+        self.fixtures_dir = _setting(overrides, "fixtures_dir", "")
+
+
+class ReplayCredential:
+    """Token credential that never leaves the process"""
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        return AccessToken("replay-token", int(time.time()) + 3600)
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayBackend:
+    def __init__(self, config: Optional[ReplayConfig] = None, subscription_id: Optional[str] = None):
+        """
+        Build the synthetic (or recorded) data set the stand-ins answer from
+
+        Fixtures, read from config.fixtures_dir when present, replace generated data:
+        inventory.json (Resource Graph rows), resource_graph.json ([{"match": regex,
+        "data": [...]}]), cost_management.json ([{"match": regex, "columns": [{"name",
+        "type"}], "rows": [[...]]}], matched against the scope and request body JSON)
+        and chat.json ([{"match": regex, "tool_calls": [{"name", "arguments"}],
+        "answer": "..."}]).
+
+        Args:
+            config: Replay settings (defaults to REPLAY_* environment settings)
+            subscription_id: First subscription in the inventory (defaults to AZURE_SUBSCRIPTION_ID)
+        """
+        self.config = config or ReplayConfig()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+        first = subscription_id or os.getenv("AZURE_SUBSCRIPTION_ID") or "00000000-0000-0000-0000-000000000001"
+        self.subscriptions = [first] + [
+            f"00000000-0000-0000-0000-{i:012d}" for i in range(2, self.config.subscriptions + 1)
+        ]
+
+        self.graph_fixtures = self._load_fixture("resource_graph.json") or []
+        self.cost_fixtures = self._load_fixture("cost_management.json") or []
+        self.chat_fixtures = self._load_fixture("chat.json") or []
+        self.resources = self._load_fixture("inventory.json") or self._generate_inventory()
+        self._build_costs()
+        self._cost_results: "OrderedDict[str, Tuple[List[Dict[str, str]], List[List[Any]]]]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Data set
+    # ------------------------------------------------------------------
+
+    def _load_fixture(self, name: str) -> Any:
+        if not self.config.fixtures_dir:
+            return None
+        path = os.path.join(self.config.fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _generate_inventory(self) -> List[Dict[str, Any]]:
+        rng = random.Random(self.config.seed)
+        resources = []
+        for i in range(self.config.resources):
+            arm_type, _, _ = RESOURCE_TYPES[i % len(RESOURCE_TYPES)]
+            subscription = self.subscriptions[i % len(self.subscriptions)]
+            workload, environment = rng.choice(WORKLOADS), rng.choice(ENVIRONMENTS)
+            resource_group = f"rg-{workload}-{environment}"
+            location = rng.choice(LOCATIONS)
+            short = arm_type.split("/")[-1].lower()[:6]
+            name = f"{short}-{workload}-{environment}-{i:05d}"
+
+            provider, *type_path = arm_type.split("/")
+            if len(type_path) == 2:
+                # Child resource (SQL database): parent segment first
+                path = f"{type_path[0]}/sql-{workload}-{environment}/{type_path[1]}/{name}"
+            else:
+                path = f"{type_path[0]}/{name}"
+
+            tags = {}
+            if rng.random() < 0.9:
+                tags["environment"] = environment
+            if rng.random() < 0.7:
+                tags["costcenter"] = f"cc-{100 + WORKLOADS.index(workload)}"
+            if rng.random() < 0.6:
+                tags["owner"] = f"{workload}-team"
+            if rng.random() < 0.5:
+                tags["application"] = workload
+
+            resources.append({
+                "id": f"/subscriptions/{subscription}/resourceGroups/{resource_group}/providers/{provider}/{path}",
+                "name": name,
+                "type": arm_type.lower(),
+                "location": location,
+                "resourceGroup": resource_group,
+                "subscriptionId": subscription,
+                "kind": "",
+                "tags": tags,
+                "sku": None,
+                "properties": self._properties(arm_type.lower(), name, rng)
+            })
+        return resources
+
+    def _properties(self, resource_type: str, name: str, rng: random.Random) -> Dict[str, Any]:
+        public = rng.random() < 0.4
+        if resource_type == "microsoft.storage/storageaccounts":
+            return {
+                "publicNetworkAccess": "Enabled" if public else "Disabled",
+                "privateEndpointConnections": [] if public else [{"id": f"{name}-pe"}],
+                "supportsHttpsTrafficOnly": True
+            }
+        if resource_type == "microsoft.network/virtualnetworks":
+            octet = rng.randint(0, 250)
+            return {
+                "addressSpace": {"addressPrefixes": [f"10.{octet}.0.0/16"]},
+                "subnets": [{"name": "default"}, {"name": "apps"}]
+            }
+        if resource_type == "microsoft.network/publicipaddresses":
+            return {
+                "ipAddress": f"20.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                "publicIPAllocationMethod": "Static",
+                "ipConfiguration": None if rng.random() < 0.2 else {"id": f"{name}-ipconfig"}
+            }
+        if resource_type == "microsoft.web/sites":
+            return {"state": "Running", "defaultHostName": f"{name}.azurewebsites.net", "httpsOnly": not public}
+        if resource_type == "microsoft.sql/servers/databases":
+            return {"status": "Online", "currentServiceObjectiveName": rng.choice(("S0", "S1", "P1", "GP_Gen5_2"))}
+        if resource_type == "microsoft.keyvault/vaults":
+            return {"enableSoftDelete": True, "publicNetworkAccess": "Enabled" if public else "Disabled"}
+        if resource_type == "microsoft.compute/disks":
+            return {"diskState": "Unattached" if rng.random() < 0.15 else "Attached", "diskSizeGB": 128}
+        return {}
+
+    def _build_costs(self) -> None:
+        """Daily cost matrix (resource x day) with weekly seasonality and one injected spike"""
+        rng = np.random.default_rng(self.config.seed)
+        services = {arm_type.lower(): service for arm_type, service, _ in RESOURCE_TYPES}
+        ranges = {arm_type.lower(): cost_range for arm_type, _, cost_range in RESOURCE_TYPES}
+
+        for resource in self.resources:
+            resource["service"] = services.get(resource.get("type", ""), "Other")
+
+        days = self.config.history_days
+        self.first_day = datetime.utcnow().date() - timedelta(days=days - 1)
+        low = np.array([ranges.get(r.get("type", ""), (0.0, 1.0))[0] for r in self.resources])
+        high = np.array([ranges.get(r.get("type", ""), (0.0, 1.0))[1] for r in self.resources])
+        base = low + (high - low) * rng.random(len(self.resources))
+
+        weekday = np.array([(self.first_day + timedelta(days=d)).weekday() for d in range(days)])
+        seasonal = np.where(weekday >= 5, 0.8, 1.0)
+        noise = 1.0 + 0.08 * rng.standard_normal((len(self.resources), days))
+        self.costs = np.clip(base[:, None] * seasonal[None, :] * noise, 0.0, None)
+
+        # A spike ten days ago on the most expensive resource (something for anomaly detection to find)
+        if len(self.resources) and days > 10:
+            self.costs[int(np.argmax(base)), days - 10] *= 5.0
+
+    # ------------------------------------------------------------------
+    # Azure management endpoints (requests transport)
+    # ------------------------------------------------------------------
+
+    def handle_azure(self, method: str, url: str, body: Any) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        """Route one Azure management request; returns (status, headers, JSON payload)"""
+        parsed = urlparse(url)
+        path = parsed.path.lower()
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        payload = json.loads(body) if body else {}
+
+        self._sleep(self.config.azure_latency_ms)
+        if self._chance(self.config.throttle_rate):
+            self._count("throttled")
+            return self._throttled(path)
+
+        if path.endswith("/providers/microsoft.costmanagement/query"):
+            self._count("cost_management")
+            return 200, {"x-ms-ratelimit-microsoft.costmanagement-qpu-remaining": "QueryResource=96"}, \
+                self._cost_query(url, parsed.path.split("/providers/")[0], payload, query)
+        if path.endswith("/providers/microsoft.resourcegraph/resources"):
+            self._count("resource_graph")
+            try:
+                result = self._graph_query(payload)
+            except UnsupportedQuery as e:
+                self._count("unsupported_queries")
+                return 400, {}, {"error": {"code": "BadRequest", "message": f"Offline replay cannot evaluate this query: {e}"}}
+            return 200, {"x-ms-user-quota-remaining": "14", "x-ms-user-quota-resets-after": "00:00:05"}, result
+        if path.rstrip("/") == "/subscriptions" and method == "GET":
+            self._count("subscriptions")
+            return 200, {}, {"value": [
+                {
+                    "id": f"/subscriptions/{sub}",
+                    "subscriptionId": sub,
+                    "displayName": f"Replay Subscription {i + 1}",
+                    "state": "Enabled"
+                }
+                for i, sub in enumerate(self.subscriptions)
+            ]}
+
+        self._count("not_found")
+        return 404, {}, {"error": {"code": "NotFound", "message": f"No replay route for {method} {parsed.path}"}}
+
+    def _throttled(self, path: str) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        retry_after = f"{self.config.retry_after_seconds:g}"
+        headers = {"Retry-After": retry_after}
+        if "costmanagement" in path:
+            headers["x-ms-ratelimit-microsoft.costmanagement-entity-retry-after"] = retry_after
+        elif "resourcegraph" in path:
+            headers["x-ms-user-quota-remaining"] = "0"
+            headers["x-ms-user-quota-resets-after"] = time.strftime("%H:%M:%S", time.gmtime(self.config.retry_after_seconds))
+        return 429, headers, {"error": {"code": "429", "message": "Too many requests. Please retry."}}
+
+    def _cost_query(self, url: str, scope: str, payload: Dict[str, Any], query: Dict[str, str]) -> Dict[str, Any]:
+        key = hashlib.sha1((scope.lower() + json.dumps(payload, sort_keys=True)).encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cost_results.get(key)
+        if cached is None:
+            cached = self._cost_fixture(scope, payload) or self._evaluate_cost_query(scope, payload)
+            with self._lock:
+                self._cost_results[key] = cached
+                while len(self._cost_results) > 32:
+                    self._cost_results.popitem(last=False)
+        columns, rows = cached
+
+        offset = int(query.get("$skiptoken") or 0)
+        end = offset + self.config.cost_page_rows
+        properties: Dict[str, Any] = {"columns": columns, "rows": rows[offset:end]}
+        if end < len(rows):
+            properties["nextLink"] = f"{url.split('?')[0]}?api-version={query.get('api-version', '')}&$skiptoken={end}"
+        return {"id": f"{scope}/providers/Microsoft.CostManagement/query/replay", "name": "replay",
+                "type": "Microsoft.CostManagement/query", "properties": properties}
+
+    def _cost_fixture(self, scope: str, payload: Dict[str, Any]) -> Optional[Tuple[List[Dict[str, str]], List[List[Any]]]]:
+        """Recorded columns and rows for the first cost fixture matching the request"""
+        request = f"{scope} {json.dumps(payload, sort_keys=True)}"
+        for fixture in self.cost_fixtures:
+            if re.search(fixture.get("match", "$^"), request, re.IGNORECASE | re.DOTALL):
+                return list(fixture.get("columns") or []), [list(row) for row in fixture.get("rows") or []]
+        return None
+
+    def _evaluate_cost_query(self, scope: str, payload: Dict[str, Any]) -> Tuple[List[Dict[str, str]], List[List[Any]]]:
+        dataset = payload.get("dataset") or {}
+        period = payload.get("timePeriod") or {}
+        daily = str(dataset.get("granularity") or "None").lower() == "daily"
+        groupings = [g.get("name", "") for g in dataset.get("grouping") or []]
+        fields = [COST_DIMENSIONS.get(name.lower(), "") for name in groupings]
+
+        start = self._parse_day(period.get("from"), self.first_day)
+        end = self._parse_day(period.get("to"), datetime.utcnow().date())
+        first = max(0, (start - self.first_day).days)
+        last = min(self.config.history_days - 1, (end - self.first_day).days)
+
+        wanted = None
+        dimensions = ((dataset.get("filter") or {}).get("dimensions") or {})
+        if str(dimensions.get("name", "")).lower() == "resourceid":
+            wanted = {str(v).lower() for v in dimensions.get("values") or []}
+
+        scope = scope.lower().rstrip("/")
+        totals: Dict[Tuple[Any, ...], float] = {}
+        for i, resource in enumerate(self.resources):
+            resource_id = resource["id"].lower()
+            if not resource_id.startswith(scope) or (wanted is not None and resource_id not in wanted):
+                continue
+            labels = tuple(resource_id if field == "id" else resource.get(field, "") for field in fields)
+            if first > last:
+                continue
+            if daily:
+                for day in range(first, last + 1):
+                    key = (day,) + labels
+                    totals[key] = totals.get(key, 0.0) + float(self.costs[i, day])
+            else:
+                totals[labels] = totals.get(labels, 0.0) + float(self.costs[i, first:last + 1].sum())
+
+        columns = [{"name": "Cost", "type": "Number"}]
+        if daily:
+            columns.append({"name": "UsageDate", "type": "Number"})
+        columns += [{"name": name, "type": "String"} for name in groupings]
+        columns.append({"name": "Currency", "type": "String"})
+
+        rows = []
+        for key, cost in totals.items():
+            row: List[Any] = [round(cost, 6)]
+            if daily:
+                day = self.first_day + timedelta(days=key[0])
+                row.append(day.year * 10000 + day.month * 100 + day.day)
+                key = key[1:]
+            rows.append(row + list(key) + ["USD"])
+        return columns, rows
+
+    def _graph_query(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        kql = str(payload.get("query") or "")
+        options = payload.get("options") or {}
+        subscriptions = {str(s).lower() for s in payload.get("subscriptions") or []}
+
+        rows = None
+        for fixture in self.graph_fixtures:
+            if re.search(fixture.get("match", "$^"), kql, re.IGNORECASE | re.DOTALL):
+                rows = list(fixture.get("data") or [])
+                break
+        if rows is None:
+            rows = self._evaluate_kql(kql, subscriptions)
+
+        offset = int(options.get("$skipToken") or 0)
+        top = int(options.get("$top") or 1000)
+        page = rows[offset:offset + top]
+        result: Dict[str, Any] = {
+            "totalRecords": len(rows),
+            "count": len(page),
+            "resultTruncated": "false",
+            "data": page,
+            "facets": []
+        }
+        if offset + top < len(rows):
+            result["$skipToken"] = str(offset + top)
+        return result
+
+    def _evaluate_kql(self, kql: str, subscriptions: set) -> List[Dict[str, Any]]:
+        """
+        Approximate the KQL shapes this app sends, operator by operator: where-filters on
+        type, location, tags, name and id; summarize count() by one column; project;
+        order by; limit/take. resourcechanges queries return no changes.
+
+        Raises:
+            UnsupportedQuery: Any other table, operator or aggregation, rather than
+                returning rows that only look like an answer
+        """
+        segments = _split_top_level(" ".join(kql.split()), "|")
+        table = segments[0].strip().lower()
+        if table.startswith("resourcechanges"):
+            return []
+        if table != "resources":
+            raise UnsupportedQuery(f"table or expression '{segments[0].strip()[:60]}'")
+
+        rows = [r for r in self.resources if not subscriptions or r.get("subscriptionId", "").lower() in subscriptions]
+        for segment in segments[1:]:
+            operator, _, text = segment.strip().partition(" ")
+            operator = operator.lower()
+            if operator == "where":
+                rows = self._where(rows, text)
+            elif operator == "summarize":
+                summarize = re.fullmatch(r"(?:(\w+)\s*=\s*)?count\(\)\s+by\s+(\w+)", text.strip(), re.IGNORECASE)
+                if not summarize:
+                    raise UnsupportedQuery(f"summarize {text.strip()[:60]}")
+                alias, column = summarize.group(1) or "count_", summarize.group(2)
+                counts = Counter(r.get(column) for r in rows)
+                rows = [{column: value, alias: count} for value, count in counts.items()]
+            elif operator == "project":
+                rows = [self._project(r, text) for r in rows]
+            elif operator in ("order", "sort"):
+                order = re.match(r"by\s+(\w+)(?:\s+(asc|desc))?", text, re.IGNORECASE)
+                if order and rows and order.group(1) in rows[0]:
+                    column, descending = order.group(1), (order.group(2) or "desc").lower() == "desc"
+                    rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=descending)
+            elif operator in ("limit", "take"):
+                rows = rows[:int(text.split()[0])]
+            else:
+                raise UnsupportedQuery(f"operator '{operator}'")
+        return rows
+
+    def _where(self, rows: List[Dict[str, Any]], text: str) -> List[Dict[str, Any]]:
+        for value in re.findall(r"\btype\s*(?:=~|==)\s*'([^']+)'", text, re.IGNORECASE):
+            rows = [r for r in rows if r.get("type", "").lower() == value.lower()]
+        for values in re.findall(r"\btype\s+in~?\s*\(([^)]*)\)", text, re.IGNORECASE):
+            allowed = {v.strip().strip("'\"").lower() for v in values.split(",")}
+            rows = [r for r in rows if r.get("type", "").lower() in allowed]
+        for value in re.findall(r"\blocation\s*(?:=~|==)\s*'([^']+)'", text, re.IGNORECASE):
+            rows = [r for r in rows if r.get("location", "").lower() == value.lower()]
+        for tag, value in re.findall(r"tags\['([^']+)'\]\s*=[=~]\s*'([^']*)'", text, re.IGNORECASE):
+            rows = [r for r in rows if str((r.get("tags") or {}).get(tag, "")).lower() == value.lower()]
+        for tag in re.findall(r"isnotnull\(tags\['([^']+)'\]\)", text, re.IGNORECASE):
+            rows = [r for r in rows if tag in (r.get("tags") or {})]
+        for term in re.findall(r"\bname\s+contains\s+'([^']+)'", text, re.IGNORECASE):
+            rows = [r for r in rows if term.lower() in r.get("name", "").lower()]
+        for values in re.findall(r"tolower\(id\)\s+in\s*\(([^)]*)\)", text, re.IGNORECASE):
+            allowed = {v.strip().strip("'\"").lower() for v in values.split(",")}
+            rows = [r for r in rows if r.get("id", "").lower() in allowed]
+        return rows
+
+    def _project(self, row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+        """Project plain columns and dotted property paths; other expressions keep the same-named column"""
+        projected = {}
+        for part in (p.strip() for p in _split_top_level(columns, ",")):
+            name, _, expression = part.partition("=")
+            name, expression = name.strip(), (expression or name).strip()
+            if not re.fullmatch(r"\w+", name):
+                continue
+            if not re.fullmatch(r"[\w.]+", expression):
+                projected[name] = row.get(name)
+                continue
+            value: Any = row
+            for segment in expression.split("."):
+                value = value.get(segment) if isinstance(value, dict) else None
+            projected[name] = value
+        return projected
+
+    # ------------------------------------------------------------------
+    # Azure OpenAI chat completions (httpx transport)
+    # ------------------------------------------------------------------
+
+    async def handle_openai(self, request: httpx.Request) -> httpx.Response:
+        """Answer a chat-completions request, streamed or not"""
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"code": "NotFound", "message": request.url.path}})
+
+        body = json.loads(await request.aread() or b"{}")
+        await asyncio.sleep(self._delay(self.config.openai_latency_ms))
+        if self._chance(self.config.openai_throttle_rate):
+            self._count("openai_throttled")
+            return httpx.Response(
+                429,
+                headers={"retry-after": f"{self.config.retry_after_seconds:g}"},
+                json={"error": {"code": "429", "message": "Rate limit reached. Please retry."}}
+            )
+        self._count("chat_completions")
+
+        reply = self._chat_reply(body)
+        model = str(body.get("model") or "replay")
+        completion_id = f"chatcmpl-replay-{self._next_id()}"
+        usage = {
+            "prompt_tokens": len(json.dumps(body.get("messages") or [])) // 4,
+            "completion_tokens": len(reply.get("content") or json.dumps(reply.get("tool_calls"))) // 4
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self._stream_chunks(
+                    completion_id, model, reply,
+                    usage if (body.get("stream_options") or {}).get("include_usage") else None
+                )
+            )
+
+        message: Dict[str, Any] = {"role": "assistant", "content": reply.get("content")}
+        if reply.get("tool_calls"):
+            message["tool_calls"] = reply["tool_calls"]
+        return httpx.Response(200, json={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if reply.get("tool_calls") else "stop"
+            }],
+            "usage": usage
+        })
+
+    async def _stream_chunks(self, completion_id: str, model: str, reply: Dict[str, Any],
+                             usage: Optional[Dict[str, int]] = None) -> AsyncIterator[bytes]:
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+
+        yield chunk({"role": "assistant", "content": ""})
+        for index, tool_call in enumerate(reply.get("tool_calls") or []):
+            yield chunk({"tool_calls": [{"index": index, **tool_call}]})
+        for word in re.findall(r"\S+\s*", reply.get("content") or ""):
+            await asyncio.sleep(self._delay(self.config.openai_chunk_ms))
+            yield chunk({"content": word})
+        yield chunk({}, "tool_calls" if reply.get("tool_calls") else "stop")
+        # Requested with stream_options.include_usage: a last chunk with no choices carries the usage
+        if usage is not None:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage
+            }
+            yield f"data: {json.dumps(data)}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    def _chat_reply(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages") or []
+        tools = {t.get("function", {}).get("name") for t in body.get("tools") or []}
+        last = messages[-1] if messages else {}
+        question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+
+        fixture = next(
+            (f for f in self.chat_fixtures if re.search(f.get("match", "$^"), question, re.IGNORECASE)),
+            None
+        )
+
+        if tools and body.get("tool_choice") != "none" and last.get("role") == "user":
+            if fixture is not None:
+                calls = [(c["name"], c.get("arguments") or {}) for c in fixture.get("tool_calls") or []]
+            else:
+                calls = self._choose_tools(question)
+            calls = [(name, arguments) for name, arguments in calls if name in tools]
+            if calls:
+                return {"tool_calls": [
+                    {
+                        "id": f"call_{self._next_id()}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(arguments)}
+                    }
+                    for name, arguments in calls
+                ]}
+
+        if fixture is not None and fixture.get("answer"):
+            return {"content": fixture["answer"]}
+        return {"content": self._answer(messages)}
+
+    def _choose_tools(self, question: str) -> List[Tuple[str, Dict[str, Any]]]:
+        arguments: Dict[str, Any] = {}
+        days = re.search(r"last (\d+) days", question, re.IGNORECASE)
+        if days:
+            arguments["days"] = int(days.group(1))
+        tag = re.search(r"tag(?:ged)?\s+['\"]?([\w-]+)['\"]?\s*(?:=|:|is|of)\s*['\"]?([\w-]+)", question, re.IGNORECASE)
+
+        chosen: List[Tuple[str, Dict[str, Any]]] = []
+        for pattern, name in TOOL_KEYWORDS:
+            if len(chosen) == 3 or not re.search(pattern, question, re.IGNORECASE):
+                continue
+            if any(name == existing for existing, _ in chosen):
+                continue
+            tool_arguments = dict(arguments)
+            if name.startswith("get_resources_by_tag"):
+                if not tag:
+                    continue
+                tool_arguments.update(tag_name=tag.group(1), tag_value=tag.group(2))
+            chosen.append((name, tool_arguments))
+        return chosen
+
+    def _answer(self, messages: Sequence[Dict[str, Any]]) -> str:
+        results = [m for m in messages if m.get("role") == "tool"]
+        lines = [f"## Summary\n\nBased on {len(results)} tool result(s):\n"]
+        for message in results:
+            lines.append(f"- {str(message.get('content') or '')[:160]}")
+        text = "\n".join(lines) + "\n\n"
+        while len(text.split()) < self.config.answer_words:
+            text += FILLER_SENTENCE + " "
+        return text.strip()
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, int]:
+        """Requests served per endpoint, and throttled responses"""
+        with self._lock:
+            return dict(self.counters)
+
+    def _parse_day(self, value: Any, default: date) -> date:
+        if not value:
+            return default
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).date()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self.counters["ids"] += 1
+            return self.counters["ids"]
+
+    def _chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def _delay(self, milliseconds: float) -> float:
+        if milliseconds <= 0:
+            return 0.0
+        with self._rng_lock:
+            factor = 1.0 + self.config.jitter * (2 * self._rng.random() - 1)
+        return milliseconds * factor / 1000
+
+    def _sleep(self, milliseconds: float) -> None:
+        delay = self._delay(milliseconds)
+        if delay:
+            time.sleep(delay)
+
+
+class ReplayAzureAdapter(BaseAdapter):
+    def __init__(self, backend: ReplayBackend):
+        """requests adapter answering Azure management calls from the replay backend"""
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        status, headers, payload = self.backend.handle_azure(request.method, request.url, request.body)
+        content = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(content)), **headers}
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status < 400 else "Too Many Requests" if status == 429 else "Error"
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = urllib3.HTTPResponse(
+            body=io.BytesIO(content), headers=headers, status=status, preload_content=False
+        )
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def install(config: Optional[ReplayConfig] = None) -> ReplayBackend:
+    """
+    Route every Azure and Azure OpenAI call in this process to local stand-ins
+
+    Installs a replay credential, a requests transport whose session is served by
+    ReplayAzureAdapter, and an httpx client with a mock transport for chat
+    completions. Call before the clients are first used.
+
+    Args:
+        config: Replay settings (defaults to REPLAY_* environment settings)
+
+    Returns:
+        The backend, for inspecting request counts
+    """
+    os.environ.setdefault("AZURE_SUBSCRIPTION_ID", "00000000-0000-0000-0000-000000000001")
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://replay.openai.azure.com")
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "replay")
+    os.environ["USE_MANAGED_IDENTITY"] = "false"
+
+    backend = ReplayBackend(config)
+
+    session = requests.Session()
+    session.mount("https://", ReplayAzureAdapter(backend))
+    session.mount("http://", ReplayAzureAdapter(backend))
+
+    azure_clients.install(
+        credential=ReplayCredential(),
+        transport=RequestsTransport(session=session, session_owner=False),
+        openai_http_client=httpx.AsyncClient(transport=httpx.MockTransport(backend.handle_openai))
+    )
+    return backend
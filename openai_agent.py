@@ -5,11 +5,29 @@ Handles conversational AI with Azure OpenAI and function calling for Azure APIs
 
 import os
 import json
-from typing import List, Dict, Any, Tuple
-from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+import time
+import uuid
+import logging
+from types import SimpleNamespace
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 import asyncio
 
+from answer_cache import AnswerCache
+from azure_clients import get_credential, get_openai_http_client
+from azure_cost_manager import COST_TOOL_TIMEOUT_SECONDS
+from cost_cube import normalize_resource_id
+from history_manager import HistoryManager
+from result_shaper import ResultShaper
+from single_flight import SingleFlight
+from intent_router import IntentRouter
+from telemetry import FAST_PATH_ROUTED, TOOL_SECONDS, record_usage, span, stage
+from tool_registry import ToolRegistry, tool
+
+
+logger = logging.getLogger(__name__)
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
 
 class OpenAIAgent:
     def __init__(self, cost_manager, resource_manager):
@@ -24,321 +42,43 @@ class OpenAIAgent:
         self.resource_manager = resource_manager
         
         # Check if we should use Managed Identity
-        use_managed_identity = os.getenv("USE_MANAGED_IDENTITY", "false").lower() == "true"
+        self.use_managed_identity = os.getenv("USE_MANAGED_IDENTITY", "false").lower() == "true"
         
-        # Initialize Azure OpenAI client
-        if use_managed_identity:
-            # Use Managed Identity authentication
-            credential = DefaultAzureCredential()
-            token_provider = get_bearer_token_provider(
-                credential,
-                "https://cognitiveservices.azure.com/.default"
-            )
-            self.client = AzureOpenAI(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                azure_ad_token_provider=token_provider,
-                api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-            )
-        else:
-            # Use API key authentication
-            self.client = AzureOpenAI(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-            )
+        # The Azure OpenAI client is built on first use to keep startup fast
+        self._client = None
         
         self.deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4")
         
-        # Define available functions for the agent
-        self.functions = [
-            {
-                "name": "get_current_month_costs",
-                "description": "Get the total Azure costs for the current month. Use this when user asks about current month costs, this month's spending, or monthly costs.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "scope": {
-                            "type": "string",
-                            "description": "Azure scope in format '/subscriptions/{id}' or '/subscriptions/{id}/resourceGroups/{name}'. Leave empty for subscription level."
-                        }
-                    }
-                }
-            },
-            {
-                "name": "get_costs_by_service",
-                "description": "Get Azure costs grouped by service (like Storage, Compute, Networking). Use this when user asks which service costs the most, cost breakdown by service, or service-level costs.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "scope": {
-                            "type": "string",
-                            "description": "Azure scope. Leave empty for subscription level."
-                        },
-                        "days": {
-                            "type": "integer",
-                            "description": "Number of days to look back. Default is 30.",
-                            "default": 30
-                        }
-                    }
-                }
-            },
-            {
-                "name": "get_daily_costs",
-                "description": "Get daily cost trends over time. Use this when user asks about spending trends, daily costs, or cost patterns over time.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "scope": {
-                            "type": "string",
-                            "description": "Azure scope. Leave empty for subscription level."
-                        },
-                        "days": {
-                            "type": "integer",
-                            "description": "Number of days to look back. Default is 30.",
-                            "default": 30
-                        }
-                    }
-                }
-            },
-            {
-                "name": "get_costs_by_resource_group",
-                "description": "Get costs grouped by resource group. Use this when user asks about costs per resource group or which resource group costs the most.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "scope": {
-                            "type": "string",
-                            "description": "Azure scope. Leave empty for subscription level."
-                        },
-                        "days": {
-                            "type": "integer",
-                            "description": "Number of days to look back. Default is 30.",
-                            "default": 30
-                        }
-                    }
-                }
-            },
-            {
-                "name": "get_resource_costs",
-                "description": "Get costs for individual resources. Shows the most expensive resources. Use this when user asks about specific resource costs or which resources cost the most.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "scope": {
-                            "type": "string",
-                            "description": "Azure scope. Leave empty for subscription level."
-                        },
-                        "days": {
-                            "type": "integer",
-                            "description": "Number of days to look back. Default is 30.",
-                            "default": 30
-                        },
-                        "top": {
-                            "type": "integer",
-                            "description": "Number of top expensive resources to return. Default is 10.",
-                            "default": 10
-                        }
-                    }
-                }
-            },
-            {
-                "name": "get_storage_accounts_with_private_endpoints",
-                "description": "Get all storage accounts that have private endpoints configured. Use this when user asks about storage accounts with private endpoints or private networking.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_all_vnets",
-                "description": "Get all virtual networks in the subscription. Use this when user asks about VNets, virtual networks, or network infrastructure.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_vms_without_backup",
-                "description": "Get virtual machines that don't have backup configured. Use this when user asks about VMs without backup, unprotected VMs, or backup compliance.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_resources_by_type",
-                "description": "Get all resources of a specific type. Use this when user asks about specific resource types like VMs, storage accounts, databases, etc.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "resource_type": {
-                            "type": "string",
-                            "description": "Azure resource type in format 'microsoft.compute/virtualmachines' or 'microsoft.storage/storageaccounts'"
-                        }
-                    },
-                    "required": ["resource_type"]
-                }
-            },
-            {
-                "name": "get_resource_count_by_type",
-                "description": "Get count of all resources grouped by type. Use this for inventory overview or when user asks how many resources of each type exist.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "search_resources",
-                "description": "Search for resources by name. Use this when user asks to find or search for a specific resource by name.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "search_term": {
-                            "type": "string",
-                            "description": "Term to search for in resource names"
-                        }
-                    },
-                    "required": ["search_term"]
-                }
-            },
-            {
-                "name": "get_app_services",
-                "description": "Get all App Services (web apps). Use this when user asks about App Services, web apps, or hosting.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_sql_databases",
-                "description": "Get all SQL databases. Use this when user asks about SQL databases or database inventory.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_key_vaults",
-                "description": "Get all Key Vaults. Use this when user asks about Key Vaults or secrets management.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_resources_by_tag",
-                "description": "Get all resources filtered by a specific tag name and value. Use this when user asks to filter resources by tags, find resources with specific tags, or list resources with Environment/Owner/CostCenter tags. Returns resource name, type, resource group, location, tags, and resource ID.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "tag_name": {
-                            "type": "string",
-                            "description": "Tag name to filter by (e.g., 'Environment', 'CostCenter', 'Owner')"
-                        },
-                        "tag_value": {
-                            "type": "string",
-                            "description": "Tag value to filter by (e.g., 'Sandbox', 'Production', 'Development'). If not provided, returns all resources with the tag regardless of value."
-                        }
-                    },
-                    "required": ["tag_name"]
-                }
-            },
-            {
-                "name": "get_resources_by_tag_with_costs",
-                "description": "Get resources filtered by tag with their associated costs for a specified period. Use this when user asks for resources with specific tags AND their costs. Returns comprehensive data including resource details, tags, and cost breakdown.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "tag_name": {
-                            "type": "string",
-                            "description": "Tag name to filter by (e.g., 'Environment', 'CostCenter')"
-                        },
-                        "tag_value": {
-                            "type": "string",
-                            "description": "Tag value to filter by (e.g., 'Sandbox', 'Production')"
-                        },
-                        "days": {
-                            "type": "integer",
-                            "description": "Number of days to look back for costs. Default is 30.",
-                            "default": 30
-                        }
-                    },
-                    "required": ["tag_name", "tag_value"]
-                }
-            },
-            {
-                "name": "get_all_vms",
-                "description": "Get all virtual machines with detailed information including VM size, OS type, power state, and tags. Use when user asks about VMs, virtual machine inventory, or VM estate management.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_storage_accounts",
-                "description": "Get all storage accounts with security settings including public access, HTTPS, and private endpoints. Use when user asks about storage accounts or storage security.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_paas_without_private_endpoints",
-                "description": "Get PaaS resources (storage, SQL, Key Vault, Cosmos DB) that don't have private endpoints configured. Use for security assessment and private endpoint compliance checks.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_resources_with_public_access",
-                "description": "Get resources exposed to the public internet (storage with public blob access, SQL servers, public IPs, VMs). Use for security posture assessment.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_all_databases",
-                "description": "Get all database resources including SQL, Cosmos DB, PostgreSQL, and MySQL. Use when user asks about database inventory.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_resources_without_tags",
-                "description": "Get resources missing required tags (Environment, CostCenter, Owner). Use for tag compliance audits and governance checks.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_unused_resources",
-                "description": "Get potentially unused resources including orphaned disks, unattached public IPs, and deallocated VMs. Use for cost optimization and resource cleanup.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_tag_compliance_summary",
-                "description": "Get tag compliance statistics showing percentage of resources with required tags. Use when user asks about overall tag compliance or governance posture.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_multi_region_distribution",
-                "description": "Get resource distribution across Azure regions. Use when user asks about geographic distribution, multi-region deployment, or regional resource counts.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            }
-        ]
+        # Tool-calling loop bounds
+        self.max_tool_iterations = int(os.getenv("AGENT_MAX_TOOL_ITERATIONS", "5"))
+        self.max_parallel_tools = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4"))
+        
+        # Token-budgeted history; older turns are folded into a digest of one headline line each
+        self.history_manager = HistoryManager()
+        
+        # Compact, budgeted tool results for the model
+        self.result_shaper = ResultShaper(self.history_manager.counter)
+        
+        # Identical Azure calls from concurrent requests share one in-flight query
+        self.single_flight = SingleFlight()
+        
+        # Final answers reused when a question resolves to the same tool calls over unchanged data
+        self.answer_cache = AnswerCache()
+        
+        # Keyword router sending common questions straight to their tool
+        self.intent_router = IntentRouter()
+        
+        # Tools are declared with @tool on the manager methods (and this agent's composite tools);
+        # every one must resolve, including those the fast-path router calls directly
+        self.tool_registry = ToolRegistry(self.single_flight)
+        self.tool_registry.register(cost_manager)
+        self.tool_registry.register(resource_manager)
+        self.tool_registry.register(self)
+        self.tool_registry.check(referenced=[rule[1] for rule in self.intent_router.rules])
+        self.functions = self.tool_registry.functions()
+        
+        # Chat Completions tools format wrapping the function schemas
+        self.tools = [{"type": "function", "function": function} for function in self.functions]
         
         self.system_message = """You are an elite Azure Cost Intelligence Analyst and Strategic Cloud Financial Advisor with deep expertise in cloud economics, infrastructure optimization, and business impact analysis.
 
@@ -353,6 +93,7 @@ When analyzing costs:
 - Perform comprehensive multi-factor analysis (time trends, services, resource groups, resources)
 - Calculate specific savings potential with dollar amounts, percentages, and ROI projections
 - Identify spending anomalies, unusual patterns, and optimization opportunities
+- For trends, month-end forecasts and anomalies, call get_cost_trends, forecast_month_end and detect_cost_anomalies and report their numbers rather than estimating from raw daily costs
 - Consider business context, workload criticality, and operational impact
 - Provide implementation priority ranking (Quick Wins vs. Strategic Initiatives)
 
@@ -386,6 +127,39 @@ Table Example Format:
 
 Always deliver insights that drive measurable business outcomes, significant cost savings, and strategic cloud optimization."""
     
+    @property
+    def client(self):
+        """Azure OpenAI client, built on first use"""
+        if self._client is None:
+            from openai import AsyncAzureOpenAI
+            
+            if self.use_managed_identity:
+                # Use Managed Identity authentication (shared credential and token cache)
+                from azure.identity import get_bearer_token_provider
+                token_provider = get_bearer_token_provider(get_credential(), COGNITIVE_SERVICES_SCOPE)
+                self._client = AsyncAzureOpenAI(
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    azure_ad_token_provider=token_provider,
+                    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview"),
+                    http_client=get_openai_http_client()
+                )
+            else:
+                # Use API key authentication
+                self._client = AsyncAzureOpenAI(
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview"),
+                    http_client=get_openai_http_client()
+                )
+        return self._client
+    
+    def warm_up(self) -> None:
+        """Build the client, fetch its token and load the tokenizer ahead of the first chat"""
+        self.client
+        if self.use_managed_identity:
+            get_credential().prefetch(COGNITIVE_SERVICES_SCOPE)
+        self.history_manager.counter.count("warm-up")
+    
     async def process_message(self, user_message: str, conversation_history: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
         """
         Process user message and return AI response
@@ -398,96 +172,354 @@ Always deliver insights that drive measurable business outcomes, significant cos
             Tuple of (response_text, updated_conversation_history)
         """
         try:
-            # Build messages array
-            messages = [{"role": "system", "content": self.system_message}]
-            
-            # Add conversation history
-            for msg in conversation_history:
-                messages.append(msg)
-            
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
-            
-            # Initial API call
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=messages,
-                functions=self.functions,
-                function_call="auto",
-                temperature=0.7,  # Balanced for accurate and insightful responses
-                max_tokens=8000  # Extended for comprehensive, well-formatted analysis with tables
-            )
-            
-            response_message = response.choices[0].message
-            
-            # Handle function calling
-            if response_message.function_call:
-                # Execute the function
-                function_name = response_message.function_call.name
-                function_args = json.loads(response_message.function_call.arguments)
-                
-                # Call the appropriate function
-                function_result = await self._execute_function(function_name, function_args)
+            messages = self._build_messages(user_message, conversation_history)
+            
+            # Let the model call tools, running each round's calls concurrently,
+            # until it answers or the iteration bound is reached
+            semaphore = asyncio.Semaphore(self.max_parallel_tools)
+            iterations = 0
+            answer_key = cached_answer = None
+            # Common, unambiguous questions skip the tool-selection completion
+            routed_calls = self._route(user_message)
+            while True:
+                tools_allowed = iterations < self.max_tool_iterations
+                if routed_calls:
+                    tool_calls, content, routed_calls = routed_calls, None, None
+                else:
+                    with stage(f"model_call_{iterations + 1}"):
+                        response = await self.client.chat.completions.create(
+                            model=self.deployment_name,
+                            messages=messages,
+                            tools=self.tools,
+                            tool_choice="auto" if tools_allowed else "none",
+                            temperature=0.7,  # Balanced for accurate and insightful responses
+                            max_tokens=8000  # Extended for comprehensive, well-formatted analysis with tables
+                        )
+                    record_usage(response.usage)
+                    
+                    response_message = response.choices[0].message
+                    tool_calls = response_message.tool_calls if tools_allowed else None
+                    content = response_message.content
+                    if not tool_calls:
+                        final_message = content
+                        break
                 
-                # Add function call to messages
+                iterations += 1
                 messages.append({
                     "role": "assistant",
-                    "content": None,
-                    "function_call": {
-                        "name": function_name,
-                        "arguments": response_message.function_call.arguments
-                    }
+                    "content": content,
+                    "tool_calls": [
+                        {
+                            "id": tool_call.id,
+                            "type": "function",
+                            "function": {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments
+                            }
+                        }
+                        for tool_call in tool_calls
+                    ]
                 })
                 
-                # Add function result to messages
-                messages.append({
-                    "role": "function",
-                    "name": function_name,
-                    "content": json.dumps(function_result)
-                })
+                with stage("tool_execution"):
+                    results = await asyncio.gather(
+                        *(self._run_tool_call(tool_call, semaphore) for tool_call in tool_calls)
+                    )
                 
-                # Get final response from AI
-                second_response = self.client.chat.completions.create(
-                    model=self.deployment_name,
-                    messages=messages,
-                    temperature=0.7,  # Balanced for accurate, well-formatted insights
-                    max_tokens=8000  # Extended for detailed, table-formatted analysis
-                )
+                # Add tool results to messages, one per call
+                contents = []
+                for tool_call, function_result in zip(tool_calls, results):
+                    content, _ = self._shape_tool_result(tool_call, function_result)
+                    contents.append(content)
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": content
+                    })
                 
-                final_message = second_response.choices[0].message.content
-            else:
-                final_message = response_message.content
-            
-            # Update conversation history
-            updated_history = conversation_history + [
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": final_message}
-            ]
-            
-            # Keep only last 10 messages to avoid token limits
-            if len(updated_history) > 10:
-                updated_history = updated_history[-10:]
-            
+                # A question answered from the same tool results before gets the same answer,
+                # without the second completion; answers needing further tool rounds are not cached
+                answer_key = self._answer_key(user_message, conversation_history, tool_calls, results, contents, iterations)
+                cached_answer = self.answer_cache.get(answer_key)
+                if cached_answer is not None:
+                    final_message = cached_answer
+                    break
+            
+            if answer_key is not None and cached_answer is None:
+                self.answer_cache.set(answer_key, final_message)
+            
+            with stage("serialization"):
+                updated_history = self._update_history(conversation_history, user_message, final_message)
             return final_message, updated_history
             
         except Exception as e:
-            # Log the actual error for debugging
-            import traceback
-            import sys
-            print(f"\n{'='*60}", file=sys.stderr)
-            print(f"ERROR in process_message:", file=sys.stderr)
-            print(f"Type: {type(e).__name__}", file=sys.stderr)
-            print(f"Message: {str(e)}", file=sys.stderr)
-            print(f"{'='*60}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-            print(f"{'='*60}\n", file=sys.stderr)
+            logger.exception("Error in process_message")
             
             error_message = f"I encountered an error: {str(e)}. Please try again or rephrase your question."
-            updated_history = conversation_history + [
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": error_message}
-            ]
-            return error_message, updated_history
+            return error_message, self._update_history(conversation_history, user_message, error_message)
+    
+    async def stream_message(self, user_message: str, conversation_history: List[Dict[str, str]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process user message, yielding events as the answer is produced
+
+        Events are dictionaries with a "type" of:
+            status: progress text (e.g. "Querying Cost Management: get_costs_by_service...")
+            tool_result: a tool finished, with a short summary of what it returned
+            token: a chunk of the assistant's answer
+            done: final response and updated conversation history
+            error: processing failed; followed by done with the error message
+
+        Args:
+            user_message: User's input message
+            conversation_history: Previous conversation messages
+        """
+        try:
+            messages = self._build_messages(user_message, conversation_history)
+
+            semaphore = asyncio.Semaphore(self.max_parallel_tools)
+            iterations = 0
+            answer_key = cached_answer = None
+            routed_calls = self._route(user_message)
+            while True:
+                tools_allowed = iterations < self.max_tool_iterations
+                if routed_calls:
+                    tool_calls, content, routed_calls = routed_calls, "", None
+                else:
+                    yield {"type": "status", "message": "Thinking..." if iterations == 0 else "Analyzing results..."}
+
+                    content_parts = []
+                    tool_call_parts: Dict[int, Dict[str, Any]] = {}
+                    # The stage covers the whole stream, not just the time to the first chunk
+                    with stage(f"model_call_{iterations + 1}"):
+                        stream = await self.client.chat.completions.create(
+                            model=self.deployment_name,
+                            messages=messages,
+                            tools=self.tools,
+                            tool_choice="auto" if tools_allowed else "none",
+                            temperature=0.7,
+                            max_tokens=8000,
+                            stream=True,
+                            # Token usage arrives in a final chunk with no choices
+                            stream_options={"include_usage": True}
+                        )
+
+                        async for chunk in stream:
+                            if getattr(chunk, "usage", None) is not None:
+                                record_usage(chunk.usage)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta
+                            if delta.content:
+                                content_parts.append(delta.content)
+                                yield {"type": "token", "content": delta.content}
+                            for tool_delta in delta.tool_calls or []:
+                                part = tool_call_parts.setdefault(tool_delta.index, {"id": None, "name": "", "arguments": ""})
+                                if tool_delta.id:
+                                    part["id"] = tool_delta.id
+                                if tool_delta.function and tool_delta.function.name:
+                                    part["name"] += tool_delta.function.name
+                                if tool_delta.function and tool_delta.function.arguments:
+                                    part["arguments"] += tool_delta.function.arguments
+
+                    content = "".join(content_parts)
+                    if not tool_call_parts or not tools_allowed:
+                        final_message = content
+                        break
+
+                    tool_calls = [
+                        SimpleNamespace(
+                            id=part["id"],
+                            function=SimpleNamespace(name=part["name"], arguments=part["arguments"])
+                        )
+                        for _, part in sorted(tool_call_parts.items())
+                    ]
+
+                iterations += 1
+                messages.append({
+                    "role": "assistant",
+                    "content": content or None,
+                    "tool_calls": [
+                        {
+                            "id": tool_call.id,
+                            "type": "function",
+                            "function": {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments
+                            }
+                        }
+                        for tool_call in tool_calls
+                    ]
+                })
+
+                for tool_call in tool_calls:
+                    yield {
+                        "type": "status",
+                        "message": f"{self._tool_source(tool_call.function.name)}: {tool_call.function.name}..."
+                    }
+
+                async def run_indexed(index, tool_call):
+                    return index, await self._run_tool_call(tool_call, semaphore)
+
+                # Report each tool as it finishes rather than when the slowest one does
+                contents = [None] * len(tool_calls)
+                results = [None] * len(tool_calls)
+                with stage("tool_execution"):
+                    for finished in asyncio.as_completed([run_indexed(i, tc) for i, tc in enumerate(tool_calls)]):
+                        index, function_result = await finished
+                        results[index] = function_result
+                        contents[index], shape_stats = self._shape_tool_result(tool_calls[index], function_result)
+                        yield {
+                            "type": "tool_result",
+                            "tool": tool_calls[index].function.name,
+                            "summary": self._summarize_result(function_result),
+                            "tokens_saved": shape_stats["original_tokens"] - shape_stats["shaped_tokens"]
+                        }
+
+                for tool_call, content in zip(tool_calls, contents):
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": content
+                    })
+
+                answer_key = self._answer_key(user_message, conversation_history, tool_calls, results, contents, iterations)
+                cached_answer = self.answer_cache.get(answer_key)
+                if cached_answer is not None:
+                    final_message = cached_answer
+                    yield {"type": "token", "content": cached_answer}
+                    break
+
+            if answer_key is not None and cached_answer is None:
+                self.answer_cache.set(answer_key, final_message)
+
+            with stage("serialization"):
+                updated_history = self._update_history(conversation_history, user_message, final_message)
+            yield {
+                "type": "done",
+                "response": final_message,
+                "conversation_history": updated_history
+            }
+
+        except Exception as e:
+            logger.exception("Error in stream_message")
+
+            error_message = f"I encountered an error: {str(e)}. Please try again or rephrase your question."
+            yield {"type": "error", "message": error_message}
+            yield {
+                "type": "done",
+                "response": error_message,
+                "conversation_history": self._update_history(conversation_history, user_message, error_message)
+            }
+    
+    def _build_messages(self, user_message: str, conversation_history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """System prompt, budget-compacted history and the new user message"""
+        messages = [{"role": "system", "content": self.system_message}]
+        messages.extend(self.history_manager.compact(conversation_history))
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def _route(self, user_message: str) -> Optional[List[SimpleNamespace]]:
+        """Tool call for a message the fast-path router is confident about, shaped like the model's"""
+        routed = self.intent_router.route(user_message)
+        if routed is None:
+            return None
+        intent, function_name, arguments = routed
+        FAST_PATH_ROUTED.inc(intent=intent)
+        logger.info("Fast path: %s -> %s(%s)", intent, function_name, arguments)
+        return [SimpleNamespace(
+            id=f"call_fastpath_{uuid.uuid4().hex[:24]}",
+            function=SimpleNamespace(name=function_name, arguments=json.dumps(arguments))
+        )]
+    
+    def _answer_key(self, user_message: str, conversation_history: List[Dict[str, str]],
+                    tool_calls, results, contents, iterations: int) -> Optional[str]:
+        """Answer cache key for the turn, or None when its answer must not be shared"""
+        # A follow-up's answer depends on the earlier turns, which the key cannot capture
+        if conversation_history or not self._reusable(tool_calls, iterations):
+            return None
+        return self.answer_cache.key(
+            tool_calls, results, contents,
+            question=user_message,
+            data_version=self.resource_manager.inventory.version
+        )
+    
+    def _reusable(self, tool_calls, iterations: int) -> bool:
+        """Whether a turn's answer may come from (or go to) the answer cache: one round of cacheable tools"""
+        if iterations != 1:
+            return False
+        for tool_call in tool_calls:
+            entry = self.tool_registry.get(tool_call.function.name)
+            if entry is None or not entry.cacheable:
+                return False
+        return True
+    
+    def _update_history(self, conversation_history: List[Dict[str, str]], user_message: str, final_message: str) -> List[Dict[str, str]]:
+        """Append the turn to the history, compacting it to the prompt token budget"""
+        return self.history_manager.compact(conversation_history + [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": final_message or ""}
+        ])
+    
+    def _shape_tool_result(self, tool_call, function_result: Any) -> Tuple[str, Dict[str, int]]:
+        """Compact a tool result for the model and log what that saved"""
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            arguments = {}
+        with stage("serialization"):
+            content, stats = self.result_shaper.shape(tool_call.function.name, function_result, arguments)
+        logger.info(
+            "Tool %s result shaped: %d -> %d bytes, %d -> %d tokens",
+            tool_call.function.name,
+            stats["original_bytes"], stats["shaped_bytes"],
+            stats["original_tokens"], stats["shaped_tokens"]
+        )
+        return content, stats
+    
+    def _tool_source(self, function_name: str) -> str:
+        """Human-readable name of the backend a tool queries"""
+        if hasattr(self.cost_manager, function_name):
+            return "Querying Cost Management"
+        if hasattr(self.resource_manager, function_name):
+            return "Querying Resource Graph"
+        return "Running"
+    
+    def _summarize_result(self, result: Any) -> str:
+        """One-line summary of a tool result for progress events"""
+        if not isinstance(result, dict):
+            return "done"
+        if "error" in result:
+            return f"error: {result['error']}"
+        for key in ("data", "top_resources", "services", "resource_groups", "daily_costs", "daily_breakdown", "resources"):
+            if isinstance(result.get(key), list):
+                summary = f"got {len(result[key]):,} rows"
+                if "total_cost" in result:
+                    summary += f" (total ${result['total_cost']:,.2f})"
+                return summary
+        if "total_cost" in result:
+            return f"total ${result['total_cost']:,.2f}"
+        return "done"
+    
+    async def _run_tool_call(self, tool_call, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """
+        Execute one tool call from the model, bounded by the request's semaphore
+        
+        Args:
+            tool_call: Tool call from the chat completion response
+            semaphore: Per-request concurrency cap
+        """
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            return {"error": f"Invalid arguments for {tool_call.function.name}: {str(e)}"}
+        
+        async with semaphore:
+            started = time.perf_counter()
+            with span("tool.execute", tool=tool_call.function.name):
+                result = await self._execute_function(tool_call.function.name, arguments)
+            status = "error" if isinstance(result, dict) and "error" in result else "ok"
+            TOOL_SECONDS.observe(time.perf_counter() - started, tool=tool_call.function.name, status=status)
+            return result
     
     async def _execute_function(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -500,116 +532,30 @@ Always deliver insights that drive measurable business outcomes, significant cos
         Returns:
             Function result as dictionary
         """
-        try:
-            # Cost Management functions
-            if function_name == "get_current_month_costs":
-                return self.cost_manager.get_current_month_costs(
-                    scope=arguments.get("scope")
-                )
-            
-            elif function_name == "get_costs_by_service":
-                return self.cost_manager.get_costs_by_service(
-                    scope=arguments.get("scope"),
-                    days=arguments.get("days", 30)
-                )
-            
-            elif function_name == "get_daily_costs":
-                return self.cost_manager.get_daily_costs(
-                    scope=arguments.get("scope"),
-                    days=arguments.get("days", 30)
-                )
-            
-            elif function_name == "get_costs_by_resource_group":
-                return self.cost_manager.get_costs_by_resource_group(
-                    scope=arguments.get("scope"),
-                    days=arguments.get("days", 30)
-                )
-            
-            elif function_name == "get_resource_costs":
-                return self.cost_manager.get_resource_costs(
-                    scope=arguments.get("scope"),
-                    days=arguments.get("days", 30),
-                    top=arguments.get("top", 10)
-                )
-            
-            # Resource Management functions
-            elif function_name == "get_storage_accounts_with_private_endpoints":
-                return self.resource_manager.get_storage_accounts_with_private_endpoints()
-            
-            elif function_name == "get_all_vnets":
-                return self.resource_manager.get_all_vnets()
-            
-            elif function_name == "get_vms_without_backup":
-                return self.resource_manager.get_vms_without_backup()
-            
-            elif function_name == "get_resources_by_type":
-                return self.resource_manager.get_resources_by_type(
-                    resource_type=arguments.get("resource_type")
-                )
-            
-            elif function_name == "get_resource_count_by_type":
-                return self.resource_manager.get_resource_count_by_type()
-            
-            elif function_name == "search_resources":
-                return self.resource_manager.search_resources(
-                    search_term=arguments.get("search_term")
-                )
-            
-            elif function_name == "get_app_services":
-                return self.resource_manager.get_app_services()
-            
-            elif function_name == "get_sql_databases":
-                return self.resource_manager.get_sql_databases()
-            
-            elif function_name == "get_key_vaults":
-                return self.resource_manager.get_key_vaults()
-            
-            elif function_name == "get_resources_by_tag":
-                return self.resource_manager.get_resources_by_tag(
-                    tag_name=arguments.get("tag_name"),
-                    tag_value=arguments.get("tag_value")
-                )
-            
-            elif function_name == "get_resources_by_tag_with_costs":
-                return await self._get_resources_by_tag_with_costs(
-                    tag_name=arguments.get("tag_name"),
-                    tag_value=arguments.get("tag_value"),
-                    days=arguments.get("days", 30)
-                )
-            
-            elif function_name == "get_all_vms":
-                return self.resource_manager.get_all_vms()
-            
-            elif function_name == "get_storage_accounts":
-                return self.resource_manager.get_storage_accounts()
-            
-            elif function_name == "get_paas_without_private_endpoints":
-                return self.resource_manager.get_paas_without_private_endpoints()
-            
-            elif function_name == "get_resources_with_public_access":
-                return self.resource_manager.get_resources_with_public_access()
-            
-            elif function_name == "get_all_databases":
-                return self.resource_manager.get_all_databases()
-            
-            elif function_name == "get_resources_without_tags":
-                return self.resource_manager.get_resources_without_tags()
-            
-            elif function_name == "get_unused_resources":
-                return self.resource_manager.get_unused_resources()
-            
-            elif function_name == "get_tag_compliance_summary":
-                return self.resource_manager.get_tag_compliance_summary()
-            
-            elif function_name == "get_multi_region_distribution":
-                return self.resource_manager.get_multi_region_distribution()
-            
-            else:
-                return {"error": f"Unknown function: {function_name}"}
-                
-        except Exception as e:
-            return {"error": f"Function execution failed: {str(e)}"}
+        return await self.tool_registry.execute(function_name, arguments)
     
+    @tool(
+        name="get_resources_by_tag_with_costs",
+        description="Get resources filtered by tag with their associated costs for a specified period. Use this when user asks for resources with specific tags AND their costs. Returns comprehensive data including resource details, tags, and cost breakdown.",
+        parameters={
+            "tag_name": {
+                "type": "string",
+                "description": "Tag name to filter by (e.g., 'Environment', 'CostCenter')"
+            },
+            "tag_value": {
+                "type": "string",
+                "description": "Tag value to filter by (e.g., 'Sandbox', 'Production')"
+            },
+            "days": {
+                "type": "integer",
+                "description": "Number of days to look back for costs. Default is 30.",
+                "default": 30
+            }
+        },
+        required=["tag_name", "tag_value"],
+        timeout=COST_TOOL_TIMEOUT_SECONDS,
+        sync=False
+    )
     async def _get_resources_by_tag_with_costs(self, tag_name: str, tag_value: str, days: int = 30) -> Dict[str, Any]:
         """
         Get resources by tag and enrich with cost data
@@ -624,92 +570,47 @@ Always deliver insights that drive measurable business outcomes, significant cos
         """
         try:
             # Get resources by tag
-            resources_result = self.resource_manager.get_resources_by_tag(tag_name, tag_value)
+            resources_result = await self.single_flight.run(self.resource_manager.get_resources_by_tag, tag_name, tag_value)
             
             if "error" in resources_result:
                 return resources_result
             
-            # Get cost data for the resources (request more records to ensure coverage)
-            cost_result = self.cost_manager.get_resource_costs(days=days, top=5000)
-            
-            # Debug logging
-            print(f"[DEBUG] Cost result keys: {cost_result.keys()}")
-            print(f"[DEBUG] Total cost in result: {cost_result.get('total_cost', 'N/A')}")
-            if "top_resources" in cost_result:
-                print(f"[DEBUG] Number of cost records: {len(cost_result['top_resources'])}")
-                costs_above_zero = [r for r in cost_result['top_resources'] if r.get('cost', 0) > 0]
-                print(f"[DEBUG] Cost records > $0: {len(costs_above_zero)}")
-                if len(costs_above_zero) > 0:
-                    print(f"[DEBUG] First 3 cost records with cost > $0:")
-                    for i, rec in enumerate(costs_above_zero[:3]):
-                        print(f"[DEBUG]   {i+1}. {rec.get('resource_name', 'N/A')}: ${rec.get('cost', 0):.2f}")
+            resources = resources_result.get("data", [])
             
-            # Create mappings: by resource ID (primary) and by resource name (fallback)
-            cost_map_by_id = {}
-            cost_map_by_name = {}
+            # Fetch costs only for the tagged resources (ResourceId-filtered query)
+            cost_result = await self.single_flight.run(
+                self.cost_manager.get_costs_for_resource_ids,
+                [resource.get("id", "") for resource in resources],
+                days=days
+            )
             
-            if "top_resources" in cost_result:
-                for item in cost_result["top_resources"]:
-                    resource_id = item.get("resource_id", "").lower()
-                    resource_name = item.get("resource_name", "").lower()
-                    cost = float(item.get("cost", 0.0))
-                    
-                    # Map by full resource ID (most accurate)
-                    if resource_id:
-                        cost_map_by_id[resource_id] = cost
-                    
-                    # Also map by resource name (fallback for matching)
-                    if resource_name:
-                        if resource_name in cost_map_by_name:
-                            cost_map_by_name[resource_name] += cost
-                        else:
-                            cost_map_by_name[resource_name] = cost
+            if "error" in cost_result:
+                return cost_result
             
-            print(f"[DEBUG] Cost map by ID size: {len(cost_map_by_id)}")
-            print(f"[DEBUG] Cost map by name size: {len(cost_map_by_name)}")
+            costs = cost_result.get("costs", {})
             
-            # Enrich resources with cost data
+            # Enrich resources with cost data, joined on the normalized resource ID
             enriched_resources = []
             total_cost = 0.0
             resources_with_costs = 0
             
-            print(f"[DEBUG] Starting resource enrichment. Total resources to enrich: {len(resources_result.get('data', []))}")
-            
-            if "data" in resources_result:
-                for idx, resource in enumerate(resources_result["data"]):
-                    resource_name = resource.get("name", "")
-                    resource_id = resource.get("id", "").lower()
-                    
-                    # Try to match by resource ID first (most accurate)
-                    resource_cost = cost_map_by_id.get(resource_id, 0.0)
-                    
-                    # If no match by ID, try by name
-                    if resource_cost == 0.0 and resource_name:
-                        resource_cost = cost_map_by_name.get(resource_name.lower(), 0.0)
-                    
-                    total_cost += resource_cost
-                    if resource_cost > 0:
-                        resources_with_costs += 1
-                    
-                    # Debug first 3 resources
-                    if idx < 3:
-                        print(f"[DEBUG] Resource {idx+1}: {resource_name}")
-                        print(f"[DEBUG]   ID: {resource_id}")
-                        print(f"[DEBUG]   Cost found: ${resource_cost:.2f}")
-                    
-                    enriched_resources.append({
-                        "name": resource_name,
-                        "type": resource.get("type", ""),
-                        "resourceGroup": resource.get("resourceGroup", ""),
-                        "location": resource.get("location", ""),
-                        "tags": resource.get("tags", {}),
-                        "id": resource.get("id", ""),
-                        "cost_last_{}_days".format(days): round(resource_cost, 2),
-                        "currency": "USD"
-                    })
-            
-            print(f"[DEBUG] Enrichment complete. Resources with costs > $0: {resources_with_costs}/{len(enriched_resources)}")
-            print(f"[DEBUG] Total cost: ${total_cost:.2f}")
+            for resource in resources:
+                resource_cost = costs.get(normalize_resource_id(resource.get("id") or ""), 0.0)
+                
+                total_cost += resource_cost
+                if resource_cost > 0:
+                    resources_with_costs += 1
+                
+                enriched_resources.append({
+                    "name": resource.get("name", ""),
+                    "type": resource.get("type", ""),
+                    "resourceGroup": resource.get("resourceGroup", ""),
+                    "location": resource.get("location", ""),
+                    "tags": resource.get("tags", {}),
+                    "id": resource.get("id", ""),
+                    "cost_last_{}_days".format(days): round(resource_cost, 2),
+                    "currency": "USD"
+                })
             
             return {
                 "count": len(enriched_resources),
@@ -0,0 +1,224 @@
+"""
+Tool Result Shaper
+Projects, tabulates and caps tool results before they are sent to the model
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from history_manager import TokenCounter
+
+
+logger = logging.getLogger(__name__)
+
+
+# Columns the model needs per tool and list key; lists not named here keep every column
+TOOL_COLUMNS: Dict[str, Dict[str, List[str]]] = {
+    "get_resource_costs": {
+        "top_resources": ["resource_name", "resource_id", "cost"]
+    },
+    "get_resources_by_tag": {
+        "data": ["name", "type", "resourceGroup", "location", "tags"]
+    },
+    "get_resources_by_tag_with_costs": {
+        "resources": ["name", "type", "resourceGroup", "location", "tags", "cost_last_{days}_days"]
+    },
+    "get_resources_by_type": {
+        "data": ["name", "resourceGroup", "location", "type"]
+    },
+}
+
+# Token budgets for tools whose results need more (or less) room than RESULT_TOKEN_BUDGET;
+# RESULT_TOOL_TOKEN_BUDGETS ("tool=tokens,...") overrides these
+TOOL_TOKEN_BUDGETS: Dict[str, int] = {
+    "get_cost_trends": 4000,
+    "detect_cost_anomalies": 4000,
+    "get_resources_with_public_access": 4000,
+    "get_current_month_costs": 1500,
+}
+
+# Row keys summed into the "+N more" tail when a list is capped; capped cost lists keep their costliest rows
+COST_KEYS = ("cost",)
+
+# Row keys holding dates; capped time series keep their newest rows
+DATE_KEYS = ("date",)
+
+# Lists the tool has already ranked (e.g. anomalies by size) keep their order when capped
+RANKED_KEYS = ("anomalies",)
+
+
+class ResultShaper:
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        """Initialize the shaper from RESULT_* environment settings"""
+        self.counter = counter or TokenCounter(os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"))
+        self.max_rows = int(os.getenv("RESULT_MAX_ROWS", "50"))
+        self.token_budget = int(os.getenv("RESULT_TOKEN_BUDGET", "3000"))
+        self.tool_budgets = dict(TOOL_TOKEN_BUDGETS)
+        for entry in os.getenv("RESULT_TOOL_TOKEN_BUDGETS", "").split(","):
+            name, _, tokens = entry.partition("=")
+            if name.strip() and tokens.strip():
+                self.tool_budgets[name.strip()] = int(tokens)
+
+        self._lock = threading.Lock()
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def shape(self, tool_name: str, result: Any, arguments: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Turn a tool result into compact JSON for the model
+
+        Lists of records become {"columns": [...], "rows": [[...]]} tables projected to
+        the tool's columns; long lists are capped with a "+N more" summary, and the row
+        cap is lowered until the payload fits the tool's token budget. When fewer rows
+        no longer help (the bulk is not in record lists), the largest top-level values
+        are replaced by a truncation note until it fits.
+
+        Args:
+            tool_name: Name of the tool that produced the result
+            result: Tool result (usually a dict)
+            arguments: Tool arguments (used to resolve templated column names)
+
+        Returns:
+            Tuple of (json_content, stats) where stats holds original/shaped bytes and tokens
+        """
+        original = json.dumps(result, default=str)
+        if not isinstance(result, dict) or "error" in result:
+            return original, self._record(original, original)
+
+        columns = self._columns_for(tool_name, arguments or {})
+        budget = self.tool_budgets.get(tool_name, self.token_budget)
+        max_rows = self.max_rows
+        previous = None
+        while True:
+            shaped = {key: self._shape_value(key, value, columns.get(key), max_rows) for key, value in result.items()}
+            content = json.dumps(shaped, default=str, separators=(",", ":"))
+            if self.counter.count(content) <= budget:
+                break
+            if max_rows <= 1 or content == previous:
+                content = self._truncate(shaped, budget)
+                break
+            previous = content
+            max_rows //= 2
+
+        return content, self._record(original, content)
+
+    def stats(self) -> Dict[str, int]:
+        """Cumulative bytes and tokens saved"""
+        with self._lock:
+            return {"bytes_saved": self.bytes_saved, "tokens_saved": self.tokens_saved}
+
+    def _truncate(self, shaped: Dict[str, Any], budget: int) -> str:
+        """Shorten the largest top-level values (keeping a prefix where possible) until the payload fits"""
+        shaped = dict(shaped)
+        sizes = {key: len(json.dumps(value, default=str)) for key, value in shaped.items()}
+        truncated: List[str] = []
+
+        def render() -> str:
+            payload = {**shaped, "truncated": truncated} if truncated else shaped
+            return json.dumps(payload, default=str, separators=(",", ":"))
+
+        content = render()
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            if self.counter.count(content) <= budget:
+                break
+            value = shaped[key]
+            truncated.append(key)
+            keep = len(value) // 2 if isinstance(value, (dict, list, str)) else 0
+            while keep >= 1:
+                shaped[key] = self._prefix(value, keep)
+                content = render()
+                if self.counter.count(content) <= budget:
+                    return content
+                keep //= 2
+            shaped[key] = f"[truncated: {sizes[key]:,} characters]"
+            content = render()
+        return content
+
+    def _prefix(self, value: Any, keep: int) -> Any:
+        """The first `keep` entries (or characters) of a value, noting what was left out"""
+        if isinstance(value, str):
+            return value[:keep] + f"... (+{len(value) - keep:,} characters)"
+        if isinstance(value, dict):
+            items = list(value.items())
+            return {**dict(items[:keep]), "more": f"+{len(items) - keep:,} more entries"}
+        return value[:keep] + [f"+{len(value) - keep:,} more items"]
+
+    def _columns_for(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, List[str]]:
+        days = arguments.get("days", 30)
+        return {
+            key: [column.format(days=days) for column in columns]
+            for key, columns in TOOL_COLUMNS.get(tool_name, {}).items()
+        }
+
+    def _shape_value(self, key: str, value: Any, columns: Optional[List[str]], max_rows: int) -> Any:
+        if not isinstance(value, list) or not value or not all(isinstance(row, dict) for row in value):
+            return value
+
+        # Time series keep their newest days and cost lists their costliest rows, not whichever come first
+        date_key = self._date_key(key, value[0])
+        cost_key = self._cost_key(value[0])
+        if date_key:
+            value = sorted(value, key=lambda row: str(row.get(date_key) or ""))
+            kept, rest = value[-max_rows:], value[:-max_rows]
+        else:
+            if cost_key and key not in RANKED_KEYS:
+                value = sorted(value, key=lambda row: float(row.get(cost_key) or 0.0), reverse=True)
+            kept, rest = value[:max_rows], value[max_rows:]
+
+        if columns is None:
+            columns = []
+            for row in value:
+                for column in row:
+                    if column not in columns:
+                        columns.append(column)
+        else:
+            columns = [column for column in columns if any(column in row for row in kept)]
+
+        table: Dict[str, Any] = {
+            "columns": columns,
+            "rows": [[self._cell(row.get(column)) for column in columns] for row in kept]
+        }
+        if rest:
+            table["more"] = self._tail_summary(key, rest, cost_key, "earlier" if date_key else "more")
+        return table
+
+    def _date_key(self, key: str, row: Dict[str, Any]) -> Optional[str]:
+        if key in RANKED_KEYS:
+            return None
+        return next((k for k in row if k in DATE_KEYS), None)
+
+    def _cost_key(self, row: Dict[str, Any]) -> Optional[str]:
+        return next((k for k in row if k in COST_KEYS or k.startswith("cost_")), None)
+
+    def _cell(self, value: Any) -> Any:
+        """Flatten a cell: dicts to 'k=v; ...', lists to 'a, b', floats to cents"""
+        if isinstance(value, float):
+            return round(value, 2)
+        if isinstance(value, dict):
+            return "; ".join(f"{k}={v}" for k, v in value.items())
+        if isinstance(value, list):
+            return ", ".join(str(item) for item in value)
+        return value
+
+    def _tail_summary(self, key: str, rest: List[Dict[str, Any]], cost_key: Optional[str], position: str) -> str:
+        label = key.replace("top_", "").replace("_", " ")
+        summary = f"+{len(rest):,} {position} {label}"
+        if cost_key:
+            total = sum(float(row.get(cost_key) or 0.0) for row in rest)
+            summary += f" totalling ${total:,.2f}"
+        return summary
+
+    def _record(self, original: str, content: str) -> Dict[str, int]:
+        stats = {
+            "original_bytes": len(original),
+            "shaped_bytes": len(content),
+            "original_tokens": self.counter.count(original),
+            "shaped_tokens": self.counter.count(content)
+        }
+        with self._lock:
+            self.bytes_saved += stats["original_bytes"] - stats["shaped_bytes"]
+            self.tokens_saved += stats["original_tokens"] - stats["shaped_tokens"]
+        return stats
@@ -0,0 +1,123 @@
+"""
+Conversation Session Store
+Server-side conversation state keyed by session ID, in memory or in SQLite
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from ttl_cache import TTLCache
+
+
+class InMemorySessionStore:
+    def __init__(self, ttl_seconds: float, max_sessions: int, max_bytes: int):
+        """
+        Initialize the in-memory store
+
+        Args:
+            ttl_seconds: Idle time after which a session is dropped
+            max_sessions: Maximum number of sessions kept (least recently used evicted)
+            max_bytes: Approximate memory cap across all sessions
+        """
+        self._cache = TTLCache(ttl_seconds=ttl_seconds, max_entries=max_sessions, max_bytes=max_bytes)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session state, or None if unknown or expired"""
+        return self._cache.get(session_id)
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Store the session state, resetting its TTL"""
+        self._cache.set(session_id, state)
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session"""
+        self._cache.invalidate(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counts and memory use"""
+        return self._cache.stats()
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, ttl_seconds: float, max_sessions: int):
+        """
+        Initialize the SQLite-backed store
+
+        Args:
+            path: Database file path
+            ttl_seconds: Idle time after which a session is dropped
+            max_sessions: Maximum number of sessions kept (least recently updated evicted)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+        self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session state, or None if unknown or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or row[1] < time.time() - self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Store the session state and evict expired or excess sessions"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (session_id, json.dumps(state), now)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counts"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"entries": count, "ttl_seconds": self.ttl_seconds, "max_entries": self.max_sessions}
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_STORE ("memory" or "sqlite")"""
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "7200"))
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "5000"))
+
+    if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+        return SQLiteSessionStore(
+            path=os.getenv("SESSION_DB_PATH", "sessions.db"),
+            ttl_seconds=ttl_seconds,
+            max_sessions=max_sessions
+        )
+
+    return InMemorySessionStore(
+        ttl_seconds=ttl_seconds,
+        max_sessions=max_sessions,
+        max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+    )
@@ -0,0 +1,89 @@
+"""
+Request Coalescing (Single-Flight)
+Concurrent identical Azure manager calls share one underlying request and its result
+"""
+
+import json
+import asyncio
+import inspect
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from async_executor import run_blocking
+
+
+def call_key(func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, ...]:
+    """
+    Key identifying a call by owner, method and normalized arguments
+
+    Positional and keyword spellings of the same call, and explicitly passed
+    defaults, produce the same key; string arguments are stripped.
+    """
+    owner = getattr(func, "__self__", None)
+    name = getattr(func, "__qualname__", repr(func))
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+    except (TypeError, ValueError):
+        arguments = {"args": list(args), **kwargs}
+
+    normalized = {
+        key: value.strip() if isinstance(value, str) else value
+        for key, value in arguments.items()
+    }
+    return (id(owner), name, json.dumps(normalized, sort_keys=True, default=str))
+
+
+class SingleFlight:
+    def __init__(self):
+        """Initialize the in-flight call table and counters"""
+        self._in_flight: Dict[Tuple[Any, ...], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call on the shared executor, joining an identical call already in flight
+
+        The first caller for a key starts the request; callers arriving before it
+        completes await the same future and receive the same result (or exception).
+        Nothing is kept once the call finishes; caching is the managers' concern.
+
+        Args:
+            func: Synchronous callable (typically an Azure manager method)
+            *args: Positional arguments for the callable
+            **kwargs: Keyword arguments for the callable
+        """
+        key = call_key(func, *args, **kwargs)
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = asyncio.ensure_future(run_blocking(func, *args, **kwargs))
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key, future))
+
+        # Shield the shared request so one cancelled caller does not cancel it for the rest
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """Call, coalesced-call and in-flight counts"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "coalesced_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+                "in_flight": len(self._in_flight)
+            }
+
+    def _forget(self, key: Tuple[Any, ...], future: asyncio.Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        # Mark the exception as retrieved when every caller went away before completion
+        if not future.cancelled():
+            future.exception()
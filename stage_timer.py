@@ -0,0 +1,42 @@
+"""
+Per-Request Stage Timing
+Wall-clock time spent in each stage of a chat request (model calls, tool execution, serialization)
+"""
+
+import time
+import contextlib
+import contextvars
+from typing import Dict, Iterator, Optional
+
+
+_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextlib.contextmanager
+def collect_stages() -> Iterator[Dict[str, float]]:
+    """
+    Collect stage timings (milliseconds) for the enclosed work
+
+    The yielded dict fills in as stages finish. Tasks started inside the block share
+    it, so a stage entered from concurrent tasks accumulates their total time.
+    """
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage; a no-op unless called inside collect_stages()"""
+    timings: Optional[Dict[str, float]] = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - started) * 1000
@@ -0,0 +1,65 @@
+"""
+Startup Timing Report
+Records how long each startup and warm-up phase took, so slow cold starts can be traced to a phase
+"""
+
+import time
+import logging
+import threading
+import contextlib
+from typing import Any, Dict, Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    def __init__(self):
+        """Start the clock (create this as early as possible during import)"""
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.warmup: Dict[str, Any] = {}
+        self.ready_ms: Optional[float] = None
+        self.warm_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a startup phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def mark_ready(self) -> None:
+        """Record the moment the app is about to accept connections"""
+        self.ready_ms = self._elapsed_ms()
+        logger.info("Startup ready in %.0f ms: %s", self.ready_ms, self.phases)
+
+    def record_warmup(self, name: str, started: float, error: Optional[Exception] = None) -> None:
+        """Record one warm-up step started at the given perf_counter time"""
+        entry: Dict[str, Any] = {"ms": round((time.perf_counter() - started) * 1000, 1)}
+        if error is not None:
+            entry["error"] = str(error)
+        with self._lock:
+            self.warmup[name] = entry
+
+    def mark_warm(self) -> None:
+        """Record the end of background warm-up"""
+        self.warm_ms = self._elapsed_ms()
+        logger.info("Warm-up finished %.0f ms after startup began: %s", self.warm_ms, self.warmup)
+
+    def report(self) -> Dict[str, Any]:
+        """Phase timings, time to ready and time to warm, in milliseconds"""
+        with self._lock:
+            return {
+                "phases_ms": dict(self.phases),
+                "ready_ms": self.ready_ms,
+                "warmup": dict(self.warmup),
+                "warm_ms": self.warm_ms
+            }
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
@@ -0,0 +1,261 @@
+"""
+Tracing and Metrics
+Spans around chat stages, tool calls and Azure SDK calls, and Prometheus metrics served from /metrics
+"""
+
+import math
+import time
+import logging
+import threading
+import contextlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import stage_timer
+
+# Spans are exported through OpenTelemetry when the API package is installed (and an SDK is
+# configured by the deployment); without it they only feed the histograms below
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers fast cache hits up to slow model completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prometheus text exposition format (the web framework appends the utf-8 charset)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+# A collector returns (name, kind, documentation, [(labels, value), ...]) tuples, read at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, Any], float]]]]]
+
+
+class Registry:
+    def __init__(self):
+        """Metrics owned by this process plus collectors for statistics kept elsewhere"""
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def register_collector(self, collector: Collector) -> None:
+        """Add a callable reporting values (e.g. cache counters) computed when /metrics is scraped"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a chat request", ("stage",)
+)
+TOOL_SECONDS = registry.histogram(
+    "chat_tool_duration_seconds", "Tool (function call) latency by tool name", ("tool", "status")
+)
+AZURE_CALL_SECONDS = registry.histogram(
+    "azure_api_call_duration_seconds", "Azure SDK call latency, per attempt", ("api", "status")
+)
+FAST_PATH_ROUTED = registry.counter(
+    "chat_fast_path_total", "Questions routed to a tool without the tool-selection completion", ("intent",)
+)
+OPENAI_TOKENS = registry.counter(
+    "openai_tokens_total", "Azure OpenAI tokens used, by prompt or completion", ("type",)
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled"
+)
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ("method", "endpoint", "status")
+)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Trace the enclosed work as a span named `name`
+
+    Exported through OpenTelemetry when it is installed; always logged at DEBUG level
+    with its duration.
+
+    Args:
+        name: Span name (e.g. "chat.tool_execution", "azure.cost_management")
+        **attributes: Span attributes
+    """
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if otel_trace is not None:
+            stack.enter_context(otel_trace.get_tracer(__name__).start_as_current_span(name, attributes=attributes))
+        try:
+            yield
+        finally:
+            logger.debug("span %s %s took %.1fms", name, attributes, (time.perf_counter() - started) * 1000)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Trace one stage of a chat request: span, stage histogram and per-request stage timing"""
+    started = time.perf_counter()
+    try:
+        with span(f"chat.{name}"), stage_timer.stage(name):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def record_usage(usage: Optional[Any]) -> None:
+    """Count the prompt and completion tokens of a chat completion"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, type="prompt")
+    OPENAI_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, type="completion")
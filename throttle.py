@@ -0,0 +1,271 @@
+"""
+Adaptive Throttling Scheduler
+Per-scope token buckets fed by Azure quota headers; throttled calls are queued and retried instead of failed
+"""
+
+import os
+import re
+import time
+import random
+import logging
+import threading
+import contextlib
+import contextvars
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+from azure.core.exceptions import HttpResponseError
+
+from telemetry import AZURE_CALL_SECONDS, span
+
+
+logger = logging.getLogger(__name__)
+
+
+COST_MANAGEMENT = "cost_management"
+RESOURCE_GRAPH = "resource_graph"
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Statuses worth waiting out rather than surfacing
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Resource Graph reports its per-user quota in these headers (resets-after is hh:mm:ss)
+QUOTA_REMAINING_HEADER = "x-ms-user-quota-remaining"
+QUOTA_RESETS_HEADER = "x-ms-user-quota-resets-after"
+
+# Cost Management reports remaining quota per limit (qpu, entity, tenant, ...), each value
+# either a number or "Name=number" pairs (e.g. "QueryResource=96")
+COST_QUOTA_REMAINING_HEADER = re.compile(r"x-ms-ratelimit-microsoft\.costmanagement-[\w.-]+-remaining")
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("azure_call_priority", default=INTERACTIVE)
+
+
+class ThrottledError(Exception):
+    """Raised when a call could not be scheduled or retried within the allowed wait"""
+
+
+@contextlib.contextmanager
+def background_priority() -> Iterator[None]:
+    """Run the enclosed Azure calls at background priority (they yield to interactive calls)"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a header duration: seconds ('12', '1.5') or hh:mm:ss"""
+    if not value:
+        return None
+    value = value.strip()
+    match = re.fullmatch(r"(\d+):(\d{2}):(\d{2}(?:\.\d+)?)", value)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Longest wait requested by Retry-After or any x-ms-ratelimit-*-retry-after header"""
+    waits = [_seconds(value) for name, value in headers.items() if name.lower().endswith("retry-after")]
+    waits = [wait for wait in waits if wait is not None]
+    return max(waits) if waits else None
+
+
+def quota_remaining(headers: Mapping[str, str]) -> Optional[float]:
+    """Smallest remaining quota reported by the Resource Graph or Cost Management quota headers"""
+    remaining = []
+    for name, value in headers.items():
+        name = name.lower()
+        if name == QUOTA_REMAINING_HEADER:
+            remaining.append(_seconds(value))
+        elif COST_QUOTA_REMAINING_HEADER.fullmatch(name):
+            remaining.extend(float(number) for number in re.findall(r"(?:^|[=:])\s*(\d+(?:\.\d+)?)", value or ""))
+    remaining = [value for value in remaining if value is not None]
+    return min(remaining) if remaining else None
+
+
+class _Bucket:
+    def __init__(self, rate: float, capacity: float, background_reserve: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.background_reserve = background_reserve
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.interactive_waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, priority: str, deadline: float) -> float:
+        """Take one token, waiting as needed; returns the time waited"""
+        started = time.monotonic()
+        interactive = priority == INTERACTIVE
+        # Background calls leave a reserve of tokens for interactive ones
+        needed = 1.0 if interactive else min(self.capacity, 1.0 + self.background_reserve)
+        with self.cond:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif not interactive and self.interactive_waiting:
+                        wait = 0.05
+                    elif self.tokens >= needed:
+                        self.tokens -= 1.0
+                        return now - started
+                    else:
+                        wait = (needed - self.tokens) / self.rate
+
+                    if now + wait > deadline:
+                        raise ThrottledError(f"Azure API is throttling requests; retry in {wait:.0f} seconds")
+                    self.cond.wait(wait)
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+                    self.cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for a while (server asked us to back off)"""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def observe(self, remaining: Optional[float], resets_after: Optional[float]) -> None:
+        """Align the bucket with the quota the server reports"""
+        with self.cond:
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and resets_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + resets_after)
+
+
+class ThrottleScheduler:
+    def __init__(self):
+        """Initialize per-API limits from THROTTLE_* environment settings"""
+        self.limits: Dict[str, Tuple[float, float]] = {
+            COST_MANAGEMENT: (
+                # Cost Management allows roughly 30 queries a minute per scope
+                float(os.getenv("THROTTLE_COST_RATE", "0.5")),
+                float(os.getenv("THROTTLE_COST_BURST", "10"))
+            ),
+            RESOURCE_GRAPH: (
+                float(os.getenv("THROTTLE_GRAPH_RATE", "3.0")),
+                float(os.getenv("THROTTLE_GRAPH_BURST", "15"))
+            ),
+        }
+        self.background_share = float(os.getenv("THROTTLE_BACKGROUND_RESERVE", "0.5"))
+        self.max_retries = int(os.getenv("THROTTLE_MAX_RETRIES", "5"))
+        self.max_wait = float(os.getenv("THROTTLE_MAX_WAIT_SECONDS", "60"))
+        self.backoff_base = float(os.getenv("THROTTLE_BACKOFF_BASE_SECONDS", "1.0"))
+        self.backoff_max = float(os.getenv("THROTTLE_BACKOFF_MAX_SECONDS", "30"))
+
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {}
+
+    def call(self, api: str, scope: str, func: Callable[..., Any], /, *args, **kwargs) -> Any:
+        """
+        Run an Azure SDK call under the scope's rate limit
+
+        The call waits for a token from the (api, scope) bucket, at the caller's
+        priority (see background_priority). Quota headers from the response adjust
+        the bucket; 429 and 5xx responses pause the bucket for the server's
+        Retry-After (or a jittered exponential backoff) and the call is retried.
+
+        Args:
+            api: COST_MANAGEMENT or RESOURCE_GRAPH
+            scope: Rate-limit scope (e.g. the Cost Management scope)
+            func: SDK operation accepting a raw_response_hook keyword
+            *args: Positional arguments for the operation
+            **kwargs: Keyword arguments for the operation
+
+        Raises:
+            ThrottledError: The call could not be completed within THROTTLE_MAX_WAIT_SECONDS
+        """
+        bucket = self._bucket(api, scope)
+        priority = _priority.get()
+        deadline = time.monotonic() + self.max_wait
+        self._count(api, "calls")
+
+        for attempt in range(self.max_retries + 1):
+            self._count(api, "waited_seconds", bucket.acquire(priority, deadline))
+
+            headers: Dict[str, str] = {}
+            kwargs["raw_response_hook"] = lambda response: headers.update(response.http_response.headers)
+            started = time.perf_counter()
+            try:
+                with span(f"azure.{api}", scope=scope, attempt=attempt):
+                    result = func(*args, **kwargs)
+            except HttpResponseError as e:
+                AZURE_CALL_SECONDS.observe(time.perf_counter() - started, api=api, status=e.status_code)
+                if e.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise
+                if e.status_code == 429:
+                    self._count(api, "throttled")
+                self._count(api, "retries")
+                wait = retry_after(e.response.headers if e.response is not None else {})
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                wait = max(wait or 0.0, random.uniform(backoff / 2, backoff))
+                if time.monotonic() + wait > deadline:
+                    raise ThrottledError(f"Azure API is throttling requests; retry in {wait:.0f} seconds") from e
+                logger.info("%s returned %s for %s; retrying in %.1fs", api, e.status_code, scope, wait)
+                bucket.pause(wait)
+                continue
+            except Exception:
+                AZURE_CALL_SECONDS.observe(time.perf_counter() - started, api=api, status="error")
+                raise
+            AZURE_CALL_SECONDS.observe(time.perf_counter() - started, api=api, status="ok")
+
+            bucket.observe(quota_remaining(headers), _seconds(headers.get(QUOTA_RESETS_HEADER)))
+            wait = retry_after(headers)
+            if wait:
+                bucket.pause(wait)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls, throttled responses, retries and queueing time per API"""
+        with self._lock:
+            return {
+                api: {name: round(value, 3) for name, value in counters.items()}
+                for api, counters in self._counters.items()
+            }
+
+    def _bucket(self, api: str, scope: str) -> _Bucket:
+        key = (api, (scope or "").rstrip("/").lower())
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = self.limits.get(api, (1.0, 1.0))
+                bucket = _Bucket(rate, burst, burst * self.background_share)
+                self._buckets[key] = bucket
+            return bucket
+
+    def _count(self, api: str, name: str, amount: float = 1) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(
+                api, {"calls": 0, "throttled": 0, "retries": 0, "waited_seconds": 0.0}
+            )
+            counters[name] += amount
+
+
+_scheduler: Optional[ThrottleScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> ThrottleScheduler:
+    """Return the process-wide scheduler shared by the Azure managers"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ThrottleScheduler()
+        return _scheduler
@@ -0,0 +1,223 @@
+"""
+Tool Registry
+Declares agent tools on the methods that implement them, builds their schemas once and dispatches calls by name
+"""
+
+import os
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from async_executor import run_blocking
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "120"))
+
+
+class ToolSpec:
+    def __init__(self, name: Optional[str], description: str, parameters: Optional[Dict[str, Dict[str, Any]]],
+                 required: Sequence[str], cacheable: bool, timeout: Optional[float], sync: bool):
+        self.name = name
+        self.description = description
+        self.parameters = parameters or {}
+        self.required = list(required)
+        self.cacheable = cacheable
+        self.timeout = timeout
+        self.sync = sync
+
+
+def tool(description: str, parameters: Optional[Dict[str, Dict[str, Any]]] = None, required: Sequence[str] = (),
+         name: Optional[str] = None, cacheable: bool = True, timeout: Optional[float] = None, sync: bool = True):
+    """
+    Mark a method as a tool the model can call
+
+    Args:
+        description: What the tool returns and when the model should use it
+        parameters: JSON schema of each argument, by argument name
+        required: Arguments the model must provide
+        name: Tool name (defaults to the method name)
+        cacheable: Read-only and deterministic for its arguments: identical concurrent calls
+            share one execution and answers built on it may be reused
+        timeout: Seconds before the call is abandoned (defaults to TOOL_TIMEOUT_SECONDS)
+        sync: Blocking method run on the executor (True) or coroutine awaited directly (False)
+    """
+    def decorate(func: Callable[..., Any]) -> Callable[..., Any]:
+        func.__tool__ = ToolSpec(name, description, parameters, required, cacheable, timeout, sync)
+        return func
+    return decorate
+
+
+class Tool:
+    def __init__(self, spec: ToolSpec, handler: Callable[..., Any]):
+        """
+        A registered tool: its declaration bound to the object implementing it
+
+        Args:
+            spec: Declaration from @tool
+            handler: Bound method implementing the tool
+        """
+        self.name = spec.name or handler.__name__
+        self.description = spec.description
+        self.parameters = spec.parameters
+        self.required = spec.required
+        self.cacheable = spec.cacheable
+        self.timeout = spec.timeout if spec.timeout is not None else DEFAULT_TIMEOUT_SECONDS
+        self.sync = spec.sync
+        self.handler = handler
+
+    def schema(self) -> Dict[str, Any]:
+        """Function schema in the Chat Completions format"""
+        parameters: Dict[str, Any] = {"type": "object", "properties": self.parameters}
+        if self.required:
+            parameters["required"] = self.required
+        return {"name": self.name, "description": self.description, "parameters": parameters}
+
+    def bind_arguments(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keyword arguments for the handler from the model's arguments
+
+        Unknown and null arguments are dropped (the method's defaults apply) and
+        integer arguments sent as strings are converted.
+
+        Raises:
+            ValueError: A required argument is missing or has the wrong type
+        """
+        kwargs = {}
+        for key, value in (arguments or {}).items():
+            schema = self.parameters.get(key)
+            if schema is None or value is None:
+                continue
+            if schema.get("type") == "integer" and not isinstance(value, int):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Argument {key} of {self.name} must be an integer, got {value!r}")
+            kwargs[key] = value
+
+        missing = [key for key in self.required if key not in kwargs]
+        if missing:
+            raise ValueError(f"Missing required argument(s) for {self.name}: {', '.join(missing)}")
+        return kwargs
+
+    def problems(self) -> List[str]:
+        """Mismatches between the declaration and the method"""
+        problems = []
+        if not callable(self.handler):
+            return [f"{self.name}: handler is not callable"]
+        if self.sync == inspect.iscoroutinefunction(self.handler):
+            kind = "sync" if self.sync else "async"
+            problems.append(f"{self.name}: declared {kind} but {self.handler.__qualname__} is not")
+
+        signature = inspect.signature(self.handler)
+        accepts_any = any(p.kind == p.VAR_KEYWORD for p in signature.parameters.values())
+        for key in self.parameters:
+            if key not in signature.parameters and not accepts_any:
+                problems.append(f"{self.name}: argument {key} is not a parameter of {self.handler.__qualname__}")
+        for key in self.required:
+            if key not in self.parameters:
+                problems.append(f"{self.name}: required argument {key} has no schema")
+        for key, parameter in signature.parameters.items():
+            if parameter.default is parameter.empty and parameter.kind in (parameter.POSITIONAL_OR_KEYWORD,
+                                                                           parameter.KEYWORD_ONLY):
+                if key not in self.required:
+                    problems.append(f"{self.name}: parameter {key} has no default but is not required")
+        if self.timeout is not None and self.timeout <= 0:
+            problems.append(f"{self.name}: timeout must be positive")
+        return problems
+
+
+class ToolRegistry:
+    def __init__(self, single_flight=None):
+        """
+        Initialize an empty registry
+
+        Args:
+            single_flight: SingleFlight used to coalesce identical cacheable sync calls
+        """
+        self.single_flight = single_flight
+        self._tools: Dict[str, Tool] = {}
+        self._schemas: Optional[List[Dict[str, Any]]] = None
+
+    def register(self, owner: Any) -> None:
+        """Register every @tool method of an object, in definition order"""
+        seen = set()
+        for cls in reversed(type(owner).__mro__):
+            for attribute, value in vars(cls).items():
+                spec = getattr(value, "__tool__", None)
+                if spec is None or attribute in seen:
+                    continue
+                seen.add(attribute)
+                entry = Tool(spec, getattr(owner, attribute))
+                if entry.name in self._tools:
+                    raise ValueError(f"Tool {entry.name} is registered twice")
+                self._tools[entry.name] = entry
+        self._schemas = None
+
+    def get(self, name: str) -> Optional[Tool]:
+        """The tool registered under a name"""
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        """Registered tool names, in registration order"""
+        return list(self._tools)
+
+    def functions(self) -> List[Dict[str, Any]]:
+        """Function schemas for every registered tool (built once)"""
+        if self._schemas is None:
+            self._schemas = [entry.schema() for entry in self._tools.values()]
+        return self._schemas
+
+    def check(self, referenced: Iterable[str] = ()) -> None:
+        """
+        Verify every tool resolves to a method matching its declaration
+
+        Args:
+            referenced: Tool names used elsewhere (e.g. by the fast-path router) that must exist
+
+        Raises:
+            ValueError: Listing every problem found
+        """
+        problems = [problem for entry in self._tools.values() for problem in entry.problems()]
+        problems.extend(f"{name}: referenced but not registered" for name in referenced if name not in self._tools)
+        if problems:
+            raise ValueError("Tool registry check failed:\n  " + "\n  ".join(problems))
+        logger.info("Tool registry: %d tools resolved", len(self._tools))
+
+    async def execute(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a tool by name
+
+        Sync tools run on the shared executor (cacheable ones through single-flight),
+        async tools are awaited; each call is bounded by the tool's timeout.
+
+        Args:
+            name: Tool name
+            arguments: Arguments from the model
+
+        Returns:
+            The tool's result, or {"error": ...}
+        """
+        entry = self._tools.get(name)
+        if entry is None:
+            return {"error": f"Unknown function: {name}"}
+        try:
+            kwargs = entry.bind_arguments(arguments)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        if not entry.sync:
+            call = entry.handler(**kwargs)
+        elif entry.cacheable and self.single_flight is not None:
+            call = self.single_flight.run(entry.handler, **kwargs)
+        else:
+            call = run_blocking(entry.handler, **kwargs)
+
+        try:
+            return await asyncio.wait_for(call, entry.timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"{name} did not finish within {entry.timeout:.0f} seconds"}
+        except Exception as e:
+            return {"error": f"Function execution failed: {str(e)}"}